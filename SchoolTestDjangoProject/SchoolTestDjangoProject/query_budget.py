@@ -0,0 +1,214 @@
+"""
+Учёт SQL-запросов на каждый запрос к API.
+
+QueryBudgetMiddleware считает количество запросов, суммарное время в БД и повторяющиеся
+запросы (одинаковые с точностью до параметров — признак N+1) и пишет предупреждение в лог
+``query_budget``, если представление вышло за бюджет из settings.QUERY_BUDGETS.
+QueryBudgetTestMixin позволяет проверить те же бюджеты в тестах.
+
+Активные счётчики хранятся в contextvar (вложенный счётчик не отключает внешний: запрос попадает в оба),
+а обёртка запросов ставится на каждое соединение при его открытии: запросы асинхронного ORM выполняются
+в потоках sync_to_async со своими соединениями, но контекст запроса туда копируется, поэтому
+async-представления учитываются так же, как синхронные. У потоковых ответов запросы выполняются уже после
+возврата из представления, пока сервер читает содержимое, поэтому бюджет проверяется, когда оно прочитано.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import URLPattern, URLResolver, reverse
+
+logger = logging.getLogger('query_budget')
+
+_literal_re = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_list_re = re.compile(r'\bIN \((?:\s*(?:%s|\?|\$\d+)\s*,?)+\)', re.IGNORECASE)
+_whitespace_re = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    sql = _literal_re.sub('?', sql)
+    sql = _in_list_re.sub('IN (...)', sql)
+    return _whitespace_re.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def add(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.fingerprints[fingerprint(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+    def report(self):
+        lines = [f'{self.count} запросов, {self.duration * 1000:.1f} мс в БД']
+        for sql, count in sorted(self.duplicates.items(), key=lambda item: -item[1]):
+            lines.append(f'  x{count}: {sql[:300]}')
+        return '\n'.join(lines)
+
+
+_active_recorders = ContextVar('query_recorders', default=())
+
+
+def _record(execute, sql, params, many, context):
+    recorders = _active_recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for recorder in recorders:
+            recorder.add(sql, duration)
+
+
+def install_recorder(connection, **kwargs):
+    if _record not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record)
+
+
+connection_created.connect(install_recorder)
+
+
+@contextmanager
+def record_queries(recorder=None):
+    """Считает запросы внутри блока; переданный recorder продолжает уже начатый подсчёт."""
+    for alias in connections:
+        install_recorder(connections[alias])
+    recorder = recorder or QueryRecorder()
+    token = _active_recorders.set((*_active_recorders.get(), recorder))
+    try:
+        yield recorder
+    finally:
+        _active_recorders.reset(token)
+
+
+def get_budget(url_name):
+    return settings.QUERY_BUDGETS.get(url_name, settings.QUERY_BUDGET_DEFAULT)
+
+
+class QueryBudgetMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with record_queries() as recorder:
+            response = self.get_response(request)
+        return self.finish(request, response, recorder)
+
+    async def __acall__(self, request):
+        with record_queries() as recorder:
+            response = await self.get_response(request)
+        return self.finish(request, response, recorder)
+
+    def finish(self, request, response, recorder):
+        if not response.streaming or request.resolver_match is None:
+            return self.check_budget(request, response, recorder)
+        content = response.streaming_content
+        done = partial(self.check_budget, request, response, recorder)
+        if response.is_async:
+            response.streaming_content = self._arecorded(content, recorder, done)
+        else:
+            response.streaming_content = self._recorded(content, recorder, done)
+        return response
+
+    @staticmethod
+    def _recorded(content, recorder, done):
+        chunks = iter(content)
+        try:
+            while True:
+                with record_queries(recorder):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            done()
+
+    @staticmethod
+    async def _arecorded(content, recorder, done):
+        chunks = aiter(content)
+        try:
+            while True:
+                with record_queries(recorder):
+                    chunk = await anext(chunks, None)
+                if chunk is None:
+                    break
+                yield chunk
+        finally:
+            done()
+
+    def check_budget(self, request, response, recorder):
+        match = request.resolver_match
+        if match is None:
+            return response
+
+        budget = get_budget(match.view_name)
+        duplicates = recorder.duplicates
+        if recorder.count > budget or max(duplicates.values(), default=0) > settings.QUERY_BUDGET_DUPLICATES:
+            logger.warning(
+                'Превышен бюджет запросов %s %s (%s, бюджет %s): %s',
+                request.method, request.path, match.view_name, budget, recorder.report()
+            )
+        if settings.DEBUG and not response.streaming:
+            response['X-Query-Count'] = recorder.count
+            response['X-Query-Time-Ms'] = f'{recorder.duration * 1000:.1f}'
+            response['X-Query-Duplicates'] = sum(count - 1 for count in duplicates.values())
+        return response
+
+
+def iter_url_names(urlpatterns):
+    for pattern in urlpatterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_url_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield pattern.name
+
+
+def missing_budgets(urlpatterns):
+    return sorted(name for name in set(iter_url_names(urlpatterns)) if name not in settings.QUERY_BUDGETS)
+
+
+class QueryBudgetTestMixin:
+    """
+    Примесь к django.test.TestCase:
+
+        self.assertWithinQueryBudget('tests_id', kwargs={'pk': test.id})
+        self.assertEqual(missing_budgets(school_test.urls.urlpatterns), [])
+    """
+
+    def assertWithinQueryBudget(self, url_name, method='get', args=None, kwargs=None, data=None, client=None,
+                                **extra):
+        client = client or self.client
+        url = reverse(url_name, args=args, kwargs=kwargs)
+        with record_queries() as recorder:
+            response = getattr(client, method)(url, data, **extra)
+            if response.streaming:
+                response.streaming_content = [b''.join(response.streaming_content)]
+        budget = get_budget(url_name)
+        self.assertLessEqual(
+            recorder.count, budget, f'{method.upper()} {url} превысил бюджет {budget}:\n{recorder.report()}'
+        )
+        return response
@@ -36,6 +36,7 @@ SESSION_COOKIE_SECURE = True
 INSTALLED_APPS = [
     'register',
     'drf_yasg',
+    'django_filters',
     'rest_framework',
     'rest_framework.authtoken',
     'rest_framework_simplejwt',
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'SchoolTestDjangoProject.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,7 +63,7 @@ MIDDLEWARE = [
 ROOT_URLCONF = 'SchoolTestDjangoProject.urls'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'register.authentication.ProfileClaimsAuthentication',
     ],
 }
 TEMPLATES = [
@@ -120,6 +122,9 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -145,3 +150,105 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': datetime.timedelta(days=180),
     'AUTH_HEADER_TYPES': ('Bearer',),
 }
+# Версия токенов пользователя кэшируется, чтобы проверка отзыва не ходила в БД на каждый запрос.
+TOKEN_VERSION_CACHE_TIMEOUT = 60 * 10
+
+# Для нескольких процессов/серверов подключите общий бэкенд (Redis, Memcached):
+# локальный LRU ключей ответов использует его как второй уровень.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Формат хранения ответов: 'packed' — одна строка AnswerSheet на попытку, 'rows' — строки Answer
+# и Result.mistakes. Чтение понимает оба формата; перенос старых строк — `python manage.py pack_answers`.
+ANSWER_STORAGE = 'packed'
+
+ANSWER_KEY_CACHE_SIZE = 256
+ANSWER_KEY_CACHE_TIMEOUT = 60 * 60 * 24
+TEST_PAYLOAD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Очередь отправок тестов: при SUBMISSIONS_ASYNC = True ответы сохраняются в БД,
+# а проверяет их `python manage.py run_submission_workers`.
+SUBMISSIONS_ASYNC = False
+SUBMISSION_WORKERS = 4
+SUBMISSION_BATCH_SIZE = 50
+SUBMISSION_POLL_INTERVAL = 1.0
+SUBMISSION_LOCK_TIMEOUT = 300
+SUBMISSION_MAX_ATTEMPTS = 3
+
+# Рассылка рекомендаций: запрос только сохраняет рекомендацию, получателей и SMS
+# обрабатывает `python manage.py run_recommendation_workers`.
+RECOMMENDATION_WORKERS = 1
+RECOMMENDATION_BATCH_SIZE = 500
+RECOMMENDATION_POLL_INTERVAL = 2.0
+RECOMMENDATION_LOCK_TIMEOUT = 600
+
+# Класс отправителя SMS (см. school_test/sms.py) и его параметры.
+SMS_SENDER = 'school_test.sms.ConsoleSmsSender'
+SMS_SENDER_OPTIONS = {}
+
+SCHOOL_ANALYTICS_CACHE_TIMEOUT = 60
+SCHOOL_ANALYTICS_TREND_WEEKS = 12
+ITEM_ANALYSIS_CACHE_TIMEOUT = 60 * 10
+EVENT_FEED_CACHE_TIMEOUT = 60 * 60
+
+# Размер пачки строк при потоковой выгрузке результатов (school_test/export.py).
+EXPORT_CHUNK_SIZE = 2000
+
+# Месяц начала учебного года: границы годовых секций таблиц ответов (`python manage.py partition_answers`).
+SCHOOL_YEAR_START_MONTH = 9
+
+# Холодный архив ответов прошлых учебных лет (`python manage.py archive_answers`, school_test/archive.py)
+# и число файлов архива, которые держатся в памяти процесса.
+ANSWER_ARCHIVE_ROOT = BASE_DIR / 'archive'
+ANSWER_ARCHIVE_CACHE_SIZE = 16
+
+# Уменьшенные копии изображений вопросов (school_test/images.py): ширины в пикселях, форматы, качество сжатия
+# и число процессов Pillow. При QUESTION_IMAGE_ASYNC = False копии строятся сразу после сохранения вопроса.
+QUESTION_IMAGE_WIDTHS = [320, 640, 1280]
+QUESTION_IMAGE_FORMATS = ['webp', 'jpeg']
+QUESTION_IMAGE_QUALITY = 80
+QUESTION_IMAGE_WORKERS = 2
+QUESTION_IMAGE_ASYNC = True
+
+# Порог (в процентах), с которого результат считается сданным в сводках по школам.
+PASS_PERCENTAGE = 50
+
+# Бюджет SQL-запросов на один запрос к API (по имени URL), см. SchoolTestDjangoProject/query_budget.py.
+QUERY_BUDGET_DEFAULT = 10
+QUERY_BUDGET_DUPLICATES = 3
+QUERY_BUDGETS = {
+    'register': 6,
+    'login': 3,
+    'profile': 3,
+    'profile_id': 3,
+    'school': 3,
+    'roster_import': 60,
+    'tests': 4,
+    'tests_create': 5,
+    # Включая чтение версии токена при холодном кэше.
+    'tests_import': 9,
+    'tests_id': 5,
+    # Худший случай — первая сдача теста в школе: загрузка ключа ответов и создание истории ученика, истории
+    # школы и сводки (30 запросов, с ANSWER_STORAGE = 'rows' — 32). Повторная сдача тем же учеником — 15.
+    'tests_submit': 32,
+    'tests_submission': 5,
+    'school_analytics': 7,
+    'school_breakdown': 3,
+    'test_item_analysis': 6,
+    # Вместе с запросами, которые выполняются при чтении потока; худший случай — выгрузка ответов
+    # (упакованные листы, архив и строки Answer) при холодном кэше версии токена.
+    'results_export': 7,
+    'student_analytics': 5,
+    'student_test_history': 5,
+    'subject': 2,
+    'event_list': 2,
+    'event_create': 5,
+    # Версия ленты школы читается из БД на каждый запрос; сама лента — из кэша.
+    'student_event_list': 3,
+    'recommendation_list': 2,
+    'recommendation_create': 5,
+    'recommendation_status': 3,
+}
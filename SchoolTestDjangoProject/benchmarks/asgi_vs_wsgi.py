@@ -0,0 +1,154 @@
+"""
+Сравнение пропускной способности эндпоинтов чтения под WSGI и под ASGI.
+
+    pip install gunicorn uvicorn
+    python -m benchmarks.asgi_vs_wsgi --concurrency 10 --concurrency 50 --concurrency 200
+
+Скрипт по очереди запускает сервер каждого вида (по умолчанию gunicorn с потоками для WSGI и uvicorn для
+ASGI, одинаковое число процессов), ждёт, пока он начнёт принимать соединения, и на каждом уровне
+конкурентности гоняет смесь запросов к async-представлениям: деталь теста, лента событий ученика, аналитика
+ученика и список предметов. Данные создаются в БД из DJANGO_SETTINGS_MODULE — сервер должен смотреть в ту же
+БД. Команды серверов можно заменить через --wsgi-command/--asgi-command ({host}, {port}, {workers}, {threads}).
+"""
+import argparse
+import itertools
+import shlex
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .fixtures import setup_django, seed_fixture
+from .stats import LatencyStats, percentile
+
+SERVERS = {
+    'wsgi': 'gunicorn SchoolTestDjangoProject.wsgi:application --bind {host}:{port} '
+            '--workers {workers} --threads {threads}',
+    'asgi': 'uvicorn SchoolTestDjangoProject.asgi:application --host {host} --port {port} '
+            '--workers {workers} --no-access-log',
+}
+
+
+def prepare_readers(fixture):
+    """Токены учеников и данные, без которых эндпоинты ответили бы 404: история и событие класса."""
+    from django.contrib.auth.models import User
+
+    from register.tokens import issue_access_token
+    from school_test.models import Event, TestHistory
+
+    users = User.objects.filter(id__in=[user_id for user_id, _ in fixture['students']]).select_related('profile')
+    for user in users:
+        TestHistory.objects.get_or_create(student=user, defaults={'full_name': user.profile.name})
+    Event.objects.get_or_create(school_id=fixture['school_id'], class_number='11', test_id=fixture['test_id'])
+    return [(user.id, issue_access_token(user)) for user in users]
+
+
+def read_paths(fixture, readers):
+    """Бесконечная смесь (эндпоинт, путь, токен) в равных долях."""
+    for user_id, token in itertools.cycle(readers):
+        yield 'test_detail', f'/tests/{fixture["test_id"]}/', None
+        yield 'student_event_list', '/student/event-list/', token
+        yield 'student_analytics', f'/analytics/student/{user_id}/', token
+        yield 'subject', '/subject/list/', None
+
+
+def wait_for_port(host, port, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Сервер завершился с кодом {process.returncode}')
+        try:
+            with socket.create_connection((host, port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Сервер не начал принимать соединения за {timeout} с')
+
+
+def run_reads(base_url, fixture, readers, concurrency, requests_count):
+    stats = LatencyStats()
+    sessions = [requests.Session() for _ in range(concurrency)]
+    paths = list(itertools.islice(read_paths(fixture, readers), requests_count))
+
+    def worker(index):
+        http = sessions[index]
+        for endpoint, path, token in paths[index::concurrency]:
+            headers = {'Authorization': f'Bearer {token}'} if token else {}
+            start = time.perf_counter()
+            try:
+                ok = http.get(f'{base_url}{path}', headers=headers, timeout=60).status_code < 400
+            except requests.RequestException:
+                ok = False
+            stats.record(endpoint, time.perf_counter() - start, ok)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    stats.stop()
+    return stats
+
+
+def benchmark_server(kind, command, args, fixture, readers):
+    process = subprocess.Popen(shlex.split(command), stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(args.host, args.port, process, args.startup_timeout)
+        base_url = f'http://{args.host}:{args.port}'
+        run_reads(base_url, fixture, readers, 1, args.warmup)
+        results = {}
+        for concurrency in args.concurrency:
+            stats = run_reads(base_url, fixture, readers, concurrency, args.requests)
+            print(f'\n{kind.upper()}, конкурентность {concurrency}\n{stats.report()}')
+            results[concurrency] = stats
+        return results
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--server', choices=sorted(SERVERS), action='append', help='По умолчанию — оба.')
+    parser.add_argument('--wsgi-command', default=SERVERS['wsgi'])
+    parser.add_argument('--asgi-command', default=SERVERS['asgi'])
+    parser.add_argument('--workers', type=int, default=2, help='Процессов сервера.')
+    parser.add_argument('--threads', type=int, default=8, help='Потоков на процесс WSGI-сервера.')
+    parser.add_argument('--concurrency', type=int, action='append',
+                        help='Уровни конкурентности; по умолчанию 10, 50, 200.')
+    parser.add_argument('--requests', type=int, default=2000, help='Запросов на каждый уровень конкурентности.')
+    parser.add_argument('--warmup', type=int, default=100, help='Прогревочных запросов после запуска сервера.')
+    parser.add_argument('--students', type=int, default=100)
+    parser.add_argument('--startup-timeout', type=float, default=30)
+    args = parser.parse_args(argv)
+    args.concurrency = args.concurrency or [10, 50, 200]
+    commands = {'wsgi': args.wsgi_command, 'asgi': args.asgi_command}
+
+    setup_django()
+    fixture = seed_fixture(students=args.students)
+    readers = prepare_readers(fixture)
+    print(f'Тест {fixture["test_id"]}, школа {fixture["school_id"]}, учеников: {len(readers)}')
+
+    results = {}
+    for kind in args.server or sorted(SERVERS):
+        command = commands[kind].format(host=args.host, port=args.port, workers=args.workers, threads=args.threads)
+        print(f'\n$ {command}')
+        results[kind] = benchmark_server(kind, command, args, fixture, readers)
+
+    print(f'\n{"конкурентность":<16}' + ''.join(f'{kind + " rps":>12}{kind + " p95 ms":>14}' for kind in results))
+    for concurrency in args.concurrency:
+        line = f'{concurrency:<16}'
+        for stats in (results[kind][concurrency] for kind in results):
+            latencies = sorted(itertools.chain.from_iterable(stats.latencies.values()))
+            line += f'{len(latencies) / stats.elapsed:>12.1f}{percentile(latencies, 0.95) * 1000:>14.1f}'
+        print(line)
+    return 1 if any(any(stats.errors.values()) for runs in results.values() for stats in runs.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import os
+
+import django
+
+
+def setup_django():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SchoolTestDjangoProject.settings')
+    django.setup()
+
+
+def seed_fixture(students=100, questions=40, options=4):
+    """
+    Создаёт (или переиспользует) школу, тест и учеников для нагрузочного прогона.
+    Ученики получают телефоны +996999XXXXXX, поэтому повторный запуск не дублирует данные.
+    """
+    from django.contrib.auth.models import User
+    from django.db import transaction
+
+    from register.models import School, Profile
+    from school_test.models import Subject, Test, Question, AnswerOption
+
+    with transaction.atomic():
+        school, _ = School.objects.get_or_create(name='Benchmark School', city='Benchmark')
+        subject, _ = Subject.objects.get_or_create(name='Benchmark')
+        author, created = User.objects.get_or_create(username='benchmark_author')
+        if created:
+            Profile.objects.create(user=author, name='Benchmark Author', phone_number='+996999000000',
+                                   school=school, role='school_admin')
+
+        test = Test.objects.filter(name=f'Benchmark {questions}', school=school).first()
+        if test is None:
+            test = Test.objects.create(name=f'Benchmark {questions}', subject=subject, school=school,
+                                       description='Нагрузочный тест', created_by=author)
+            for number in range(1, questions + 1):
+                question = Question.objects.create(test=test, number=number, text=f'Вопрос {number}',
+                                                   feedback='')
+                AnswerOption.objects.bulk_create([
+                    AnswerOption(question=question, text=f'Вариант {index}', is_correct=index == 0)
+                    for index in range(options)
+                ])
+
+        phones = [f'+996999{index:06d}' for index in range(1, students + 1)]
+        existing = set(Profile.objects.filter(phone_number__in=phones).values_list('phone_number', flat=True))
+        for phone in phones:
+            if phone not in existing:
+                user = User.objects.create(username=f'user{phone}')
+                Profile.objects.create(user=user, name=f'Benchmark {phone}', phone_number=phone, school=school,
+                                       class_number='11', class_letter='А')
+
+    profiles = Profile.objects.filter(phone_number__in=phones).values_list('user_id', 'phone_number')
+    return {
+        'school_id': school.id,
+        'test_id': test.id,
+        'students': list(profiles),
+        'questions': list(_options_by_question(test)),
+    }
+
+
+def _options_by_question(test):
+    from school_test.models import AnswerOption
+
+    grouped = {}
+    for question_id, option_id in AnswerOption.objects.filter(question__test=test) \
+            .order_by('question__number', 'id').values_list('question_id', 'id'):
+        grouped.setdefault(question_id, []).append(option_id)
+    return grouped.items()
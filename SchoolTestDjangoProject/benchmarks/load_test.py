@@ -0,0 +1,95 @@
+"""
+Нагрузочный прогон против локального экземпляра API.
+
+    python manage.py runserver 127.0.0.1:8000          # или gunicorn/uvicorn
+    python -m benchmarks.load_test --students 200 --concurrency 50 --rounds 3
+
+Скрипт сам создаёт тестовые данные в БД из DJANGO_SETTINGS_MODULE (это должна быть та же БД,
+что у запущенного сервера, — SQLite или локальный Postgres), после чего каждый виртуальный
+ученик проходит сценарий: вход, получение теста, отправка ответов, своя аналитика,
+аналитика школы. В конце печатается пропускная способность и p50/p95/p99 по эндпоинтам.
+"""
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .fixtures import setup_django, seed_fixture
+from .stats import LatencyStats
+
+
+class StudentSession:
+    def __init__(self, base_url, stats, fixture, student, rng):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.fixture = fixture
+        self.user_id, self.phone_number = student
+        self.rng = rng
+        self.http = requests.Session()
+
+    def call(self, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, f'{self.base_url}{path}', timeout=60, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.stats.record(endpoint, time.perf_counter() - start, ok)
+        return response
+
+    def run(self):
+        response = self.call('login', 'POST', '/auth/login/', json={'phone_number': self.phone_number})
+        if response is None or response.status_code != 200:
+            return
+        self.http.headers['Authorization'] = f'Bearer {response.json()["token"]}'
+
+        test_id = self.fixture['test_id']
+        self.call('test_detail', 'GET', f'/tests/{test_id}/')
+        answers = [
+            {'question_id': question_id, 'selected_option_id': self.rng.choice(option_ids)}
+            for question_id, option_ids in self.fixture['questions']
+        ]
+        self.call('submit', 'POST', f'/tests/{test_id}/submit/', json={'answers': answers})
+        self.call('student_analytics', 'GET', f'/analytics/student/{self.user_id}/')
+        self.call('school_analytics', 'GET', f'/analytics/school/{self.fixture["school_id"]}/')
+
+
+def run_load(base_url, fixture, concurrency, rounds, seed=0):
+    stats = LatencyStats()
+    rng = random.Random(seed)
+    sessions = [
+        StudentSession(base_url, stats, fixture, student, random.Random(rng.random()))
+        for _ in range(rounds)
+        for student in fixture['students']
+    ]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(session.run) for session in sessions]:
+            future.result()
+    stats.stop()
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--students', type=int, default=100)
+    parser.add_argument('--questions', type=int, default=40)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=1, help='Сколько раз каждый ученик проходит сценарий.')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    setup_django()
+    fixture = seed_fixture(students=args.students, questions=args.questions)
+    print(f'Тест {fixture["test_id"]}, школа {fixture["school_id"]}, учеников: {len(fixture["students"])}')
+
+    stats = run_load(args.base_url, fixture, args.concurrency, args.rounds, args.seed)
+    print(stats.report())
+    return 1 if any(stats.errors.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
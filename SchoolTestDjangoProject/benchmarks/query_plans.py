@@ -0,0 +1,124 @@
+"""
+Планы и время горячих запросов без новых индексов и с ними.
+
+    python manage.py generate_dataset --schools 20 --students-per-school 200
+    python -m benchmarks.query_plans --repeat 20
+
+Для каждого запроса индексы из списка удаляются внутри транзакции (и при необходимости создаются
+прежние), печатается EXPLAIN и медианное время, транзакция откатывается — затем то же с индексами
+из моделей. На Postgres план снимается с ANALYZE. Данные берутся из DJANGO_SETTINGS_MODULE.
+"""
+import argparse
+import statistics
+import time
+from datetime import timedelta
+
+from .fixtures import setup_django
+
+
+def hot_queries():
+    """(название, функция queryset, удаляемые индексы, прежние индексы «до») для каждого горячего запроса."""
+    from django.conf import settings
+    from django.db.models import Q
+    from django.utils import timezone
+
+    from school_test.deliveries import recipients
+    from school_test.models import Answer, AnswerSheet, Event, Recommendation, Result, Submission
+
+    sample = Result.objects.select_related('test').order_by('-id').first()
+    if sample is None:
+        return []
+    student_id, test, since = sample.student_id, sample.test, sample.date_taken.replace(day=1)
+    class_number = sample.student.profile.class_number
+    stale = timezone.now() - timedelta(seconds=settings.SUBMISSION_LOCK_TIMEOUT)
+    recommendation = Recommendation(school_id=test.school_id, class_number=class_number, subject_id=test.subject_id,
+                                    min_percentage=40, max_percentage=60)
+
+    return [
+        ('Попытки ученика по тесту',
+         lambda: Result.objects.filter(student_id=student_id, test_id=test.id).order_by('-date_taken'),
+         ['result_student_test_idx'], []),
+        ('Результаты теста за период',
+         lambda: Result.objects.filter(test_id=test.id, date_taken__gte=since).order_by('date_taken'),
+         ['result_test_date_idx'], []),
+        ('Получатели рекомендации',
+         lambda: recipients(recommendation),
+         ['result_test_percentage_idx', 'profile_student_class_idx'], []),
+        ('Листы ответов теста',
+         lambda: AnswerSheet.objects.filter(test_id=test.id).order_by('result_id')
+         .values_list('result_id', 'questions'),
+         ['answersheet_test_result_idx'], []),
+        ('Строки ответов теста',
+         lambda: Answer.objects.filter(test_id=test.id).order_by('id').values_list('question_id', 'is_correct'),
+         ['answer_test_id_idx'], []),
+        ('Ответы ученика по тесту',
+         lambda: Answer.objects.filter(student_id=student_id, test_id=test.id),
+         ['answer_student_test_idx'], []),
+        ('Очередь отправок',
+         lambda: Submission.objects.filter(Q(status=Submission.PENDING) | Q(status=Submission.PROCESSING,
+                                                                             locked_at__lt=stale))
+         .order_by('created_at').values_list('id', flat=True)[:50],
+         ['submission_queue_idx'], [(Submission, ['status', 'created_at'])]),
+        ('События класса',
+         lambda: Event.objects.filter(school_id=test.school_id, class_number=class_number).order_by('id'),
+         [index.name for index in Event._meta.indexes], []),
+    ]
+
+
+def drop_indexes(cursor, dropped, restored):
+    from django.db import connection
+
+    for name in dropped:
+        cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+    for model, fields in restored:
+        table = model._meta.db_table
+        columns = ', '.join(connection.ops.quote_name(model._meta.get_field(field).column) for field in fields)
+        name = connection.ops.quote_name(f'{table}_{"_".join(fields)}_bench')
+        cursor.execute(f'CREATE INDEX {name} ON {connection.ops.quote_name(table)} ({columns})')
+
+
+def measure(make_queryset, repeat):
+    from django.db import connection
+
+    queryset = make_queryset()
+    plan = queryset.explain(analyze=True) if connection.vendor == 'postgresql' else queryset.explain()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        list(make_queryset())
+        timings.append(time.perf_counter() - start)
+    return plan, statistics.median(timings) * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10, help='Сколько раз выполнить каждый запрос.')
+    parser.add_argument('--plans', action='store_true', help='Печатать планы целиком, а не только время.')
+    args = parser.parse_args(argv)
+
+    setup_django()
+    from django.db import connection, transaction
+
+    queries = hot_queries()
+    if not queries:
+        print('В базе нет результатов — сначала выполните python manage.py generate_dataset.')
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    print(f'{"запрос":<30}{"без индексов, мс":>18}{"с индексами, мс":>18}')
+    for title, make_queryset, dropped, restored in queries:
+        with transaction.atomic(), connection.cursor() as cursor:
+            drop_indexes(cursor, dropped, restored)
+            before_plan, before = measure(make_queryset, args.repeat)
+            transaction.set_rollback(True)
+        after_plan, after = measure(make_queryset, args.repeat)
+
+        print(f'{title:<30}{before:>18.2f}{after:>18.2f}')
+        if args.plans:
+            print(f'--- без индексов:\n{before_plan}\n--- с индексами:\n{after_plan}\n')
+
+
+if __name__ == '__main__':
+    main()
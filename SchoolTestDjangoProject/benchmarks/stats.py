@@ -0,0 +1,62 @@
+import math
+import threading
+import time
+from collections import defaultdict
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class LatencyStats:
+    """Собирает длительности запросов по эндпоинтам из нескольких потоков."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, endpoint, seconds, ok=True):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def rows(self):
+        for endpoint in sorted(self.latencies):
+            values = sorted(self.latencies[endpoint])
+            yield {
+                'endpoint': endpoint,
+                'requests': len(values),
+                'errors': self.errors[endpoint],
+                'rps': len(values) / self.elapsed if self.elapsed else 0.0,
+                'p50': percentile(values, 0.50) * 1000,
+                'p95': percentile(values, 0.95) * 1000,
+                'p99': percentile(values, 0.99) * 1000,
+            }
+
+    def report(self):
+        lines = [
+            f'{"endpoint":<22}{"requests":>10}{"errors":>8}{"rps":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+        ]
+        total = 0
+        for row in self.rows():
+            total += row['requests']
+            lines.append(
+                f'{row["endpoint"]:<22}{row["requests"]:>10}{row["errors"]:>8}{row["rps"]:>10.1f}'
+                f'{row["p50"]:>10.1f}{row["p95"]:>10.1f}{row["p99"]:>10.1f}'
+            )
+        lines.append(f'Всего: {total} запросов за {self.elapsed:.1f} с, {total / self.elapsed:.1f} запросов/с')
+        return '\n'.join(lines)
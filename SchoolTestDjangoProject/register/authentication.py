@@ -0,0 +1,130 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import F
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import Profile
+
+
+class ProfileClaims:
+    def __init__(self, user_id, role, school_id, class_number):
+        self.user_id = user_id
+        self.role = role
+        self.school_id = school_id
+        self.class_number = class_number
+
+    @classmethod
+    def from_profile(cls, profile):
+        return cls(profile.user_id, profile.role, profile.school_id, profile.class_number)
+
+    @classmethod
+    def from_token(cls, token):
+        return cls(token[api_settings.USER_ID_CLAIM], token['role'], token['school_id'], token['class_number'])
+
+
+def token_version_cache_key(user_id):
+    return f'token_version:{user_id}'
+
+
+def get_token_version(user_id):
+    """Актуальная версия токенов пользователя; 0 — пользователь удалён или отключён."""
+    cache_key = token_version_cache_key(user_id)
+    version = cache.get(cache_key)
+    if version is None:
+        version = Profile.objects.filter(user_id=user_id, user__is_active=True) \
+            .values_list('token_version', flat=True).first() or 0
+        cache.set(cache_key, version, settings.TOKEN_VERSION_CACHE_TIMEOUT)
+    return version
+
+
+async def aget_token_version(user_id):
+    cache_key = token_version_cache_key(user_id)
+    version = await cache.aget(cache_key)
+    if version is None:
+        version = await Profile.objects.filter(user_id=user_id, user__is_active=True) \
+            .values_list('token_version', flat=True).afirst() or 0
+        await cache.aset(cache_key, version, settings.TOKEN_VERSION_CACHE_TIMEOUT)
+    return version
+
+
+def invalidate_token_version(user_id):
+    cache.delete(token_version_cache_key(user_id))
+
+
+def revoke_tokens(user_id):
+    """Отзывает все выданные пользователю токены."""
+    Profile.objects.filter(user_id=user_id).update(token_version=F('token_version') + 1)
+    invalidate_token_version(user_id)
+
+
+class ClaimsUser(SimpleLazyObject):
+    """Пользователь из токена: id известен сразу, запись User читается из БД только при первом обращении."""
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id):
+        super().__init__(lambda: User.objects.select_related('profile').get(pk=user_id))
+        self.__dict__['id'] = user_id
+        self.__dict__['pk'] = user_id
+
+    def __bool__(self):
+        return True
+
+
+class ProfileClaimsAuthentication(JWTAuthentication):
+    """
+    JWT-аутентификация без запросов к БД: роль, школа и класс берутся из подписанных claims токена,
+    а отзыв проверяется сравнением версии токена с закэшированной версией профиля.
+    Токены без claims профиля обрабатываются как обычно.
+    """
+
+    def get_user(self, validated_token):
+        if 'token_version' not in validated_token:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed('Токен не содержит идентификатор пользователя.', code='token_not_valid')
+        if validated_token['token_version'] != get_token_version(user_id):
+            raise AuthenticationFailed('Токен отозван.', code='token_revoked')
+        return ClaimsUser(user_id)
+
+    async def aauthenticate(self, request):
+        """То же, что authenticate, для async-представлений: (пользователь, токен) или None."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        if 'token_version' not in validated_token:
+            return await sync_to_async(super().get_user)(validated_token), validated_token
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise AuthenticationFailed('Токен не содержит идентификатор пользователя.', code='token_not_valid')
+        if validated_token['token_version'] != await aget_token_version(user_id):
+            raise AuthenticationFailed('Токен отозван.', code='token_revoked')
+        return ClaimsUser(user_id), validated_token
+
+
+def get_profile_claims(request):
+    """Роль, школа и класс текущего пользователя: из токена, а для токенов старого формата — из профиля."""
+    token = request.auth
+    if token is not None and 'token_version' in token:
+        return ProfileClaims.from_token(token)
+    return ProfileClaims.from_profile(request.user.profile)
+
+
+async def aget_profile_claims(request):
+    token = request.auth
+    if token is not None and 'token_version' in token:
+        return ProfileClaims.from_token(token)
+    return ProfileClaims.from_profile(await Profile.objects.aget(user_id=request.user.id))
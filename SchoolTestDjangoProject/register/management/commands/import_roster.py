@@ -0,0 +1,43 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from register.models import School
+from register.roster import CHUNK_SIZE, RosterError, import_roster, read_roster
+
+
+class Command(BaseCommand):
+    help = ('Регистрирует учеников школы из файла CSV/XLSX (столбцы name, phone_number, class_number, '
+            'class_letter) и выводит отчёт об отклонённых строках.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--school', type=int, required=True, help='ID школы.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--errors', help='Записать отчёт об ошибках в CSV-файл.')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файл, ничего не создавать.')
+
+    def handle(self, *args, **options):
+        try:
+            school = School.objects.get(pk=options['school'])
+        except School.DoesNotExist:
+            raise CommandError('Указанная школа не найдена.')
+
+        try:
+            with open(options['path'], 'rb') as file:
+                report = import_roster(read_roster(file, options['path']), school, options['chunk_size'],
+                                       options['dry_run'])
+        except RosterError as e:
+            raise CommandError(str(e))
+
+        if options['errors']:
+            with open(options['errors'], 'w', newline='', encoding='utf-8-sig') as file:
+                writer = csv.DictWriter(file, fieldnames=['row', 'phone_number', 'error'])
+                writer.writeheader()
+                writer.writerows(report.errors)
+        else:
+            for error in report.errors:
+                self.stderr.write(f"Строка {error['row']} ({error['phone_number']}): {error['error']}")
+
+        verb = 'Будет зарегистрировано' if options['dry_run'] else 'Зарегистрировано'
+        self.stdout.write(self.style.SUCCESS(f'{verb} учеников: {report.created}, отклонено строк: {len(report.errors)}'))
@@ -14,6 +14,7 @@ def validate_kyrgyz_phone_number(value):
 class School(models.Model):
     name = models.CharField(max_length=255)
     city = models.CharField(max_length=255)
+    event_feed_version = models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия ленты событий')
 
     def __str__(self):
         return f'{self.city} - {self.name}'
@@ -37,6 +38,13 @@ class Profile(models.Model):
     class_number = models.CharField(max_length=255, blank=True, null=True)
     class_letter = models.CharField(max_length=255, blank=True, null=True)
     role = models.CharField(max_length=100, choices=ROLE_CHOICES, default='student')
+    token_version = models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия токенов')
 
     def __str__(self):
         return f'{self.role} {self.name} ({self.phone_number}) - {self.school}'
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['school', 'class_number'], condition=models.Q(role='student'),
+                         name='profile_student_class_idx'),
+        ]
@@ -1,22 +1,24 @@
 from rest_framework.permissions import BasePermission
 
+from .authentication import get_profile_claims
+
 
 class IsStudentPermission(BasePermission):
 
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.profile.role == 'student'
+        return request.user.is_authenticated and get_profile_claims(request).role == 'student'
 
 
 class IsSchool_AdminPermission(BasePermission):
 
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.profile.role == 'school_admin'
+        return request.user.is_authenticated and get_profile_claims(request).role == 'school_admin'
 
 
 class IsSuper_AdminPermission(BasePermission):
 
     def has_permission(self, request, view):
-        return request.user.is_authenticated and request.user.profile.role == 'super_admin'
+        return request.user.is_authenticated and get_profile_claims(request).role == 'super_admin'
 
 
 class IsSuperUser(BasePermission):
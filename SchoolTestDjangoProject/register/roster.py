@@ -0,0 +1,204 @@
+"""
+Массовая регистрация учеников школы по списку CSV/XLSX.
+
+Файл читается потоком, строки обрабатываются пачками: номера телефонов проверяются
+validate_kyrgyz_phone_number, дубликаты внутри файла и среди уже зарегистрированных ищутся одним
+запросом на пачку, а пользователи и профили создаются через bulk_create. По каждой отклонённой строке
+в отчёт попадает номер строки и причина.
+"""
+import csv
+import io
+import os
+import re
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import Profile, validate_kyrgyz_phone_number
+
+CHUNK_SIZE = 1000
+ALREADY_REGISTERED = 'Пользователь с таким номером телефона уже зарегистрирован.'
+
+COLUMNS = {
+    'name': 'name',
+    'фио': 'name',
+    'имя': 'name',
+    'phone_number': 'phone_number',
+    'phone': 'phone_number',
+    'телефон': 'phone_number',
+    'class_number': 'class_number',
+    'класс': 'class_number',
+    'class_letter': 'class_letter',
+    'буква': 'class_letter',
+}
+
+_phone_junk_re = re.compile(r'[\s\-()]')
+
+
+class RosterError(Exception):
+    pass
+
+
+class RosterReport:
+    def __init__(self):
+        self.created = 0
+        self.errors = []
+
+    def add_error(self, row_number, phone_number, message):
+        self.errors.append({'row': row_number, 'phone_number': phone_number, 'error': message})
+
+    def as_dict(self):
+        return {'created': self.created, 'errors_count': len(self.errors), 'errors': self.errors}
+
+
+def normalize_phone(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    phone = _phone_junk_re.sub('', str(value))
+    if phone.startswith('996'):
+        phone = '+' + phone
+    elif phone.startswith('0') and len(phone) == 10:
+        phone = '+996' + phone[1:]
+    return phone
+
+
+def normalize_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _rows_with_header(rows):
+    """Сопоставляет заголовок с полями профиля и отдаёт (номер строки, словарь значений)."""
+    try:
+        header = next(rows)
+    except StopIteration:
+        raise RosterError('Файл пуст.')
+    fields = [COLUMNS.get(normalize_cell(cell).lower()) for cell in header]
+    missing = {'name', 'phone_number'} - set(fields)
+    if missing:
+        raise RosterError(f"В заголовке нет обязательных столбцов: {', '.join(sorted(missing))}.")
+
+    for row_number, row in enumerate(rows, start=2):
+        values = {field: cell for field, cell in zip(fields, row) if field}
+        if any(normalize_cell(value) for value in values.values()):
+            yield row_number, values
+
+
+def read_csv(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    return _rows_with_header(csv.reader(text, dialect))
+
+
+def read_xlsx(file):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    return _rows_with_header(workbook.active.iter_rows(values_only=True))
+
+
+def read_roster(file, name=None):
+    extension = os.path.splitext(name or getattr(file, 'name', '') or '')[1].lower()
+    if extension == '.xlsx':
+        return read_xlsx(file)
+    if extension in ('.csv', '.txt', ''):
+        return read_csv(file)
+    raise RosterError('Поддерживаются файлы CSV и XLSX.')
+
+
+def import_roster(rows, school, chunk_size=CHUNK_SIZE, dry_run=False):
+    """rows — итерируемое из (номер строки, словарь значений), см. read_roster."""
+    report = RosterReport()
+    seen = set()
+    while chunk := list(islice(rows, chunk_size)):
+        import_chunk(chunk, school, report, seen, dry_run)
+    return report
+
+
+def import_chunk(chunk, school, report, seen, dry_run=False):
+    candidates = []
+    for row_number, values in chunk:
+        phone_number = normalize_phone(values.get('phone_number'))
+        name = normalize_cell(values.get('name'))
+        if not name:
+            report.add_error(row_number, phone_number, 'Не указано имя.')
+            continue
+        try:
+            validate_kyrgyz_phone_number(phone_number)
+        except ValidationError as e:
+            report.add_error(row_number, phone_number, ' '.join(e.messages))
+            continue
+        if phone_number in seen:
+            report.add_error(row_number, phone_number, 'Номер телефона повторяется в файле.')
+            continue
+        seen.add(phone_number)
+        candidates.append((row_number, phone_number, name, values))
+
+    taken = registered({f'user{phone_number}' for _, phone_number, _, _ in candidates},
+                       {phone_number for _, phone_number, _, _ in candidates}) if candidates else set()
+
+    accepted = []
+    for row in candidates:
+        row_number, phone_number, _, _ = row
+        if phone_number in taken or f'user{phone_number}' in taken:
+            report.add_error(row_number, phone_number, ALREADY_REGISTERED)
+        else:
+            accepted.append(row)
+
+    if accepted and not dry_run:
+        try:
+            with transaction.atomic():
+                create_students(accepted, school)
+        except IntegrityError:
+            # Номер успели зарегистрировать после проверки: пачка создаётся построчно, отклоняются только такие строки.
+            accepted = [row for row in accepted if create_student(row, school, report)]
+    report.created += len(accepted)
+
+
+def registered(usernames, phones):
+    """Имена пользователей и номера телефонов из переданных, которые уже заняты."""
+    taken = set()
+    for username, phone_number in User.objects.filter(
+        Q(username__in=usernames) | Q(profile__phone_number__in=phones)
+    ).values_list('username', 'profile__phone_number'):
+        taken.update((username, phone_number))
+    return taken
+
+
+def create_students(rows, school):
+    users = User.objects.bulk_create([User(username=f'user{phone_number}') for _, phone_number, _, _ in rows])
+    Profile.objects.bulk_create([
+        Profile(
+            user_id=user.id,
+            name=name,
+            phone_number=phone_number,
+            school=school,
+            class_number=normalize_cell(values.get('class_number')) or None,
+            class_letter=normalize_cell(values.get('class_letter')) or None,
+        )
+        for user, (_, phone_number, name, values) in zip(users, rows)
+    ])
+
+
+def create_student(row, school, report):
+    """Создаёт ученика в отдельной точке сохранения; при конфликте уникальности записывает ошибку строки."""
+    try:
+        with transaction.atomic():
+            create_students([row], school)
+    except IntegrityError:
+        report.add_error(row[0], row[1], ALREADY_REGISTERED)
+        return False
+    return True
@@ -2,9 +2,9 @@ from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from rest_framework import serializers
 from rest_framework_simplejwt.exceptions import AuthenticationFailed
-from rest_framework_simplejwt.tokens import RefreshToken
 
 from .models import Profile, School
+from .tokens import issue_access_token
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -45,12 +45,11 @@ class LoginSerializer(serializers.Serializer):
     def validate(self, data):
         phone_number = data.get('phone_number')
         try:
-            profile = Profile.objects.get(phone_number=phone_number)
+            profile = Profile.objects.select_related('user').get(phone_number=phone_number)
             user = profile.user
         except Profile.DoesNotExist:
             raise AuthenticationFailed('Invalid phone number.')
-        refresh = RefreshToken.for_user(user)
-        token = str(refresh.access_token)
+        token = issue_access_token(user)
         return {
             "token": token,
         }
@@ -65,4 +64,4 @@ class ProfileSerializer(serializers.ModelSerializer):
 class SchoolSerializer(serializers.ModelSerializer):
     class Meta:
         model = School
-        fields = '__all__'
+        fields = ['id', 'name', 'city']
@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import invalidate_token_version
+from .models import Profile
+
+CLAIM_FIELDS = ('role', 'school_id', 'class_number')
+
+
+@receiver(pre_save, sender=Profile)
+def bump_token_version(sender, instance, **kwargs):
+    """Смена роли, школы или класса делает выданные токены недействительными: в них устаревшие claims."""
+    if instance._state.adding or instance.pk is None:
+        return
+    previous = Profile.objects.filter(pk=instance.pk).values(*CLAIM_FIELDS, 'token_version').first()
+    if previous and any(previous[field] != getattr(instance, field) for field in CLAIM_FIELDS):
+        instance.token_version = previous['token_version'] + 1
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    invalidate_token_version(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_token_version(instance.pk)
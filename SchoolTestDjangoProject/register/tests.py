@@ -1,3 +1,143 @@
+import io
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from SchoolTestDjangoProject.query_budget import QueryBudgetTestMixin, missing_budgets
+from . import urls
+from .authentication import revoke_tokens
+from .models import Profile, School
+from .tokens import issue_access_token
+
+
+class RegisterTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Школа №1', city='Бишкек')
+        cls.superuser = User.objects.create(username='root', is_superuser=True)
+        Profile.objects.create(user=cls.superuser, name='Root', phone_number='+996700000001', school=cls.school,
+                               role='super_admin')
+        cls.student = User.objects.create(username='student')
+        Profile.objects.create(user=cls.student, name='Ученик', phone_number='+996700000002', school=cls.school,
+                               class_number='9', class_letter='А')
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_access_token(user)}')
+        return client
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, RegisterTestCase):
+    """Каждый URL приложения укладывается в бюджет SQL-запросов из settings.QUERY_BUDGETS."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.client_for(self.superuser)
+
+    def test_every_url_has_a_budget(self):
+        self.assertEqual(missing_budgets(urls.urlpatterns), [])
+
+    def test_auth(self):
+        response = self.assertWithinQueryBudget('register', method='post', client=APIClient(), format='json', data={
+            'name': 'Новый', 'phone_number': '+996700000003', 'school': self.school.pk,
+            'class_number': '9', 'class_letter': 'Б',
+        })
+        self.assertEqual(response.status_code, 201)
+        response = self.assertWithinQueryBudget('login', method='post', client=APIClient(), format='json',
+                                                data={'phone_number': '+996700000002'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_admin_lists(self):
+        self.assertWithinQueryBudget('profile')
+        self.assertWithinQueryBudget('profile_id', kwargs={'pk': self.student.profile.pk})
+        self.assertWithinQueryBudget('school')
+
+    def test_roster_import(self):
+        rows = '\n'.join(f'Ученик {index},+996701{index:06d},9,А' for index in range(50))
+        file = SimpleUploadedFile('roster.csv', f'name,phone_number,class_number,class_letter\n{rows}\n'.encode())
+        response = self.assertWithinQueryBudget('roster_import', method='post', kwargs={'pk': self.school.pk},
+                                                data={'file': file})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 50)
+
+
+class TokenRevocationTests(RegisterTestCase):
+    def get_schools(self, token):
+        return APIClient().get(reverse('school'), HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_changing_claims_revokes_issued_tokens(self):
+        token = issue_access_token(self.superuser)
+        profile = self.superuser.profile
+
+        profile.name = 'Администратор'
+        profile.save()
+        self.assertEqual(self.get_schools(token).status_code, 200)
+
+        profile.class_number = '11'
+        profile.save()
+        response = self.get_schools(token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.data['code'], 'token_revoked')
+
+        token = issue_access_token(User.objects.select_related('profile').get(pk=self.superuser.pk))
+        self.assertEqual(self.get_schools(token).status_code, 200)
+        revoke_tokens(self.superuser.pk)
+        self.assertEqual(self.get_schools(token).status_code, 401)
+
+
+class RosterImportTests(RegisterTestCase):
+    def import_file(self, name, content):
+        return self.client_for(self.superuser).post(reverse('roster_import', kwargs={'pk': self.school.pk}),
+                                                    {'file': SimpleUploadedFile(name, content)})
+
+    def test_rejected_rows_are_reported(self):
+        response = self.import_file('roster.csv', '\n'.join([
+            'ФИО;Телефон;Класс;Буква',
+            'Асанов Бекзат;0701 123 456;9;А',
+            'Исаева Айгерим;+996 701 123 456;9;Б',
+            'Без телефона;12345;9;А',
+            ';+996702000000;9;А',
+            'Уже есть;+996700000002;9;А',
+            '',
+        ]).encode())
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([(error['row'], error['phone_number']) for error in response.data['errors']],
+                         [(3, '+996701123456'), (4, '12345'), (5, '+996702000000'), (6, '+996700000002')])
+        profile = Profile.objects.get(phone_number='+996701123456')
+        self.assertEqual((profile.name, profile.school, profile.class_number, profile.class_letter),
+                         ('Асанов Бекзат', self.school, '9', 'А'))
+
+    def test_number_registered_after_the_check_is_reported(self):
+        content = 'name,phone_number\nНовый,+996701000001\nОпоздавший,+996700000002\nЕщё один,+996701000002\n'
+        with mock.patch('register.roster.registered', return_value=set()):
+            response = self.import_file('roster.csv', content.encode())
+
+        self.assertEqual((response.status_code, response.data['created']), (201, 2))
+        self.assertEqual(response.data['errors'], [{
+            'row': 3, 'phone_number': '+996700000002',
+            'error': 'Пользователь с таким номером телефона уже зарегистрирован.',
+        }])
+        self.assertEqual(Profile.objects.filter(phone_number__startswith='+996701').count(), 2)
+
+    def test_xlsx_and_header_errors(self):
+        from openpyxl import Workbook
+
+        workbook = Workbook()
+        workbook.active.append(['name', 'phone_number', 'class_number'])
+        workbook.active.append(['Ученик', 996703000000, 10])
+        file = io.BytesIO()
+        workbook.save(file)
+        response = self.import_file('roster.xlsx', file.getvalue())
+        self.assertEqual((response.status_code, response.data['created']), (201, 1))
+        self.assertEqual(Profile.objects.get(phone_number='+996703000000').class_number, '10')
 
-# Create your tests here.
+        response = self.import_file('roster.csv', 'name,class_number\nУченик,9\n'.encode())
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('phone_number', response.data['error'])
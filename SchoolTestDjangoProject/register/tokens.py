@@ -0,0 +1,18 @@
+from rest_framework_simplejwt.tokens import AccessToken
+
+
+def profile_claims(profile):
+    return {
+        'role': profile.role,
+        'school_id': profile.school_id,
+        'class_number': profile.class_number,
+        'token_version': profile.token_version,
+    }
+
+
+def issue_access_token(user):
+    """Токен доступа с ролью, школой и классом ученика: по ним запросы авторизуются без чтения профиля из БД."""
+    token = AccessToken.for_user(user)
+    for claim, value in profile_claims(user.profile).items():
+        token[claim] = value
+    return str(token)
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import RegisterView, LoginView, ProfileGetView, ProfileGetIdView, SchoolView
+from .views import RegisterView, LoginView, ProfileGetView, ProfileGetIdView, SchoolView, RosterImportView
 
 urlpatterns = [
     path('auth/register/', RegisterView.as_view(), name='register'),
@@ -7,5 +7,6 @@ urlpatterns = [
     path('user/all/', ProfileGetView.as_view(), name='profile'),
     path('user/<int:pk>/', ProfileGetIdView.as_view(), name='profile_id'),
     path('school/', SchoolView.as_view(), name='school'),
+    path('school/<int:pk>/roster/', RosterImportView.as_view(), name='roster_import'),
 
 ]
@@ -1,11 +1,14 @@
 from django.shortcuts import render
 from rest_framework import generics, status
+from rest_framework.generics import get_object_or_404
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from .permissions import IsSuperUser
 from .serializers import RegisterSerializer, LoginSerializer, ProfileSerializer, SchoolSerializer
 from .models import Profile, School
+from .roster import RosterError, import_roster, read_roster
+from .tokens import issue_access_token
 
 
 class RegisterView(generics.CreateAPIView):
@@ -18,8 +21,7 @@ class RegisterView(generics.CreateAPIView):
 
         if serializer.is_valid():
             user = serializer.save(role='student')
-            refresh = RefreshToken.for_user(user)
-            token = str(refresh.access_token)
+            token = issue_access_token(user)
             return Response({
                 'user': {
                     'username': user.username,
@@ -58,4 +60,22 @@ class ProfileGetIdView(generics.RetrieveAPIView):
 class SchoolView(generics.ListAPIView):
     queryset = School.objects.all()
     serializer_class = SchoolSerializer
-    permission_classes = [IsSuperUser]
\ No newline at end of file
+    permission_classes = [IsSuperUser]
+
+
+class RosterImportView(generics.GenericAPIView):
+    permission_classes = [IsSuperUser]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, pk):
+        school = get_object_or_404(School.objects.all(), pk=pk)
+        file = request.FILES.get('file')
+        if file is None:
+            return Response({'error': 'Загрузите файл CSV или XLSX в поле file.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            report = import_roster(read_roster(file, file.name), school)
+        except RosterError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(report.as_dict(), status=status.HTTP_201_CREATED if report.created else status.HTTP_200_OK)
@@ -1,14 +1,58 @@
 from django.contrib import admin
 from .models import (Subject, Test, Question, AnswerOption, Event, Answer, Result,
-                     TestHistory, SchoolHistory, Recommendation)
+                     TestHistory, SchoolHistory, Recommendation, Submission, ResultRollup,
+                     RecommendationDelivery, AnswerSheet, QuestionImageVariant)
 
 admin.site.register(Subject)
-admin.site.register(Test)
 admin.site.register(Question)
 admin.site.register(AnswerOption)
-admin.site.register(Event)
-admin.site.register(Answer)
-admin.site.register(Result)
-admin.site.register(Recommendation)
 admin.site.register(TestHistory)
 admin.site.register(SchoolHistory)
+admin.site.register(Submission)
+admin.site.register(ResultRollup)
+
+
+@admin.register(Test)
+class TestAdmin(admin.ModelAdmin):
+    list_select_related = ('subject', 'school', 'created_by__profile')
+
+
+@admin.register(Event)
+class EventAdmin(admin.ModelAdmin):
+    list_select_related = ('test', 'school')
+
+
+@admin.register(Answer)
+class AnswerAdmin(admin.ModelAdmin):
+    list_select_related = ('student__profile', 'question')
+
+
+@admin.register(Result)
+class ResultAdmin(admin.ModelAdmin):
+    list_select_related = ('student', 'test')
+    list_filter = ('archived',)
+
+
+@admin.register(AnswerSheet)
+class AnswerSheetAdmin(admin.ModelAdmin):
+    list_display = ('result', 'student', 'test')
+    list_select_related = ('result__test', 'student', 'test')
+
+
+@admin.register(Recommendation)
+class RecommendationAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'status', 'total_students', 'sent_count', 'failed_count')
+    list_select_related = ('subject',)
+
+
+@admin.register(RecommendationDelivery)
+class RecommendationDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('recommendation', 'phone_number', 'status', 'sent_at')
+    list_filter = ('status',)
+    list_select_related = ('recommendation__subject',)
+
+
+@admin.register(QuestionImageVariant)
+class QuestionImageVariantAdmin(admin.ModelAdmin):
+    list_display = ('question', 'format', 'width', 'height', 'file')
+    list_select_related = ('question',)
@@ -0,0 +1,69 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, F, Sum
+from django.db.models.functions import TruncWeek
+from django.utils import timezone
+
+from register.models import Profile
+from .models import Result, ResultRollup, SchoolHistory
+
+
+def _breakdown(rows):
+    return [
+        {
+            **{key: value for key, value in row.items() if key not in ('total', 'passed', 'results')},
+            'results_count': row['results'],
+            'average_percentage': float(row['total'] / row['results']) if row['results'] else 0.0,
+            'pass_rate': row['passed'] / row['results'] * 100 if row['results'] else 0.0,
+        }
+        for row in rows
+    ]
+
+
+def school_analytics(school):
+    """
+    Сводная аналитика школы; всё считается агрегатами в БД по сводкам и окну последних недель. Тренд читает
+    только результаты окна по индексу (школа, дата прохождения), поэтому не зависит от длины истории школы.
+    """
+    history = SchoolHistory.objects.filter(school=school).first()
+    rollups = ResultRollup.objects.filter(school=school).order_by()
+    totals = {'results': Sum('count'), 'total': Sum('percentage_sum'), 'passed': Sum('passed_count')}
+
+    subjects = rollups.values('subject_id', subject_name=F('subject__name')).annotate(**totals) \
+        .order_by('subject_name')
+    classes = rollups.values('class_number').annotate(**totals).order_by('class_number')
+
+    since = timezone.now() - timedelta(weeks=settings.SCHOOL_ANALYTICS_TREND_WEEKS)
+    trend = Result.objects.filter(school=school, date_taken__gte=since) \
+        .annotate(week=TruncWeek('date_taken')).values('week') \
+        .annotate(results_count=Count('id'), average_percentage=Avg('percentage')).order_by('week')
+
+    return {
+        'school': school.id,
+        'school_name': str(school),
+        'registered_students': Profile.objects.filter(school=school, role='student').count(),
+        'total_students': history.total_students if history else 0,
+        'results_count': history.results_count if history else 0,
+        'average_percentage': history.average_percentage if history else 0.0,
+        'subjects': _breakdown(subjects),
+        'classes': _breakdown(classes),
+        'trend': [
+            {
+                'week': row['week'].date().isoformat(),
+                'results_count': row['results_count'],
+                'average_percentage': float(row['average_percentage']),
+            }
+            for row in trend
+        ],
+    }
+
+
+def cached_school_analytics(school):
+    key = f'school_analytics:{school.id}'
+    data = cache.get(key)
+    if data is None:
+        data = school_analytics(school)
+        cache.set(key, data, settings.SCHOOL_ANALYTICS_CACHE_TIMEOUT)
+    return data
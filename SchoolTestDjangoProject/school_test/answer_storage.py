@@ -0,0 +1,195 @@
+"""
+Хранилище листов ответов.
+
+Ответы попытки хранятся либо строками Answer и Result.mistakes (ANSWER_STORAGE = 'rows'), либо одной
+строкой AnswerSheet (ANSWER_STORAGE = 'packed'): id вопросов и выбранных вариантов упакованы массивами
+int64 (little-endian) в порядке номеров вопросов, ошибки — битовой маской по тем же позициям.
+Настройка влияет только на запись; чтение через этот модуль понимает оба формата, поэтому
+результаты до и после `python manage.py pack_answers` отдаются API одинаково. Ответы попыток с
+Result.archived читаются из холодного архива (school_test/archive.py).
+"""
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+
+from .archive import archived_entry, archived_test_rows
+from .models import Answer, AnswerSheet, Question, Result, Test
+
+ID_DTYPE = np.dtype('<i8')
+
+
+def pack_ids(ids):
+    return np.asarray(ids, dtype=ID_DTYPE).tobytes()
+
+
+def unpack_ids(data):
+    return np.frombuffer(bytes(data), dtype=ID_DTYPE)
+
+
+def pack_bits(flags):
+    return np.packbits(np.asarray(flags, dtype=bool), bitorder='little').tobytes()
+
+
+def unpack_bits(data, count):
+    return np.unpackbits(np.frombuffer(bytes(data), dtype=np.uint8), count=count, bitorder='little').astype(bool)
+
+
+class StoredSheet:
+    """Ответы одной попытки: массивы id вопросов, выбранных вариантов и признак ошибки."""
+
+    def __init__(self, question_ids, option_ids, wrong):
+        self.question_ids = np.asarray(question_ids, dtype=np.int64)
+        self.option_ids = np.asarray(option_ids, dtype=np.int64)
+        self.wrong = np.asarray(wrong, dtype=bool)
+
+    @classmethod
+    def from_packed(cls, questions, options, mistakes):
+        question_ids = unpack_ids(questions)
+        return cls(question_ids, unpack_ids(options), unpack_bits(mistakes, len(question_ids)))
+
+    @classmethod
+    def from_archived(cls, entry):
+        return cls(entry.question_ids, entry.option_ids, ~entry.correct)
+
+    @property
+    def mistake_ids(self):
+        return self.question_ids[self.wrong].tolist()
+
+    def __iter__(self):
+        """(question_id, option_id, is_correct) по порядку номеров вопросов."""
+        return zip(self.question_ids.tolist(), self.option_ids.tolist(), (~self.wrong).tolist())
+
+
+def packed_sheet(result, graded):
+    """AnswerSheet для оценённого листа (grading.GradedSheet); ответы упорядочиваются по номерам вопросов."""
+    position = {question_id: index for index, question_id in enumerate(graded.key.question_ids)}
+    answers = sorted(graded.answers, key=lambda answer: position.get(answer[0], len(position)))
+    return AnswerSheet(
+        result_id=result.id,
+        student_id=result.student_id,
+        test_id=result.test_id,
+        questions=pack_ids([question_id for question_id, _, _ in answers]),
+        options=pack_ids([option_id for _, option_id, _ in answers]),
+        mistakes=pack_bits([not is_correct for _, _, is_correct in answers]),
+        created_at=result.date_taken,
+    )
+
+
+def save_answers(result, graded):
+    """Записывает ответы оценённой попытки в формате settings.ANSWER_STORAGE."""
+    if settings.ANSWER_STORAGE == 'packed':
+        sheet = packed_sheet(result, graded)
+        sheet.save(force_insert=True)
+        result.answer_sheet = sheet
+        return
+
+    Answer.objects.bulk_create([
+        Answer(
+            student_id=result.student_id,
+            test_id=result.test_id,
+            result_id=result.id,
+            question_id=question_id,
+            selected_option_id=option_id,
+            is_correct=is_correct,
+        )
+        for question_id, option_id, is_correct in graded.answers
+    ])
+    if graded.mistakes:
+        Mistake = Result.mistakes.through
+        Mistake.objects.bulk_create([
+            Mistake(result_id=result.id, question_id=question_id) for question_id in graded.mistakes
+        ])
+
+
+def _packed(result):
+    try:
+        return result.answer_sheet
+    except ObjectDoesNotExist:
+        return None
+
+
+def _archived(result):
+    return archived_entry(result.test.school_id, result.date_taken, result.id)
+
+
+def stored_mistake_ids(result):
+    """id ошибок из упакованного листа или архива; None, если они лежат в Result.mistakes."""
+    if result.archived:
+        entry = _archived(result)
+        return entry.mistake_ids.tolist() if entry is not None else []
+    sheet = _packed(result)
+    if sheet is not None:
+        return StoredSheet.from_packed(sheet.questions, sheet.options, sheet.mistakes).mistake_ids
+    return None
+
+
+def mistake_ids(result):
+    """
+    id вопросов с ошибками. Для списков результатов подгружайте select_related('answer_sheet', 'test')
+    и prefetch_related('mistakes'), тогда чтение не делает запросов.
+    """
+    ids = stored_mistake_ids(result)
+    if ids is not None:
+        return ids
+    return [question.id for question in result.mistakes.all()]
+
+
+def mistake_questions(result):
+    """Вопросы с ошибками по порядку номеров: список (id, text)."""
+    ids = stored_mistake_ids(result)
+    if ids is None:
+        return [(question.id, question.text) for question in result.mistakes.all()]
+    texts = dict(Question.objects.filter(id__in=ids).values_list('id', 'text'))
+    return [(question_id, texts[question_id]) for question_id in ids if question_id in texts]
+
+
+def micros(moment):
+    """Момент времени целым числом микросекунд — столбец времени в answer_arrays."""
+    return round(moment.timestamp() * 1_000_000)
+
+
+def answer_students(test_id):
+    """id учеников, у которых есть ответы теста: результаты (в том числе архивные) и старые строки Answer без них."""
+    return Result.objects.filter(test_id=test_id).values_list('student_id', flat=True) \
+        .union(Answer.objects.filter(test_id=test_id).values_list('student_id', flat=True))
+
+
+def answer_arrays(test_id, chunk_size):
+    """
+    Все ответы теста пачками массивов (n, 5): student_id, question_id, option_id, is_correct и время попытки
+    в микросекундах (micros). Источники идут один за другим — строки Answer, упакованные листы, архив, —
+    поэтому из нескольких ответов ученика на вопрос последний выбирается по времени, а не по порядку пачек.
+    """
+    rows = Answer.objects.filter(test_id=test_id).order_by('id') \
+        .values_list('student_id', 'question_id', 'selected_option_id', 'is_correct', 'created_at') \
+        .iterator(chunk_size=chunk_size)
+    while chunk := list(islice(rows, chunk_size)):
+        yield np.array([(*row[:4], micros(row[4])) for row in chunk], dtype=np.int64)
+
+    sheets = AnswerSheet.objects.filter(test_id=test_id).order_by('result_id') \
+        .values_list('student_id', 'questions', 'options', 'mistakes', 'result__date_taken') \
+        .iterator(chunk_size=chunk_size)
+    while chunk := list(islice(sheets, chunk_size)):
+        parts = []
+        for student_id, questions, options, mistakes, date_taken in chunk:
+            sheet = StoredSheet.from_packed(questions, options, mistakes)
+            parts.append(np.column_stack([
+                np.full(len(sheet.question_ids), student_id, dtype=np.int64),
+                sheet.question_ids,
+                sheet.option_ids,
+                ~sheet.wrong,
+                np.full(len(sheet.question_ids), micros(date_taken), dtype=np.int64),
+            ]))
+        yield np.concatenate(parts)
+
+    school_id = Test.objects.filter(id=test_id).values_list('school_id', flat=True).first()
+    if school_id is None:
+        return
+    archived = dict(Result.objects.filter(test_id=test_id, archived=True).values_list('id', 'date_taken'))
+    for rows, row_result_ids in archived_test_rows(school_id, test_id):
+        result_ids, inverse = np.unique(row_result_ids, return_inverse=True)
+        taken = np.array([micros(archived[result_id]) if result_id in archived else 0
+                          for result_id in result_ids.tolist()], dtype=np.int64)
+        yield np.column_stack([rows, taken[inverse]])
@@ -1,6 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class SchoolTestConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'school_test'
+
+    def ready(self):
+        from . import images, signals  # noqa: F401
+        post_migrate.connect(signals.backfill_counters_after_migrate, sender=self)
@@ -0,0 +1,180 @@
+"""
+Холодный архив ответов прошлых учебных лет.
+
+`python manage.py archive_answers` переносит ответы (строки Answer, листы AnswerSheet) и ошибки
+(Result.mistakes) попыток старше порога в сжатые файлы numpy .npz — по файлу на школу и учебный год:
+ANSWER_ARCHIVE_ROOT/school_<id>/<год>.npz. Сами результаты остаются в БД с Result.archived = True,
+поэтому фильтры, сводки и истории работают как раньше, а ответы по ним читает answer_storage из архива.
+
+Файл хранится по столбцам: результаты по возрастанию id (result_ids, student_ids, test_ids) и смещения
+их ответов и ошибок в плоских массивах question_ids/option_ids/correct и mistake_ids. Загруженные
+файлы держатся в LRU процесса, ключ включает время изменения файла.
+"""
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .cache import LRUCache
+
+local_archives = LRUCache(settings.ANSWER_ARCHIVE_CACHE_SIZE)
+
+
+def school_year(moment):
+    """Учебный год, к которому относится момент: 2024 — с SCHOOL_YEAR_START_MONTH 2024 года по следующий."""
+    moment = timezone.localtime(moment) if timezone.is_aware(moment) else moment
+    return moment.year if moment.month >= settings.SCHOOL_YEAR_START_MONTH else moment.year - 1
+
+
+def school_year_start(year):
+    return timezone.make_aware(datetime(year, settings.SCHOOL_YEAR_START_MONTH, 1))
+
+
+def archive_path(school_id, year):
+    return Path(settings.ANSWER_ARCHIVE_ROOT) / f'school_{school_id}' / f'{year}.npz'
+
+
+def archive_years(school_id):
+    directory = Path(settings.ANSWER_ARCHIVE_ROOT) / f'school_{school_id}'
+    return sorted(int(path.stem) for path in directory.glob('*.npz') if path.stem.isdigit())
+
+
+class ArchivedEntry:
+    """Ответы одной попытки из архива; question_ids/option_ids/correct — по порядку номеров вопросов."""
+
+    def __init__(self, result_id, student_id, test_id, question_ids, option_ids, correct, mistake_ids):
+        self.result_id = int(result_id)
+        self.student_id = int(student_id)
+        self.test_id = int(test_id)
+        self.question_ids = np.asarray(question_ids, dtype=np.int64)
+        self.option_ids = np.asarray(option_ids, dtype=np.int64)
+        self.correct = np.asarray(correct, dtype=bool)
+        self.mistake_ids = np.asarray(mistake_ids, dtype=np.int64)
+
+
+class ArchiveFile:
+    def __init__(self, arrays):
+        self.result_ids = arrays['result_ids']
+        self.student_ids = arrays['student_ids']
+        self.test_ids = arrays['test_ids']
+        self.answer_offsets = arrays['answer_offsets']
+        self.question_ids = arrays['question_ids']
+        self.option_ids = arrays['option_ids']
+        self.correct = arrays['correct']
+        self.mistake_offsets = arrays['mistake_offsets']
+        self.mistake_ids = arrays['mistake_ids']
+
+    @classmethod
+    def read(cls, path):
+        with np.load(path) as data:
+            return cls({name: data[name] for name in data.files})
+
+    def __len__(self):
+        return len(self.result_ids)
+
+    def _entry(self, index):
+        answers = slice(self.answer_offsets[index], self.answer_offsets[index + 1])
+        mistakes = slice(self.mistake_offsets[index], self.mistake_offsets[index + 1])
+        return ArchivedEntry(
+            self.result_ids[index], self.student_ids[index], self.test_ids[index],
+            self.question_ids[answers], self.option_ids[answers], self.correct[answers], self.mistake_ids[mistakes],
+        )
+
+    def entry(self, result_id):
+        index = np.searchsorted(self.result_ids, result_id)
+        if index < len(self.result_ids) and self.result_ids[index] == result_id:
+            return self._entry(index)
+        return None
+
+    def entries(self):
+        for index in range(len(self)):
+            yield self._entry(index)
+
+    def test_rows(self, test_id):
+        """
+        Ответы теста массивом (n, 4): student_id, question_id, option_id, is_correct — и id результата
+        каждой строки, по которому читатель находит время попытки.
+        """
+        positions = np.flatnonzero(self.test_ids == test_id)
+        starts, ends = self.answer_offsets[positions], self.answer_offsets[positions + 1]
+        counts = ends - starts
+        index = np.repeat(starts - (counts.cumsum() - counts), counts) + np.arange(counts.sum())
+        rows = np.column_stack([
+            np.repeat(self.student_ids[positions], counts),
+            self.question_ids[index],
+            self.option_ids[index],
+            self.correct[index],
+        ]).astype(np.int64)
+        return rows, np.repeat(self.result_ids[positions], counts).astype(np.int64)
+
+    @staticmethod
+    def build(entries):
+        entries = sorted(entries, key=lambda entry: entry.result_id)
+
+        def offsets(sizes):
+            return np.concatenate([[0], np.cumsum(sizes, dtype=np.int64)]).astype(np.int64)
+
+        def flat(arrays, dtype):
+            return np.concatenate(arrays).astype(dtype) if arrays else np.empty(0, dtype=dtype)
+
+        return {
+            'result_ids': np.array([entry.result_id for entry in entries], dtype=np.int64),
+            'student_ids': np.array([entry.student_id for entry in entries], dtype=np.int64),
+            'test_ids': np.array([entry.test_id for entry in entries], dtype=np.int64),
+            'answer_offsets': offsets([len(entry.question_ids) for entry in entries]),
+            'question_ids': flat([entry.question_ids for entry in entries], np.int64),
+            'option_ids': flat([entry.option_ids for entry in entries], np.int64),
+            'correct': flat([entry.correct for entry in entries], bool),
+            'mistake_offsets': offsets([len(entry.mistake_ids) for entry in entries]),
+            'mistake_ids': flat([entry.mistake_ids for entry in entries], np.int64),
+        }
+
+
+def load_archive(school_id, year):
+    path = archive_path(school_id, year)
+    try:
+        key = (str(path), path.stat().st_mtime_ns)
+    except FileNotFoundError:
+        return None
+    archive = local_archives.get(key)
+    if archive is None:
+        archive = ArchiveFile.read(path)
+        local_archives.set(key, archive)
+    return archive
+
+
+def write_archive(school_id, year, entries):
+    """
+    Дописывает попытки в файл школы за год. Попытки, уже лежащие в файле, заменяются новыми — повторный
+    запуск после сбоя между записью файла и очисткой таблиц не даёт дублей. Файл подменяется атомарно.
+    """
+    path = archive_path(school_id, year)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    entries = list(entries)
+    if path.exists():
+        replaced = {entry.result_id for entry in entries}
+        entries += [entry for entry in ArchiveFile.read(path).entries() if entry.result_id not in replaced]
+
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix='.npz', delete=False) as file:
+        np.savez_compressed(file, **ArchiveFile.build(entries))
+    os.replace(file.name, path)
+    return len(entries)
+
+
+def archived_entry(school_id, date_taken, result_id):
+    archive = load_archive(school_id, school_year(date_taken))
+    return archive.entry(result_id) if archive is not None else None
+
+
+def archived_test_rows(school_id, test_id):
+    """Архивные ответы теста по учебным годам: пары (строки, id результатов строк), см. ArchiveFile.test_rows."""
+    for year in archive_years(school_id):
+        archive = load_archive(school_id, year)
+        if archive is not None:
+            rows, result_ids = archive.test_rows(test_id)
+            if len(rows):
+                yield rows, result_ids
@@ -0,0 +1,60 @@
+"""
+Асинхронные представления только для чтения.
+
+DRF 3.14 не поддерживает async-представления, поэтому горячие GET-эндпоинты — обычные async View Django
+поверх тех же частей DRF: аутентификация ProfileClaimsAuthentication.aauthenticate, ответ рендерится
+JSONRenderer, ошибки отдаются в формате DRF ({"detail": ...}). Запросы к БД и кэшу идут через async API
+Django, поэтому под ASGI (SchoolTestDjangoProject/asgi.py) процесс не держит поток на время ожидания.
+Под WSGI эти представления тоже работают: Django выполняет их через async_to_sync.
+"""
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from django.views import View
+from rest_framework import exceptions, status
+from rest_framework.renderers import JSONRenderer
+
+from register.authentication import ProfileClaimsAuthentication
+from .cache import check_not_modified, set_validators
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(JSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+async def aconditional_response(request, build, etag, last_modified=None):
+    """Как cache.conditional_response; build — функция, возвращающая корутину с данными ответа."""
+    timestamp, not_modified = check_not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    return set_validators(json_response(await build()), etag, timestamp)
+
+
+class AsyncAPIView(View):
+    authentication_class = ProfileClaimsAuthentication
+    authentication_required = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            await self.authenticate(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except Http404:
+            return self.error_response(request, exceptions.NotFound())
+        except exceptions.APIException as exc:
+            return self.error_response(request, exc)
+
+    async def authenticate(self, request):
+        """Как DRF: неверный токен — 401 даже для открытых эндпоинтов, отсутствие токена — аноним."""
+        result = await self.authentication_class().aauthenticate(request)
+        request.user, request.auth = result if result is not None else (AnonymousUser(), None)
+        if self.authentication_required and result is None:
+            raise exceptions.NotAuthenticated()
+
+    def http_method_not_allowed(self, request, *args, **kwargs):
+        raise exceptions.MethodNotAllowed(request.method)
+
+    def error_response(self, request, exc):
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        response = json_response(data, exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response['WWW-Authenticate'] = self.authentication_class().authenticate_header(request)
+        return response
@@ -0,0 +1,164 @@
+"""
+Импорт теста целиком: вопросы, варианты ответов, правильные ответы и изображения.
+
+Документ теста — JSON вида
+    {"name": ..., "subject": id, "school": id, "description": ...,
+     "questions": [{"text": ..., "feedback": ..., "image": "имя файла",
+                    "options": [{"text": ..., "is_correct": true}, ...]}, ...]}
+или CSV, где каждая строка — вопрос: столбцы text, feedback, image, option_1 ... option_N и correct
+(номера или буквы правильных вариантов через запятую). Изображения передаются отдельными файлами,
+в документе указывается имя файла.
+
+Тест записывается в одной транзакции: номера вопросов резервируются одним блоком
+(allocate_question_numbers), вопросы и варианты вставляются пакетно, поэтому число запросов
+не зависит от количества вопросов. bulk_create не вызывает post_save, поэтому после фиксации транзакции
+отправляется сигнал questions_imported (по нему, например, строятся копии изображений).
+"""
+import csv
+import io
+import json
+import os
+from functools import partial
+
+from django.db import transaction
+from django.dispatch import Signal
+
+from .models import Test, Question, AnswerOption, allocate_question_numbers
+
+LETTERS = 'АБВГДЕЖЗ'
+LATIN_LETTERS = 'ABCDEFGH'
+
+CSV_COLUMNS = {
+    'text': 'text',
+    'вопрос': 'text',
+    'feedback': 'feedback',
+    'пояснение': 'feedback',
+    'image': 'image',
+    'изображение': 'image',
+    'correct': 'correct',
+    'правильный': 'correct',
+    'правильные': 'correct',
+}
+
+
+questions_imported = Signal()
+
+
+class AuthoringError(Exception):
+    pass
+
+
+def _option_column(name):
+    return name.startswith('option') or name.startswith('вариант')
+
+
+def _correct_indexes(value, row_number):
+    indexes = set()
+    for part in str(value or '').replace(';', ',').split(','):
+        part = part.strip().upper()
+        if not part:
+            continue
+        if part.isdigit():
+            indexes.add(int(part) - 1)
+        elif part in LETTERS:
+            indexes.add(LETTERS.index(part))
+        elif part in LATIN_LETTERS:
+            indexes.add(LATIN_LETTERS.index(part))
+        else:
+            raise AuthoringError(f'Строка {row_number}: не удалось разобрать правильный ответ «{part}».')
+    return indexes
+
+
+def parse_questions_csv(file):
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(text, dialect)
+
+    try:
+        header = [cell.strip().lower() for cell in next(reader)]
+    except StopIteration:
+        raise AuthoringError('Файл пуст.')
+    if 'text' not in {CSV_COLUMNS.get(name) for name in header}:
+        raise AuthoringError('В заголовке нет столбца text.')
+
+    questions = []
+    for row_number, row in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        question = {'options': []}
+        correct = ''
+        for name, cell in zip(header, row):
+            if _option_column(name):
+                if cell.strip():
+                    question['options'].append({'text': cell.strip(), 'is_correct': False})
+            elif CSV_COLUMNS.get(name) == 'correct':
+                correct = cell
+            elif name in CSV_COLUMNS:
+                question[CSV_COLUMNS[name]] = cell.strip()
+        for index in _correct_indexes(correct, row_number):
+            if index >= len(question['options']):
+                raise AuthoringError(f'Строка {row_number}: правильный вариант {index + 1} не заполнен.')
+            question['options'][index]['is_correct'] = True
+        questions.append(question)
+    return {'questions': questions}
+
+
+def load_test_document(file, name=None):
+    """Читает документ теста из файла JSON или CSV."""
+    extension = os.path.splitext(name or getattr(file, 'name', '') or '')[1].lower()
+    if extension == '.csv':
+        return parse_questions_csv(file)
+    if extension == '.json':
+        try:
+            document = json.load(io.TextIOWrapper(file, encoding='utf-8-sig'))
+        except ValueError as e:
+            raise AuthoringError(f'Некорректный JSON: {e}')
+        if not isinstance(document, dict):
+            raise AuthoringError('Документ теста должен быть JSON-объектом.')
+        return document
+    raise AuthoringError('Поддерживаются файлы JSON и CSV.')
+
+
+def referenced_images(document):
+    return {question.get('image') for question in document.get('questions', []) if question.get('image')}
+
+
+@transaction.atomic
+def import_test(data, created_by, files=None):
+    """
+    Создаёт тест по проверенным данным (см. TestImportSerializer).
+    files — словарь «имя файла → файл» для изображений вопросов.
+    """
+    files = files or {}
+    test = Test.objects.create(
+        name=data['name'],
+        subject=data['subject'],
+        school=data['school'],
+        description=data.get('description', ''),
+        created_by_id=created_by.pk,
+    )
+
+    numbers = allocate_question_numbers(test.id, len(data['questions']))
+    questions = Question.objects.bulk_create([
+        Question(
+            test=test,
+            number=number,
+            text=question['text'],
+            feedback=question.get('feedback', ''),
+            image=files[question['image']] if question.get('image') else '',
+        )
+        for number, question in zip(numbers, data['questions'])
+    ])
+
+    AnswerOption.objects.bulk_create([
+        AnswerOption(question_id=question.id, text=option['text'], is_correct=option['is_correct'])
+        for question, question_data in zip(questions, data['questions'])
+        for option in question_data['options']
+    ])
+    transaction.on_commit(partial(questions_imported.send, sender=Test, test=test, questions=questions))
+    return test
@@ -0,0 +1,82 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш в памяти процесса."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def cached_payload(key, build, timeout):
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, timeout)
+    return data
+
+
+async def acached_payload(key, build, timeout):
+    """То же для async-представлений; build — функция, возвращающая корутину."""
+    data = await cache.aget(key)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, timeout)
+    return data
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def check_not_modified(request, etag, last_modified=None):
+    """(timestamp, ответ 304 или None) для валидаторов ETag/Last-Modified из запроса клиента."""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return timestamp, get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag, timestamp=None):
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional_response(request, build, etag, last_modified=None):
+    """Отдаёт 304, если клиент прислал актуальные ETag/Last-Modified, иначе ответ с этими заголовками."""
+    timestamp, not_modified = check_not_modified(request, etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    return set_validators(Response(build()), etag, timestamp)
@@ -0,0 +1,122 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Recommendation, RecommendationDelivery
+from .sms import get_sms_sender
+from .workers import poll
+
+logger = logging.getLogger(__name__)
+
+
+def recipients(recommendation):
+    """Ученики класса, у которых есть результат по предмету в школе в диапазоне процентов рекомендации."""
+    return User.objects.filter(
+        profile__school_id=recommendation.school_id,
+        profile__class_number=recommendation.class_number,
+        profile__role='student',
+        result__test__school_id=recommendation.school_id,
+        result__test__subject_id=recommendation.subject_id,
+        result__percentage__gte=recommendation.min_percentage,
+        result__percentage__lte=recommendation.max_percentage,
+    ).values_list('id', 'profile__phone_number').distinct().order_by('id')
+
+
+def create_deliveries(recommendation, batch_size):
+    """Строит список получателей одним запросом и записывает его пачками; повторный вызов ничего не дублирует."""
+    rows = recipients(recommendation).iterator(chunk_size=batch_size)
+    batch = []
+    for student_id, phone_number in rows:
+        batch.append(RecommendationDelivery(
+            recommendation_id=recommendation.id, student_id=student_id, phone_number=phone_number or ''
+        ))
+        if len(batch) >= batch_size:
+            RecommendationDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        RecommendationDelivery.objects.bulk_create(batch, ignore_conflicts=True)
+
+    total = RecommendationDelivery.objects.filter(recommendation_id=recommendation.id).count()
+    Recommendation.objects.filter(id=recommendation.id).update(total_students=total)
+    return total
+
+
+def claim_recommendation():
+    """Забирает одну рекомендацию из очереди; зависшие дольше RECOMMENDATION_LOCK_TIMEOUT возвращаются в работу."""
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.RECOMMENDATION_LOCK_TIMEOUT)
+    with transaction.atomic():
+        recommendation = Recommendation.objects.select_for_update(skip_locked=True) \
+            .filter(Q(status=Recommendation.PENDING) | Q(status=Recommendation.PROCESSING, locked_at__lt=stale)) \
+            .order_by('created_at').first()
+        if recommendation is None:
+            return None
+        Recommendation.objects.filter(id=recommendation.id).update(status=Recommendation.PROCESSING, locked_at=now)
+    return recommendation
+
+
+def message_text(recommendation):
+    return f'{recommendation.message} {recommendation.link}' if recommendation.link else recommendation.message
+
+
+def send_deliveries(recommendation, batch_size, sender=None):
+    """
+    Отправляет ожидающие доставки пачками и после каждой пачки записывает итог. Итог записывается и тогда, когда
+    отправитель упал посреди пачки: уже отправленные сообщения не останутся в очереди и не уйдут повторно.
+    """
+    sender = sender or get_sms_sender()
+    text = message_text(recommendation)
+    pending = RecommendationDelivery.objects.filter(
+        recommendation_id=recommendation.id, status=RecommendationDelivery.PENDING
+    ).order_by('id')
+
+    while batch := list(pending.values_list('id', 'phone_number')[:batch_size]):
+        errors = []
+        try:
+            for error in sender.send_many([(phone_number, text) for _, phone_number in batch]):
+                errors.append(error)
+        finally:
+            record_results(recommendation, [delivery_id for delivery_id, _ in batch], errors)
+
+
+def record_results(recommendation, delivery_ids, errors):
+    """Записывает итог отправленной части пачки тремя запросами, сколько бы в ней ни было ошибок."""
+    now = timezone.now()
+    sent_ids = [delivery_id for delivery_id, error in zip(delivery_ids, errors) if error is None]
+    failed = [
+        RecommendationDelivery(id=delivery_id, status=RecommendationDelivery.FAILED, error=error)
+        for delivery_id, error in zip(delivery_ids, errors) if error is not None
+    ]
+
+    with transaction.atomic():
+        RecommendationDelivery.objects.filter(id__in=sent_ids).update(status=RecommendationDelivery.SENT, sent_at=now)
+        RecommendationDelivery.objects.bulk_update(failed, ['status', 'error'])
+        Recommendation.objects.filter(id=recommendation.id).update(
+            sent_count=F('sent_count') + len(sent_ids), failed_count=F('failed_count') + len(failed), locked_at=now
+        )
+
+
+def process_recommendation(recommendation, batch_size, sender=None):
+    try:
+        create_deliveries(recommendation, batch_size)
+        send_deliveries(recommendation, batch_size, sender)
+        status, error = Recommendation.DONE, ''
+    except Exception as e:
+        logger.exception('Не удалось разослать рекомендацию %s', recommendation.id)
+        status, error = Recommendation.FAILED, str(e)
+    Recommendation.objects.filter(id=recommendation.id).update(
+        status=status, error=error, locked_at=None, finished_at=timezone.now()
+    )
+
+
+def run_worker(batch_size=None, poll_interval=None, once=False):
+    batch_size = batch_size or settings.RECOMMENDATION_BATCH_SIZE
+    poll_interval = poll_interval or settings.RECOMMENDATION_POLL_INTERVAL
+    sender = get_sms_sender()
+    poll(claim_recommendation, lambda recommendation: process_recommendation(recommendation, batch_size, sender),
+         poll_interval, once)
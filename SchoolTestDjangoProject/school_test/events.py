@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.db.models import F
+
+from register.models import School
+from .cache import acached_payload, cached_payload
+from .models import Event
+from .serializers import EventSerializer
+
+
+def event_feed_cache_key(school_id, class_number, version):
+    return f'event_feed:{school_id}:{class_number}:{version}'
+
+
+def event_feed_version(school_id):
+    return School.objects.filter(pk=school_id).values_list('event_feed_version', flat=True)
+
+
+def class_events(school_id, class_number):
+    return Event.objects.filter(school_id=school_id, class_number=class_number).order_by('id')
+
+
+def get_event_feed(school_id, class_number):
+    """
+    События класса одним запросом на класс: лента общая для всех учеников (школа, класс) и лежит в кэше
+    под версией ленты школы из БД, поэтому изменение события видно всем процессам сразу.
+    """
+    return cached_payload(
+        event_feed_cache_key(school_id, class_number, event_feed_version(school_id).first()),
+        lambda: EventSerializer(class_events(school_id, class_number), many=True).data,
+        settings.EVENT_FEED_CACHE_TIMEOUT
+    )
+
+
+async def aget_event_feed(school_id, class_number):
+    async def build():
+        return EventSerializer([event async for event in class_events(school_id, class_number)], many=True).data
+
+    version = await event_feed_version(school_id).afirst()
+    return await acached_payload(
+        event_feed_cache_key(school_id, class_number, version), build, settings.EVENT_FEED_CACHE_TIMEOUT
+    )
+
+
+def invalidate_event_feed(school_id):
+    """Делает неактуальными ленты всех классов школы: старые записи кэша просто перестают читаться."""
+    School.objects.filter(pk=school_id).update(event_feed_version=F('event_feed_version') + 1)
+
+
+def complete_event(result, profile):
+    """Отмечает событие класса пройденным одним UPDATE; уже пройденные события не трогает."""
+    updated = Event.objects.filter(
+        test_id=result.test_id, school_id=profile.school_id, class_number=profile.class_number, is_completed=False
+    ).update(is_completed=True)
+    if updated:
+        invalidate_event_feed(profile.school_id)
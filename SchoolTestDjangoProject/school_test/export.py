@@ -0,0 +1,180 @@
+"""
+Потоковая выгрузка результатов и листов ответов в CSV/XLSX.
+
+Строки читаются из БД через iterator() (на Postgres — серверный курсор) пачками по EXPORT_CHUNK_SIZE
+и сразу же пишутся в ответ, поэтому память не зависит от объёма выгрузки. CSV отдаётся
+StreamingHttpResponse; XLSX пишется openpyxl в режиме write_only во временный файл и отдаётся с диска.
+Под ASGI синхронный поток ответа Django собрал бы в список целиком, поэтому там CSV отдаётся асинхронным
+итератором (aiter_chunks).
+Ответы попыток, перенесённых в холодный архив, читаются из его файлов (school_test/archive.py).
+"""
+import csv
+import io
+import tempfile
+from datetime import datetime
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .answer_storage import StoredSheet
+from .archive import archived_entry
+from .models import Result, Answer, AnswerSheet, AnswerOption, Question
+
+RESULT_COLUMNS = [
+    ('ID результата', 'id'),
+    ('ID ученика', 'student_id'),
+    ('Ученик', 'student__profile__name'),
+    ('Класс', 'student__profile__class_number'),
+    ('Буква', 'student__profile__class_letter'),
+    ('ID теста', 'test_id'),
+    ('Тест', 'test__name'),
+    ('Предмет', 'test__subject__name'),
+    ('Процент', 'percentage'),
+    ('Правильных', 'correct_answers_count'),
+    ('Неправильных', 'not_correct_answers_count'),
+    ('Всего вопросов', 'total_questions_count'),
+    ('Дата прохождения', 'date_taken'),
+]
+
+ANSWER_COLUMNS = [
+    ('ID результата', 'result_id'),
+    ('ID ученика', 'student_id'),
+    ('Ученик', 'student__profile__name'),
+    ('Класс', 'student__profile__class_number'),
+    ('Буква', 'student__profile__class_letter'),
+    ('ID теста', 'test_id'),
+    ('Номер вопроса', 'question__number'),
+    ('ID вопроса', 'question_id'),
+    ('ID варианта', 'selected_option_id'),
+    ('Выбранный вариант', 'selected_option__text'),
+    ('Верно', 'is_correct'),
+]
+
+
+def filter_rows(queryset, school_id=None, test_id=None, class_number=None):
+    if school_id is not None:
+        queryset = queryset.filter(test__school_id=school_id)
+    if test_id is not None:
+        queryset = queryset.filter(test_id=test_id)
+    if class_number:
+        queryset = queryset.filter(student__profile__class_number=class_number)
+    return queryset
+
+
+def result_rows(**filters):
+    return filter_rows(Result.objects.all(), **filters).order_by('id') \
+        .values_list(*[field for _, field in RESULT_COLUMNS]) \
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def _sheet_rows(sheets):
+    """Разворачивает листы (столбцы ученика, test_id, StoredSheet) в строки ANSWER_COLUMNS."""
+    numbers, option_texts = {}, {}
+    for student, test_id, sheet in sheets:
+        if test_id not in numbers:
+            numbers[test_id] = dict(Question.objects.filter(test_id=test_id).values_list('id', 'number'))
+            option_texts[test_id] = dict(
+                AnswerOption.objects.filter(question__test_id=test_id).values_list('id', 'text')
+            )
+        for question_id, option_id, is_correct in sheet:
+            yield (*student, test_id, numbers[test_id].get(question_id), question_id, option_id,
+                   option_texts[test_id].get(option_id), is_correct)
+
+
+def packed_sheets(**filters):
+    sheets = filter_rows(AnswerSheet.objects.all(), **filters).order_by('result_id').values_list(
+        'result_id', 'student_id', 'student__profile__name', 'student__profile__class_number',
+        'student__profile__class_letter', 'test_id', 'questions', 'options', 'mistakes'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    for *student, test_id, questions, options, mistakes in sheets:
+        yield student, test_id, StoredSheet.from_packed(questions, options, mistakes)
+
+
+def archived_sheets(**filters):
+    results = filter_rows(Result.objects.filter(archived=True), **filters).order_by('id').values_list(
+        'id', 'student_id', 'student__profile__name', 'student__profile__class_number',
+        'student__profile__class_letter', 'test_id', 'test__school_id', 'date_taken'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    for *student, test_id, school_id, date_taken in results:
+        entry = archived_entry(school_id, date_taken, student[0])
+        if entry is not None:
+            yield student, test_id, StoredSheet.from_archived(entry)
+
+
+def answer_rows(**filters):
+    """Строки Answer, затем развёрнутые упакованные листы AnswerSheet и архивные ответы в тех же столбцах."""
+    yield from filter_rows(Answer.objects.all(), **filters).order_by('id') \
+        .values_list(*[field for _, field in ANSWER_COLUMNS]) \
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    yield from _sheet_rows(packed_sheets(**filters))
+    yield from _sheet_rows(archived_sheets(**filters))
+
+
+def export_rows(answers=False, **filters):
+    """Заголовок и поток строк выгрузки: результаты или, при answers=True, ответы по вопросам."""
+    if answers:
+        return [title for title, _ in ANSWER_COLUMNS], answer_rows(**filters)
+    return [title for title, _ in RESULT_COLUMNS], result_rows(**filters)
+
+
+def _cell(value):
+    if isinstance(value, datetime):
+        return timezone.localtime(value).replace(tzinfo=None) if timezone.is_aware(value) else value
+    return value
+
+
+def iter_csv(header, rows):
+    """Отдаёт CSV кусками по EXPORT_CHUNK_SIZE строк."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(header)
+    while chunk := list(islice(rows, settings.EXPORT_CHUNK_SIZE)):
+        writer.writerows([[_cell(value) for value in row] for row in chunk])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+async def aiter_chunks(chunks):
+    """Забирает куски синхронного генератора по одному в том потоке, где выполнялось представление и открыт курсор."""
+    next_chunk = sync_to_async(next)
+    try:
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(chunks.close)()
+
+
+def write_xlsx(header, rows, title='Выгрузка'):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title)
+    sheet.append(header)
+    for row in rows:
+        sheet.append([_cell(value) for value in row])
+    file = tempfile.TemporaryFile()
+    workbook.save(file)
+    file.seek(0)
+    return file
+
+
+def export_response(header, rows, filename, file_format='csv', asynchronous=False):
+    """asynchronous — запрос обслуживает ASGI-сервер: CSV тогда отдаётся асинхронным итератором."""
+    if file_format == 'xlsx':
+        return FileResponse(
+            write_xlsx(header, rows), as_attachment=True, filename=f'{filename}.xlsx',
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+    chunks = iter_csv(header, rows)
+    response = StreamingHttpResponse(
+        aiter_chunks(chunks) if asynchronous else chunks, content_type='text/csv; charset=utf-8'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
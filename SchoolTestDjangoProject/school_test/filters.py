@@ -0,0 +1,13 @@
+import django_filters
+
+from .models import Test
+
+
+class TestFilter(django_filters.FilterSet):
+    """Фильтры по id: ModelChoiceFilter проверял бы существование школы и предмета отдельными запросами."""
+    school = django_filters.NumberFilter(field_name='school_id')
+    subject = django_filters.NumberFilter(field_name='subject_id')
+
+    class Meta:
+        model = Test
+        fields = ['school', 'subject']
@@ -0,0 +1,188 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import LRUCache
+from .answer_storage import save_answers
+from .models import Question, AnswerOption, Result, TestHistory, SchoolHistory
+from .rollups import update_rollup
+
+
+class AnswerKey:
+    """Ключ ответов теста: вопросы, правильные варианты и принадлежность вариантов вопросам."""
+
+    def __init__(self, test_id, version, questions, options):
+        self.test_id = test_id
+        self.version = version
+        self.question_ids = [question_id for question_id, _ in questions]
+        self.question_texts = dict(questions)
+        self.option_question = {option_id: question_id for option_id, question_id, _ in options}
+        self.correct_options = {option_id for option_id, _, is_correct in options if is_correct}
+
+    @classmethod
+    def load(cls, test_id, version=None):
+        questions = list(
+            Question.objects.filter(test_id=test_id).order_by('number', 'id').values_list('id', 'text')
+        )
+        options = list(
+            AnswerOption.objects.filter(question__test_id=test_id).values_list('id', 'question_id', 'is_correct')
+        )
+        return cls(test_id, version, questions, options)
+
+    def __len__(self):
+        return len(self.question_ids)
+
+
+local_answer_keys = LRUCache(settings.ANSWER_KEY_CACHE_SIZE)
+
+
+def answer_key_cache_key(test_id, version):
+    return f'answer_key:{test_id}:{version}'
+
+
+def get_answer_key(test):
+    """
+    Ключ ответов по версии содержимого теста: сначала LRU процесса, затем общий кэш, затем БД.
+    Версия увеличивается сигналами при изменении вопросов и вариантов, поэтому устаревший ключ не найдётся.
+    """
+    cached = local_answer_keys.get(test.id)
+    if cached is not None and cached.version == test.content_version:
+        return cached
+
+    cache_key = answer_key_cache_key(test.id, test.content_version)
+    key = cache.get(cache_key)
+    if key is None:
+        key = AnswerKey.load(test.id, test.content_version)
+        cache.set(cache_key, key, settings.ANSWER_KEY_CACHE_TIMEOUT)
+    local_answer_keys.set(test.id, key)
+    return key
+
+
+def invalidate_answer_key(test_id, version):
+    local_answer_keys.delete(test_id)
+    cache.delete(answer_key_cache_key(test_id, version))
+
+
+class GradedSheet:
+    def __init__(self, key, answers):
+        self.key = key
+        self.answers = []
+        self.mistakes = []
+        for answer in answers:
+            question_id = answer['question_id']
+            option_id = answer['selected_option_id']
+            is_correct = option_id in key.correct_options
+            self.answers.append((question_id, option_id, is_correct))
+            if not is_correct:
+                self.mistakes.append(question_id)
+
+    @property
+    def total_questions_count(self):
+        return len(self.key)
+
+    @property
+    def correct_answers_count(self):
+        return len(self.answers) - len(self.mistakes)
+
+    @property
+    def not_correct_answers_count(self):
+        return len(self.mistakes)
+
+    @property
+    def percentage(self):
+        if not self.total_questions_count:
+            return 0
+        return (self.correct_answers_count / self.total_questions_count) * 100
+
+
+def check_answers(key, answers):
+    """Возвращает список ошибок листа ответов; пустой список — лист можно оценивать."""
+    errors = []
+    seen = set()
+    for answer in answers:
+        question_id = answer.get('question_id')
+        option_id = answer.get('selected_option_id')
+        if question_id is None or option_id is None:
+            errors.append("Каждый ответ должен содержать 'question_id' и 'selected_option_id'.")
+            continue
+        if question_id not in key.question_texts:
+            errors.append(f"Вопрос с ID {question_id} не принадлежит тесту.")
+            continue
+        if question_id in seen:
+            errors.append(f"На вопрос с ID {question_id} дано несколько ответов.")
+            continue
+        seen.add(question_id)
+        if key.option_question.get(option_id) != question_id:
+            errors.append(f"Вариант ответа с ID {option_id} не относится к вопросу с ID {question_id}.")
+    return errors
+
+
+def missing_questions(key, answers):
+    provided = {answer.get('question_id') for answer in answers}
+    return [key.question_texts[question_id] for question_id in key.question_ids if question_id not in provided]
+
+
+def stored_percentage(value):
+    """Процент, округлённый так же, как его сохраняет Result.percentage, — читать его обратно из БД не нужно."""
+    field = Result._meta.get_field('percentage')
+    return field.to_python(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+
+
+def grade_submission(user, test, key, answers, profile=None):
+    """
+    Оценивает лист ответов целиком в памяти и сохраняет его пакетными запросами.
+    profile — школа и класс ученика (например, claims из токена); по умолчанию берётся user.profile.
+    """
+    sheet = GradedSheet(key, answers)
+    profile = profile or user.profile
+    percentage = stored_percentage(sheet.percentage)
+
+    with transaction.atomic():
+        result = Result.objects.create(
+            student_id=user.id,
+            test=test,
+            school_id=profile.school_id,
+            class_number=profile.class_number or '',
+            percentage=sheet.percentage,
+            correct_answers_count=sheet.correct_answers_count,
+            not_correct_answers_count=sheet.not_correct_answers_count,
+            total_questions_count=sheet.total_questions_count
+        )
+
+        save_answers(result, sheet)
+
+        update_histories(user, profile, result, percentage)
+        update_rollup(result, test.subject_id, percentage)
+
+    return result
+
+
+def update_histories(user, profile, result, percentage):
+    """Обновляет накопительные суммы истории ученика и школы за O(1) на результат."""
+    test_history, created = TestHistory.objects.select_for_update().get_or_create(student_id=user.id)
+
+    if not test_history.full_name:
+        test_history.full_name = user.profile.name
+
+    test_history.results.add(result)
+    test_history.results_count += 1
+    test_history.percentage_sum += percentage
+    test_history.average_percentage = test_history.percentage_sum / test_history.results_count
+    test_history.save()
+
+    school_history, created = SchoolHistory.objects.select_for_update().get_or_create(
+        school_id=profile.school_id
+    )
+
+    if not school_history.students.filter(pk=user.id).exists():
+        school_history.students.add(user.id)
+        school_history.total_students += 1
+
+    school_history.results.add(result)
+    school_history.results_count += 1
+    school_history.percentage_sum += percentage
+    school_history.average_percentage = school_history.percentage_sum / school_history.results_count
+    school_history.save()
+
@@ -0,0 +1,149 @@
+"""
+Уменьшенные копии изображений вопросов.
+
+После сохранения вопроса с новым изображением (и после импорта теста) его id передаётся фоновому потоку:
+поток читает исходник из хранилища, отдаёт байты в пул процессов Pillow (school_test/imaging.py) и сохраняет
+копии QUESTION_IMAGE_WIDTHS × QUESTION_IMAGE_FORMATS как QuestionImageVariant. Запрос обработки не ждёт.
+Когда копии готовы, увеличивается версия копий теста (media_version, не content_version: ключ ответов
+не меняется), и GET /tests/<id>/ отдаёт их в image_variants. Пул создаётся при первом использовании в каждом
+процессе: после fork (gunicorn, uwsgi) дочерний процесс забывает пул родителя и при необходимости создаёт свой.
+Уже загруженные изображения обрабатывает `python manage.py generate_image_variants`.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authoring import questions_imported
+from .imaging import render_variants
+from .models import Question, QuestionImageVariant
+from .signals import touch_test_media
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_process_pool = None
+_background = None
+
+
+def create_process_pool(workers=None):
+    """Пул процессов Pillow; spawn, чтобы не копировать fork'ом потоки и соединения веб-процесса."""
+    return ProcessPoolExecutor(workers or settings.QUESTION_IMAGE_WORKERS,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+def _forget_pools():
+    """Пул и поток родителя в дочернем процессе после fork непригодны: их процессы и потоки остались в родителе."""
+    global _lock, _process_pool, _background
+    _lock = threading.Lock()
+    _process_pool = _background = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_pools)
+
+
+def _pools():
+    global _process_pool, _background
+    with _lock:
+        if _process_pool is None:
+            _process_pool = create_process_pool()
+            _background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='question-images')
+        return _process_pool, _background
+
+
+def render_arguments(question):
+    """Аргументы render_variants для вопроса: байты исходника и настройки копий."""
+    with question.image.open('rb') as file:
+        data = file.read()
+    return data, settings.QUESTION_IMAGE_WIDTHS, settings.QUESTION_IMAGE_FORMATS, settings.QUESTION_IMAGE_QUALITY
+
+
+def store_variants(question, source, rendered, touch=True):
+    """
+    Заменяет копии вопроса построенными по source. Если изображение вопроса за это время сменилось,
+    результат отбрасывается: копии нового изображения построит его собственная задача.
+    """
+    if Question.objects.filter(id=question.id).values_list('image', flat=True).first() != source:
+        return False
+
+    stem = os.path.splitext(os.path.basename(source))[0]
+    variants = []
+    for name, extension, width, height, data in rendered:
+        variant = QuestionImageVariant(question_id=question.id, source=source, format=name, width=width, height=height)
+        variant.file.save(f'{question.id}/{stem}_{width}.{extension}', ContentFile(data), save=False)
+        variants.append(variant)
+
+    with transaction.atomic():
+        QuestionImageVariant.objects.filter(question_id=question.id).delete()
+        QuestionImageVariant.objects.bulk_create(variants)
+    if touch:
+        touch_test_media(question.test_id)
+    return True
+
+
+def generate_variants(question_id, pool=None):
+    """Строит копии изображения вопроса: в пуле процессов, если он передан, иначе в текущем процессе."""
+    question = Question.objects.filter(id=question_id).only('id', 'test_id', 'image').first()
+    if question is None or not question.image:
+        return False
+    source = question.image.name
+    arguments = render_arguments(question)
+    rendered = pool.submit(render_variants, *arguments).result() if pool else render_variants(*arguments)
+    return store_variants(question, source, rendered)
+
+
+def _generate_all(question_ids, pool=None):
+    for question_id in question_ids:
+        try:
+            generate_variants(question_id, pool)
+        except Exception:
+            logger.exception('Не удалось построить копии изображения вопроса %s', question_id)
+
+
+def _run_in_background(question_ids, pool):
+    try:
+        _generate_all(question_ids, pool)
+    finally:
+        connection.close()
+
+
+def schedule_variants(question_ids):
+    """Ставит вопросы в очередь на построение копий; при QUESTION_IMAGE_ASYNC = False строит их сразу."""
+    question_ids = list(question_ids)
+    if not question_ids:
+        return
+    if not settings.QUESTION_IMAGE_ASYNC:
+        _generate_all(question_ids)
+        return
+    pool, background = _pools()
+    background.submit(_run_in_background, question_ids, pool)
+
+
+@receiver(post_save, sender=Question)
+def question_image_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if not instance.image:
+        QuestionImageVariant.objects.filter(question_id=instance.id).delete()
+    elif not QuestionImageVariant.objects.filter(question_id=instance.id, source=instance.image.name).exists():
+        transaction.on_commit(partial(schedule_variants, [instance.id]))
+
+
+@receiver(questions_imported)
+def test_imported(sender, questions, **kwargs):
+    schedule_variants([question.id for question in questions if question.image])
+
+
+@receiver(post_delete, sender=QuestionImageVariant)
+def variant_deleted(sender, instance, **kwargs):
+    if instance.file:
+        transaction.on_commit(partial(instance.file.storage.delete, instance.file.name))
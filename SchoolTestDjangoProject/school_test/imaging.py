@@ -0,0 +1,47 @@
+"""
+Построение уменьшенных копий изображения средствами Pillow.
+
+Модуль не зависит от Django: функции выполняются в дочерних процессах пула (school_test/images.py),
+получают байты исходника и возвращают байты копий, поэтому работают с любым хранилищем файлов.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'optimize': True, 'progressive': True}),
+}
+
+
+def target_widths(original_width, widths):
+    """Ширины копий: все из настройки меньше исходной и сама исходная, если она не больше максимальной."""
+    targets = {width for width in widths if width < original_width}
+    targets.add(min(original_width, max(widths)))
+    return sorted(targets)
+
+
+def _flatten(image):
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_variants(data, widths, formats, quality):
+    """Список (формат, расширение, ширина, высота, байты) для каждой пары ширина × формат."""
+    with Image.open(io.BytesIO(data)) as source:
+        image = _flatten(ImageOps.exif_transpose(source))
+
+    variants = []
+    for width in target_widths(image.width, widths):
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.Resampling.LANCZOS)
+        for name in formats:
+            pil_format, extension, options = FORMATS[name]
+            buffer = io.BytesIO()
+            resized.save(buffer, pil_format, quality=quality, **options)
+            variants.append((name, extension, width, height, buffer.getvalue()))
+    return variants
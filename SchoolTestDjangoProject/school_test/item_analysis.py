@@ -0,0 +1,138 @@
+"""
+Психометрический анализ заданий теста по матрице «ученик × вопрос».
+
+Ответы теста (строки Answer, упакованные листы AnswerSheet и архив) читаются потоком пачками и сразу
+раскладываются по матрицам NumPy, после чего все показатели считаются векторно:
+
+* difficulty — доля правильных ответов на вопрос (p-value);
+* discrimination — точечно-бисериальная корреляция ответа с баллом за остальные вопросы;
+* options — сколько учеников выбрали каждый вариант (для анализа дистракторов);
+* kr20 — надёжность теста по Кьюдеру — Ричардсону (KR-20).
+
+Если ученик проходил тест несколько раз, учитывается самый поздний по времени попытки ответ на каждый вопрос.
+"""
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .answer_storage import answer_arrays, answer_students
+from .grading import get_answer_key
+
+CHUNK_SIZE = 20000
+NOT_TAKEN = np.iinfo(np.int64).min
+
+
+def load_matrix(test, key):
+    """
+    Строит матрицы «ученик × вопрос»: правильность ответа и выбранный вариант (0 — нет ответа). Матрицы
+    выделяются заранее по списку учеников теста, и каждая пачка ответов сразу раскладывается по ним: в ячейку
+    попадает ответ, если он не старше уже записанного.
+    """
+    question_ids = np.asarray(key.question_ids, dtype=np.int64)
+    student_ids = np.unique(np.fromiter(answer_students(test.id), dtype=np.int64))
+    width = len(question_ids)
+    if not width or not len(student_ids):
+        return np.zeros((0, width), dtype=np.int8), np.zeros((0, width), dtype=np.int64)
+
+    order = np.argsort(question_ids)
+    sorted_ids = question_ids[order]
+    scores = np.zeros((len(student_ids), width), dtype=np.int8)
+    selected = np.zeros((len(student_ids), width), dtype=np.int64)
+    taken = np.full((len(student_ids), width), NOT_TAKEN, dtype=np.int64)
+
+    for data in answer_arrays(test.id, CHUNK_SIZE):
+        positions = np.minimum(np.searchsorted(sorted_ids, data[:, 1]), width - 1)
+        rows = np.minimum(np.searchsorted(student_ids, data[:, 0]), len(student_ids) - 1)
+        known = (sorted_ids[positions] == data[:, 1]) & (student_ids[rows] == data[:, 0])
+        data, cells = data[known], rows[known] * width + order[positions[known]]
+
+        latest = np.lexsort((data[:, 4], cells))
+        data, cells = data[latest], cells[latest]
+        last = np.append(cells[1:] != cells[:-1], True)
+        data, cells = data[last], cells[last]
+
+        newer = data[:, 4] >= taken.flat[cells]
+        data, cells = data[newer], cells[newer]
+        taken.flat[cells] = data[:, 4]
+        scores.flat[cells] = data[:, 3]
+        selected.flat[cells] = data[:, 2]
+
+    answered = (taken > NOT_TAKEN).any(axis=1)
+    return scores[answered], selected[answered]
+
+
+def point_biserial(scores):
+    """Корреляция каждого столбца с суммой остальных столбцов; nan там, где дисперсия нулевая."""
+    scores = scores.astype(np.float64)
+    rest = scores.sum(axis=1, keepdims=True) - scores
+    item = scores - scores.mean(axis=0)
+    rest = rest - rest.mean(axis=0)
+    denominator = np.sqrt((item ** 2).sum(axis=0) * (rest ** 2).sum(axis=0))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(denominator > 0, (item * rest).sum(axis=0) / denominator, np.nan)
+
+
+def kr20(scores):
+    students, questions = scores.shape
+    if students < 2 or questions < 2:
+        return None
+    p = scores.mean(axis=0)
+    variance = scores.sum(axis=1).var()
+    if variance == 0:
+        return None
+    return float(questions / (questions - 1) * (1 - (p * (1 - p)).sum() / variance))
+
+
+def _number(value):
+    return None if value is None or np.isnan(value) else round(float(value), 4)
+
+
+def analyze_test(test):
+    key = get_answer_key(test)
+    scores, selected = load_matrix(test, key)
+    students = scores.shape[0]
+
+    difficulty = scores.mean(axis=0) if students else np.full(len(key.question_ids), np.nan)
+    discrimination = point_biserial(scores) if students else np.full(len(key.question_ids), np.nan)
+    option_ids, option_counts = np.unique(selected[selected > 0], return_counts=True)
+    chosen = dict(zip(option_ids.tolist(), option_counts.tolist()))
+
+    options_by_question = {}
+    for option_id, question_id in sorted(key.option_question.items()):
+        options_by_question.setdefault(question_id, []).append(option_id)
+
+    totals = scores.sum(axis=1)
+    return {
+        'test': test.id,
+        'students': students,
+        'questions_count': len(key.question_ids),
+        'mean_score': _number(totals.mean()) if students else None,
+        'stddev_score': _number(totals.std()) if students else None,
+        'kr20': _number(kr20(scores)),
+        'questions': [
+            {
+                'question_id': question_id,
+                'difficulty': _number(difficulty[index]),
+                'discrimination': _number(discrimination[index]),
+                'options': [
+                    {
+                        'option_id': option_id,
+                        'is_correct': option_id in key.correct_options,
+                        'count': chosen.get(option_id, 0),
+                        'share': round(chosen.get(option_id, 0) / students, 4) if students else None,
+                    }
+                    for option_id in options_by_question.get(question_id, [])
+                ],
+            }
+            for index, question_id in enumerate(key.question_ids)
+        ],
+    }
+
+
+def cached_item_analysis(test, refresh=False):
+    cache_key = f'item_analysis:{test.id}:{test.content_version}'
+    data = None if refresh else cache.get(cache_key)
+    if data is None:
+        data = analyze_test(test)
+        cache.set(cache_key, data, settings.ITEM_ANALYSIS_CACHE_TIMEOUT)
+    return data
@@ -0,0 +1,129 @@
+from collections import defaultdict
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Exists, Min, OuterRef
+from django.utils import timezone
+
+from school_test.answer_storage import StoredSheet
+from school_test.archive import ArchivedEntry, school_year, school_year_start, write_archive
+from school_test.models import Answer, AnswerSheet, Result
+
+
+def awaiting_link():
+    """
+    Попытка без своих ответов в БД, когда у ученика по тесту есть ответы без ссылки на результат: это старые
+    ответы, которые pack_answers ещё не привязал. Архивировать её нельзя — pack_answers не трогает архивные
+    попытки, и эти ответы остались бы ничьими.
+    """
+    return Exists(Answer.objects.filter(
+        result__isnull=True, student_id=OuterRef('student_id'), test_id=OuterRef('test_id')
+    )) & ~Exists(Answer.objects.filter(result_id=OuterRef('pk'))) \
+        & ~Exists(AnswerSheet.objects.filter(result_id=OuterRef('pk')))
+
+
+class Command(BaseCommand):
+    help = ('Переносит ответы (Answer, AnswerSheet) и ошибки (Result.mistakes) попыток старше порога в сжатые файлы '
+            'холодного архива, по файлу на школу и учебный год. Результаты остаются в БД с отметкой archived, '
+            'их ответы API читает из архива. Попытки, чьи ответы ещё не привязаны к результату, пропускаются — '
+            'сначала привяжите их командой pack_answers. Если таблицы ответов секционированы (partition_answers), '
+            'секции архивных лет после переноса пусты и их можно удалить.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Дата ГГГГ-ММ-ДД; по умолчанию — начало текущего учебного года.')
+        parser.add_argument('--school', type=int, action='append', help='ID школы; по умолчанию — все школы.')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Результатов в одной транзакции.')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать попытки для переноса.')
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                cutoff = timezone.make_aware(datetime.strptime(options['before'], '%Y-%m-%d'))
+            except ValueError:
+                raise CommandError('Дата --before должна быть в формате ГГГГ-ММ-ДД.')
+        else:
+            cutoff = school_year_start(school_year(timezone.now()))
+        self.chunk_size = options['chunk_size']
+
+        results = Result.objects.filter(archived=False, date_taken__lt=cutoff)
+        if options['school']:
+            results = results.filter(test__school_id__in=options['school'])
+        unlinked = results.filter(awaiting_link()).count()
+        results = results.exclude(awaiting_link())
+        schools = results.values('test__school_id').annotate(first=Min('date_taken')).order_by('test__school_id')
+
+        total = 0
+        for row in schools:
+            school_id = row['test__school_id']
+            for year in range(school_year(row['first']), school_year(cutoff) + 1):
+                ids = list(
+                    results.filter(test__school_id=school_id, date_taken__gte=school_year_start(year),
+                                   date_taken__lt=min(school_year_start(year + 1), cutoff))
+                    .order_by('id').values_list('id', flat=True)
+                )
+                if not ids:
+                    continue
+                if not options['dry_run']:
+                    self.archive(school_id, year, ids)
+                total += len(ids)
+                self.stdout.write(f'Школа {school_id}, {year}/{year + 1} учебный год: попыток {len(ids)}')
+
+        if unlinked:
+            self.stdout.write(self.style.WARNING(
+                f'Пропущено попыток с непривязанными ответами: {unlinked}; выполните pack_answers и повторите перенос.'
+            ))
+        verb = 'К переносу' if options['dry_run'] else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(f'{verb} попыток: {total}'))
+
+    def chunks(self, ids):
+        for start in range(0, len(ids), self.chunk_size):
+            yield ids[start:start + self.chunk_size]
+
+    def archive(self, school_id, year, ids):
+        """Сначала файл, потом очистка таблиц: сбой между ними оставит данные в обоих местах, но не потеряет их."""
+        entries = []
+        for chunk in self.chunks(ids):
+            entries.extend(self.read_entries(chunk))
+        write_archive(school_id, year, entries)
+
+        for chunk in self.chunks(ids):
+            with transaction.atomic():
+                Result.objects.filter(id__in=chunk).update(archived=True)
+                Answer.objects.filter(result_id__in=chunk).delete()
+                AnswerSheet.objects.filter(result_id__in=chunk).delete()
+                Result.mistakes.through.objects.filter(result_id__in=chunk).delete()
+
+    def read_entries(self, result_ids):
+        answers = defaultdict(list)
+        for result_id, number, question_id, option_id, is_correct in Answer.objects \
+                .filter(result_id__in=result_ids) \
+                .values_list('result_id', 'question__number', 'question_id', 'selected_option_id', 'is_correct'):
+            answers[result_id].append((number or 0, question_id, option_id, is_correct))
+
+        mistakes = defaultdict(list)
+        for result_id, question_id in Result.mistakes.through.objects.filter(result_id__in=result_ids) \
+                .order_by('question__number', 'question_id').values_list('result_id', 'question_id'):
+            mistakes[result_id].append(question_id)
+
+        sheets = {
+            result_id: StoredSheet.from_packed(questions, options, wrong)
+            for result_id, questions, options, wrong in AnswerSheet.objects.filter(result_id__in=result_ids)
+            .values_list('result_id', 'questions', 'options', 'mistakes')
+        }
+
+        for result_id, student_id, test_id in Result.objects.filter(id__in=result_ids) \
+                .values_list('id', 'student_id', 'test_id'):
+            sheet = sheets.get(result_id)
+            if sheet is not None:
+                yield ArchivedEntry(result_id, student_id, test_id, sheet.question_ids, sheet.option_ids,
+                                    ~sheet.wrong, sheet.mistake_ids)
+                continue
+            rows = sorted(answers[result_id])
+            yield ArchivedEntry(
+                result_id, student_id, test_id,
+                [question_id for _, question_id, _, _ in rows],
+                [option_id for _, _, option_id, _ in rows],
+                [is_correct for _, _, _, is_correct in rows],
+                mistakes[result_id],
+            )
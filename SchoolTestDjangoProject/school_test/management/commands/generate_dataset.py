@@ -0,0 +1,279 @@
+import csv
+import io
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from register.models import School, Profile
+from school_test.answer_storage import pack_bits, pack_ids
+from school_test.models import (Subject, Test, Question, AnswerOption, Answer, AnswerSheet, Result, TestHistory,
+                                SchoolHistory)
+from school_test.rollups import rebuild_rollups
+
+CLASS_NUMBERS = ['5', '6', '7', '8', '9', '10', '11']
+CLASS_LETTERS = ['А', 'Б', 'В', 'Г']
+CITIES = ['Бишкек', 'Ош', 'Джалал-Абад', 'Каракол', 'Токмок', 'Нарын', 'Талас', 'Баткен']
+
+
+class BulkLoader:
+    """
+    Буферизует строки по моделям и сбрасывает их пачками: COPY на Postgres, executemany на остальных БД.
+    Первичные ключи назначаются заранее, чтобы связывать строки без повторного чтения.
+    """
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.use_copy = connection.vendor == 'postgresql'
+        self.buffers = {}
+        self.columns = {}
+        self.counts = {}
+        self.next_ids = {}
+
+    def next_id(self, model):
+        if model not in self.next_ids:
+            self.next_ids[model] = (model.objects.aggregate(max_id=Max('pk'))['max_id'] or 0) + 1
+        value = self.next_ids[model]
+        self.next_ids[model] += 1
+        return value
+
+    def add(self, model, **values):
+        if model not in self.columns:
+            self.columns[model] = list(values)
+            self.buffers[model] = []
+            self.counts[model] = 0
+        self.buffers[model].append(tuple(values.values()))
+        if len(self.buffers[model]) >= self.chunk_size:
+            self.flush(model)
+
+    def flush(self, model):
+        rows = self.buffers[model]
+        if not rows:
+            return
+        if self.use_copy:
+            self._copy(model, rows)
+        else:
+            self._insert(model, rows)
+        self.counts[model] += len(rows)
+        self.buffers[model] = []
+
+    def _insert(self, model, rows):
+        fields = [model._meta.get_field(name) for name in self.columns[model]]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        params = [
+            [field.get_db_prep_save(value, connection) for field, value in zip(fields, row)]
+            for row in rows
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+
+    def _copy(self, model, rows):
+        fields = [model._meta.get_field(name) for name in self.columns[model]]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([self._copy_value(value) for value in row])
+        buffer.seek(0)
+        sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        )
+        with connection.cursor() as cursor:
+            if hasattr(cursor, 'copy_expert'):
+                cursor.copy_expert(sql, buffer)
+            else:
+                with cursor.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+    @staticmethod
+    def _copy_value(value):
+        if value is None:
+            return '\\N'
+        if isinstance(value, (bytes, memoryview)):
+            return '\\x' + bytes(value).hex()
+        return value
+
+    def close(self):
+        for model in list(self.buffers):
+            self.flush(model)
+        if self.use_copy and self.next_ids:
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), list(self.next_ids)):
+                    cursor.execute(sql)
+
+
+class Command(BaseCommand):
+    help = ('Генерирует детерминированный набор данных для нагрузочного тестирования: школы, ученики, '
+            'тесты, ответы, результаты и истории.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--schools', type=int, default=10)
+        parser.add_argument('--students-per-school', type=int, default=100)
+        parser.add_argument('--subjects', type=int, default=8)
+        parser.add_argument('--tests-per-school', type=int, default=5)
+        parser.add_argument('--questions', type=int, default=20)
+        parser.add_argument('--options', type=int, default=4)
+        parser.add_argument('--attempt-rate', type=float, default=0.8,
+                            help='Доля учеников школы, прошедших каждый тест.')
+        parser.add_argument('--days', type=int, default=365 * 2,
+                            help='Период, на который распределяются даты прохождения.')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.now = timezone.now()
+        loader = BulkLoader(options['chunk_size'])
+
+        with transaction.atomic():
+            subject_ids = self.generate_subjects(loader)
+            for index in range(options['schools']):
+                self.generate_school(loader, index, subject_ids)
+                if (index + 1) % 10 == 0:
+                    self.stdout.write(f'Школ: {index + 1}/{options["schools"]}')
+            loader.close()
+            rebuild_rollups()
+
+        for model, count in loader.counts.items():
+            self.stdout.write(f'{model._meta.label}: {count}')
+        self.stdout.write(self.style.SUCCESS('Набор данных создан.'))
+
+    def generate_subjects(self, loader):
+        subject_ids = []
+        for index in range(self.options['subjects']):
+            subject_id = loader.next_id(Subject)
+            loader.add(Subject, id=subject_id, name=f'Предмет {index + 1}', updated_at=self.now)
+            subject_ids.append(subject_id)
+        return subject_ids
+
+    def generate_school(self, loader, index, subject_ids):
+        rng = self.rng
+        school_id = loader.next_id(School)
+        loader.add(School, id=school_id, name=f'Школа №{index + 1}', city=rng.choice(CITIES),
+                   event_feed_version=1)
+
+        author_id = self.generate_user(loader, school_id, 'Учитель', role='school_admin')
+        students = []
+        for _ in range(self.options['students_per_school']):
+            class_number = rng.choice(CLASS_NUMBERS)
+            user_id = self.generate_user(loader, school_id, 'Ученик', class_number=class_number)
+            students.append((user_id, class_number, rng.betavariate(4, 3)))
+
+        school_history_id = loader.next_id(SchoolHistory)
+        school_results = []
+        histories = {}
+
+        for _ in range(self.options['tests_per_school']):
+            test_id, created_at, questions = self.generate_test(loader, school_id, author_id, subject_ids)
+            for student_id, class_number, ability in students:
+                if rng.random() >= self.options['attempt_rate']:
+                    continue
+                date_taken = created_at + timedelta(seconds=rng.randint(0, 14 * 24 * 3600))
+                result_id, percentage = self.generate_result(
+                    loader, student_id, school_id, class_number, ability, test_id, questions,
+                    min(date_taken, self.now)
+                )
+                histories.setdefault(student_id, []).append((result_id, percentage))
+                school_results.append((result_id, student_id, percentage))
+
+        for student_id, results in histories.items():
+            history_id = loader.next_id(TestHistory)
+            total = sum(percentage for _, percentage in results)
+            loader.add(TestHistory, id=history_id, student_id=student_id, full_name=f'Ученик {student_id}',
+                       average_percentage=float(total / len(results)), results_count=len(results),
+                       percentage_sum=total)
+            for result_id, _ in results:
+                loader.add(TestHistory.results.through, testhistory_id=history_id, result_id=result_id)
+
+        if school_results:
+            total = sum(percentage for _, _, percentage in school_results)
+            loader.add(SchoolHistory, id=school_history_id, school_id=school_id, total_students=len(histories),
+                       average_percentage=float(total / len(school_results)),
+                       results_count=len(school_results), percentage_sum=total)
+            for result_id, _, _ in school_results:
+                loader.add(SchoolHistory.results.through, schoolhistory_id=school_history_id, result_id=result_id)
+            for student_id in histories:
+                loader.add(SchoolHistory.students.through, schoolhistory_id=school_history_id, user_id=student_id)
+
+    def generate_user(self, loader, school_id, title, role='student', class_number=None):
+        user_id = loader.next_id(User)
+        phone_number = f'+996{500000000 + user_id:09d}'
+        loader.add(User, id=user_id, username=f'user{phone_number}', password='!', is_superuser=False,
+                   is_staff=False, is_active=True, first_name='', last_name='', email='',
+                   date_joined=self.now)
+        loader.add(Profile, id=loader.next_id(Profile), user_id=user_id, phone_number=phone_number,
+                   name=f'{title} {user_id}', school_id=school_id, class_number=class_number,
+                   class_letter=self.rng.choice(CLASS_LETTERS) if class_number else None, role=role,
+                   token_version=1)
+        return user_id
+
+    def generate_test(self, loader, school_id, author_id, subject_ids):
+        rng = self.rng
+        test_id = loader.next_id(Test)
+        created_at = self.now - timedelta(days=rng.randint(0, self.options['days']))
+        loader.add(Test, id=test_id, name=f'Тест {test_id}', subject_id=rng.choice(subject_ids),
+                   description='Сгенерированный тест', school_id=school_id, created_by_id=author_id,
+                   created_at=created_at, content_version=1, media_version=1, content_updated_at=created_at,
+                   question_counter=self.options['questions'])
+
+        questions = []
+        for number in range(1, self.options['questions'] + 1):
+            question_id = loader.next_id(Question)
+            loader.add(Question, id=question_id, text=f'Вопрос {number} теста {test_id}', image='',
+                       test_id=test_id, number=number, feedback='')
+            option_ids = []
+            correct_index = rng.randrange(self.options['options'])
+            for option_index in range(self.options['options']):
+                option_id = loader.next_id(AnswerOption)
+                loader.add(AnswerOption, id=option_id, question_id=question_id, text=f'Вариант {option_index + 1}',
+                           is_correct=option_index == correct_index)
+                option_ids.append(option_id)
+            difficulty = rng.uniform(-0.25, 0.25)
+            questions.append((question_id, option_ids, option_ids[correct_index], difficulty))
+        return test_id, created_at, questions
+
+    def generate_result(self, loader, student_id, school_id, class_number, ability, test_id, questions, date_taken):
+        rng = self.rng
+        result_id = loader.next_id(Result)
+        answers = []
+        mistakes = []
+        for question_id, option_ids, correct_id, difficulty in questions:
+            is_correct = rng.random() < min(max(ability - difficulty, 0.05), 0.98)
+            selected_id = correct_id if is_correct else rng.choice([o for o in option_ids if o != correct_id])
+            answers.append((question_id, selected_id, is_correct))
+            if not is_correct:
+                mistakes.append(question_id)
+
+        total = len(questions)
+        correct = total - len(mistakes)
+        percentage = (Decimal(correct * 100) / total).quantize(Decimal('0.01'))
+        loader.add(Result, id=result_id, student_id=student_id, test_id=test_id, school_id=school_id,
+                   class_number=class_number, percentage=percentage, date_taken=date_taken,
+                   total_questions_count=total, correct_answers_count=correct,
+                   not_correct_answers_count=len(mistakes), archived=False)
+        if settings.ANSWER_STORAGE == 'packed':
+            loader.add(AnswerSheet, result_id=result_id, student_id=student_id, test_id=test_id,
+                       questions=pack_ids([question_id for question_id, _, _ in answers]),
+                       options=pack_ids([option_id for _, option_id, _ in answers]),
+                       mistakes=pack_bits([not is_correct for _, _, is_correct in answers]), created_at=date_taken)
+            return result_id, percentage
+
+        for question_id, option_id, is_correct in answers:
+            loader.add(Answer, id=loader.next_id(Answer), student_id=student_id, test_id=test_id, result_id=result_id,
+                       question_id=question_id, selected_option_id=option_id, is_correct=is_correct,
+                       created_at=date_taken)
+        for question_id in mistakes:
+            loader.add(Result.mistakes.through, result_id=result_id, question_id=question_id)
+        return result_id, percentage
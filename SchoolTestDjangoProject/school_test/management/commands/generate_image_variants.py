@@ -0,0 +1,67 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from school_test.images import create_process_pool, render_arguments, store_variants
+from school_test.imaging import render_variants
+from school_test.models import Question
+from school_test.signals import touch_test_media
+
+
+class Command(BaseCommand):
+    help = ('Строит уменьшенные копии изображений вопросов, у которых их ещё нет или они построены по прежнему '
+            'изображению. Изображения обрабатываются параллельно в пуле процессов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, action='append', help='ID теста; по умолчанию — все тесты.')
+        parser.add_argument('--force', action='store_true', help='Перестроить копии у всех вопросов с изображением.')
+        parser.add_argument('--workers', type=int, default=settings.QUESTION_IMAGE_WORKERS, help='Число процессов.')
+
+    def handle(self, *args, **options):
+        questions = Question.objects.exclude(image='').exclude(image__isnull=True) \
+            .only('id', 'test_id', 'image').order_by('id')
+        if options['test']:
+            questions = questions.filter(test_id__in=options['test'])
+        if not options['force']:
+            questions = questions.exclude(image_variants__source=F('image'))
+
+        self.done = self.failed = 0
+        self.tests = set()
+        in_flight = options['workers'] * 4
+        with create_process_pool(options['workers']) as pool:
+            pending = {}
+            for question in questions.iterator():
+                try:
+                    arguments = render_arguments(question)
+                except OSError as e:
+                    self.fail(question, e)
+                    continue
+                pending[pool.submit(render_variants, *arguments)] = (question, question.image.name)
+                if len(pending) >= in_flight:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        self.store(*pending.pop(future), future)
+            for future in list(pending):
+                self.store(*pending.pop(future), future)
+
+        for test_id in sorted(self.tests):
+            touch_test_media(test_id)
+        self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {self.done}, с ошибкой: {self.failed}'))
+
+    def store(self, question, source, future):
+        try:
+            rendered = future.result()
+        except Exception as e:
+            self.fail(question, e)
+            return
+        if store_variants(question, source, rendered, touch=False):
+            self.tests.add(question.test_id)
+            self.done += 1
+            if self.done % 100 == 0:
+                self.stdout.write(f'Обработано изображений: {self.done}')
+
+    def fail(self, question, error):
+        self.failed += 1
+        self.stderr.write(f'Вопрос {question.id} ({question.image.name}): {error}')
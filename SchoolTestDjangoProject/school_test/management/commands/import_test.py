@@ -0,0 +1,57 @@
+import json
+import os
+
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from school_test.authoring import AuthoringError, load_test_document, referenced_images
+from school_test.serializers import TestImportSerializer
+
+
+class Command(BaseCommand):
+    help = 'Импортирует тест с вопросами, вариантами ответов и изображениями из файла JSON или CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--author', type=int, required=True, help='ID пользователя-автора теста.')
+        parser.add_argument('--name')
+        parser.add_argument('--subject', type=int)
+        parser.add_argument('--school', type=int)
+        parser.add_argument('--description')
+        parser.add_argument('--images', help='Каталог с изображениями вопросов (по умолчанию — каталог файла).')
+
+    def handle(self, *args, **options):
+        try:
+            author = User.objects.get(pk=options['author'])
+        except User.DoesNotExist:
+            raise CommandError('Автор не найден.')
+
+        try:
+            with open(options['path'], 'rb') as file:
+                document = load_test_document(file, options['path'])
+        except AuthoringError as e:
+            raise CommandError(str(e))
+        for field in ('name', 'subject', 'school', 'description'):
+            if options[field] is not None:
+                document[field] = options[field]
+
+        images_dir = options['images'] or os.path.dirname(os.path.abspath(options['path']))
+        files = {}
+        try:
+            for name in referenced_images(document):
+                path = os.path.join(images_dir, name)
+                if os.path.isfile(path):
+                    files[name] = File(open(path, 'rb'), name=name)
+
+            serializer = TestImportSerializer(data=document, context={'files': files})
+            if not serializer.is_valid():
+                raise CommandError(json.dumps(serializer.errors, ensure_ascii=False, indent=2))
+            test = serializer.save(created_by=author)
+        finally:
+            for file in files.values():
+                file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Тест {test.id} «{test.name}» создан: вопросов {serializer.data["questions_count"]}.'
+        ))
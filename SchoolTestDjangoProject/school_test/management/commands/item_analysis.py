@@ -0,0 +1,37 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from school_test.item_analysis import cached_item_analysis
+from school_test.models import Test
+
+
+class Command(BaseCommand):
+    help = 'Считает трудность, дискриминативность, частоты дистракторов и KR-20 для теста.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('test_id', type=int)
+        parser.add_argument('--refresh', action='store_true', help='Пересчитать, не используя кэш.')
+        parser.add_argument('--json', action='store_true', help='Вывести результат в JSON.')
+
+    def handle(self, *args, **options):
+        try:
+            test = Test.objects.get(pk=options['test_id'])
+        except Test.DoesNotExist:
+            raise CommandError(f"Тест с ID {options['test_id']} не найден.")
+
+        data = cached_item_analysis(test, refresh=options['refresh'])
+        if options['json']:
+            self.stdout.write(json.dumps(data, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(f'{test.name}: учеников {data["students"]}, вопросов {data["questions_count"]}, '
+                          f'средний балл {data["mean_score"]}, KR-20 {data["kr20"]}')
+        self.stdout.write(f'{"вопрос":>10}{"трудность":>12}{"дискрим.":>12}  варианты (доля выбора)')
+        for question in data['questions']:
+            options_line = '  '.join(
+                f'{"*" if option["is_correct"] else ""}{option["option_id"]}:{option["share"]}'
+                for option in question['options']
+            )
+            self.stdout.write(f'{question["question_id"]:>10}{str(question["difficulty"]):>12}'
+                              f'{str(question["discrimination"]):>12}  {options_line}')
@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from school_test.answer_storage import pack_bits, pack_ids
+from school_test.models import Answer, AnswerSheet, Result
+
+
+class Command(BaseCommand):
+    help = ('Переносит ответы из строк Answer и Result.mistakes в упакованные листы AnswerSheet. '
+            'Старые ответы без ссылки на результат сначала привязываются к попыткам ученика по порядку.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Результатов в одной транзакции.')
+        parser.add_argument('--delete', action='store_true',
+                            help='Удалять перенесённые строки Answer и Result.mistakes.')
+
+    def handle(self, *args, **options):
+        linked, skipped = self.link_legacy_answers()
+        self.stdout.write(f'Привязано ответов к результатам: {linked}, не удалось привязать пар: {skipped}')
+
+        packed = 0
+        last_id = 0
+        while True:
+            ids = list(
+                Result.objects.filter(id__gt=last_id, answer_sheet__isnull=True, archived=False).order_by('id')
+                .values_list('id', flat=True)[:options['chunk_size']]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+            packed += self.pack(ids, options['delete'])
+            self.stdout.write(f'Упаковано листов: {packed}')
+
+        self.stdout.write(self.style.SUCCESS(f'Готово, упаковано листов: {packed}'))
+
+    def link_legacy_answers(self):
+        """
+        Ответы, записанные до появления Answer.result, делятся между попытками ученика по тесту по порядку id:
+        каждой попытке достаются столько ответов подряд, сколько в ней было отвечено вопросов.
+        Если числа не сходятся, пара (ученик, тест) пропускается.
+        """
+        linked = skipped = 0
+        pairs = Answer.objects.filter(result__isnull=True).values_list('student_id', 'test_id').distinct() \
+            .order_by('student_id', 'test_id')
+        for student_id, test_id in pairs.iterator():
+            answer_ids = list(
+                Answer.objects.filter(student_id=student_id, test_id=test_id, result__isnull=True)
+                .order_by('id').values_list('id', flat=True)
+            )
+            results = list(
+                Result.objects.filter(student_id=student_id, test_id=test_id, answers__isnull=True,
+                                      answer_sheet__isnull=True, archived=False).order_by('id')
+                .values_list('id', F('correct_answers_count') + F('not_correct_answers_count'))
+            )
+            if sum(answered or 0 for _, answered in results) != len(answer_ids):
+                skipped += 1
+                continue
+            with transaction.atomic():
+                start = 0
+                for result_id, answered in results:
+                    Answer.objects.filter(id__in=answer_ids[start:start + answered]).update(result_id=result_id)
+                    start += answered
+            linked += len(answer_ids)
+        return linked, skipped
+
+    @transaction.atomic
+    def pack(self, result_ids, delete):
+        answers = defaultdict(list)
+        for result_id, question_number, question_id, option_id, is_correct in Answer.objects \
+                .filter(result_id__in=result_ids) \
+                .values_list('result_id', 'question__number', 'question_id', 'selected_option_id', 'is_correct'):
+            answers[result_id].append((question_number or 0, question_id, option_id, is_correct))
+
+        results = Result.objects.filter(id__in=list(answers)).values_list('id', 'student_id', 'test_id', 'date_taken')
+        sheets = []
+        for result_id, student_id, test_id, date_taken in results:
+            rows = sorted(answers[result_id])
+            sheets.append(AnswerSheet(
+                result_id=result_id,
+                student_id=student_id,
+                test_id=test_id,
+                questions=pack_ids([question_id for _, question_id, _, _ in rows]),
+                options=pack_ids([option_id for _, _, option_id, _ in rows]),
+                mistakes=pack_bits([not is_correct for _, _, _, is_correct in rows]),
+                created_at=date_taken,
+            ))
+        AnswerSheet.objects.bulk_create(sheets)
+
+        if delete and sheets:
+            packed_ids = [sheet.result_id for sheet in sheets]
+            Answer.objects.filter(result_id__in=packed_ids).delete()
+            Result.mistakes.through.objects.filter(result_id__in=packed_ids).delete()
+        return len(sheets)
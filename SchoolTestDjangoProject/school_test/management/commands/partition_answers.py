@@ -0,0 +1,146 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from school_test.archive import school_year, school_year_start
+from school_test.models import Answer, AnswerSheet, Result
+
+# Таблица: (модель, поле, по которому ищется самая ранняя строка).
+# У листов до появления AnswerSheet.created_at дата берётся из результата.
+TABLES = {
+    'answer': (Answer, 'created_at'),
+    'answersheet': (AnswerSheet, 'result__date_taken'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Только PostgreSQL. Переводит таблицы ответов — строки Answer и упакованные листы AnswerSheet '
+            '(хранилище по умолчанию) — в секционированные по created_at: одна секция на учебный год плюс секция '
+            'по умолчанию. Повторный запуск добавляет секции будущих лет, перенося подходящие строки из секции '
+            'по умолчанию. Переход берёт эксклюзивную блокировку таблицы и копирует все строки, поэтому '
+            'запускайте его в окно обслуживания.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from-year', type=int,
+                            help='Первый учебный год секций; по умолчанию — год самого раннего ответа.')
+        parser.add_argument('--years-ahead', type=int, default=1, help='Сколько будущих учебных лет создать заранее.')
+        parser.add_argument('--table', choices=sorted(TABLES), action='append', help='По умолчанию — обе таблицы.')
+        parser.add_argument('--dry-run', action='store_true', help='Только напечатать SQL.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Секционирование таблицы ответов поддерживается только на PostgreSQL.')
+
+        self.dry_run = options['dry_run']
+        for name in options['table'] or sorted(TABLES):
+            self.partition(*TABLES[name], options)
+
+    def partition(self, model, first_field, options):
+        self.model = model
+        self.table = model._meta.db_table
+
+        current = school_year(timezone.now())
+        first = model.objects.aggregate(first=Min(first_field))['first']
+        years = [current] if first is None else [school_year(first)]
+        if options['from_year']:
+            years.append(options['from_year'])
+        years = range(min(years), current + options['years_ahead'] + 1)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            self.cursor = cursor
+            if not self.is_partitioned():
+                self.convert(years)
+            else:
+                existing = self.partitions()
+                for year in years:
+                    if self.partition_name(year) not in existing:
+                        self.add_partition(year)
+            if self.dry_run:
+                transaction.set_rollback(True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{self.table}: секции учебных лет {years.start}–{years.stop - 1} готовы.'
+        ))
+
+    def run_sql(self, sql):
+        self.stdout.write(sql + ';')
+        if not self.dry_run:
+            self.cursor.execute(sql)
+
+    def fetch(self, sql, params=()):
+        self.cursor.execute(sql, params)
+        return self.cursor.fetchall()
+
+    def quote(self, name):
+        return connection.ops.quote_name(name)
+
+    def partition_name(self, year):
+        return f'{self.table}_y{year}'
+
+    def bound(self, year):
+        return school_year_start(year).isoformat(sep=' ')
+
+    def is_partitioned(self):
+        return bool(self.fetch('SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)', [self.table]))
+
+    def partitions(self):
+        return {name for name, in self.fetch(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = to_regclass(%s)', [self.table]
+        )}
+
+    def add_partition(self, year):
+        """
+        Секция создаётся отдельной таблицей, в неё переносятся строки этого года из секции по умолчанию,
+        и только затем она подключается: иначе ATTACH упадёт на строках, уже лежащих в секции по умолчанию.
+        """
+        table, partition = self.quote(self.table), self.quote(self.partition_name(year))
+        start, end = self.bound(year), self.bound(year + 1)
+        self.run_sql(f'CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        self.run_sql(
+            f'WITH moved AS (DELETE FROM {self.quote(self.table + "_default")} '
+            f"WHERE created_at >= '{start}' AND created_at < '{end}' RETURNING *) "
+            f'INSERT INTO {partition} SELECT * FROM moved'
+        )
+        self.run_sql(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM ('{start}') TO ('{end}')")
+
+    def convert(self, years):
+        """
+        Индексы и внешние ключи переносятся с исходной таблицы по их определениям в каталоге.
+        Первичный ключ секционированной таблицы обязан включать ключ секционирования: (id, created_at),
+        у листов — (result_id, created_at). Дата листа перед переносом выравнивается по дате его попытки.
+        """
+        indexes = [sql for sql, in self.fetch(
+            "SELECT pg_get_indexdef(i.indexrelid) FROM pg_index i WHERE i.indrelid = to_regclass(%s) "
+            "AND NOT i.indisprimary", [self.table]
+        )]
+        foreign_keys = self.fetch(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'", [self.table]
+        )
+
+        table, old = self.quote(self.table), self.quote(self.table + '_unpartitioned')
+        pk = self.quote(self.model._meta.pk.column)
+        self.run_sql(f'LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE')
+        if self.model is AnswerSheet:
+            self.run_sql(f'UPDATE {table} SET created_at = r.date_taken FROM {self.quote(Result._meta.db_table)} r '
+                         f'WHERE r.id = {table}.{pk} AND {table}.created_at <> r.date_taken')
+        self.run_sql(f'ALTER TABLE {table} RENAME TO {old}')
+        self.run_sql(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING IDENTITY) '
+                     f'PARTITION BY RANGE (created_at)')
+        self.run_sql(f'CREATE TABLE {self.quote(self.table + "_default")} PARTITION OF {table} DEFAULT')
+        for year in years:
+            self.add_partition(year)
+
+        self.run_sql(f'INSERT INTO {table} OVERRIDING SYSTEM VALUE SELECT * FROM {old}')
+        if isinstance(self.model._meta.pk, models.AutoField):
+            self.run_sql(f"SELECT setval(pg_get_serial_sequence('{self.table}', '{self.model._meta.pk.column}'), "
+                         f'COALESCE((SELECT MAX({pk}) FROM {table}), 0) + 1, false)')
+        self.run_sql(f'DROP TABLE {old}')
+
+        self.run_sql(f'ALTER TABLE {table} ADD PRIMARY KEY ({pk}, created_at)')
+        for sql in indexes:
+            self.run_sql(sql)
+        for name, definition in foreign_keys:
+            self.run_sql(f'ALTER TABLE {table} ADD CONSTRAINT {self.quote(name)} {definition}')
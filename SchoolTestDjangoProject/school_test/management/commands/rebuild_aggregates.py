@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from school_test.models import TestHistory, SchoolHistory, Result
+from school_test.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает накопительные суммы TestHistory, SchoolHistory и сводки результатов по сохранённым результатам.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.rebuild(TestHistory.objects.all())
+            self.rebuild(SchoolHistory.objects.all())
+            self.rebuild_students()
+            rebuild_rollups()
+        self.stdout.write(self.style.SUCCESS('Агрегаты пересчитаны.'))
+
+    def rebuild(self, queryset):
+        histories = list(queryset.annotate(
+            count=Count('results'),
+            total=Sum('results__percentage'),
+        ))
+        for history in histories:
+            history.results_count = history.count
+            history.percentage_sum = history.total or 0
+            history.average_percentage = history.percentage_sum / history.count if history.count else 0.0
+        queryset.model.objects.bulk_update(
+            histories, ['results_count', 'percentage_sum', 'average_percentage'], batch_size=1000
+        )
+
+    def rebuild_students(self):
+        Student = SchoolHistory.students.through
+        Student.objects.all().delete()
+        pairs = Result.school_histories.through.objects.values_list(
+            'schoolhistory_id', 'result__student_id'
+        ).distinct()
+        Student.objects.bulk_create(
+            (Student(schoolhistory_id=history_id, user_id=student_id) for history_id, student_id in pairs.iterator()),
+            batch_size=1000
+        )
+        histories = list(SchoolHistory.objects.annotate(count=Count('students')))
+        for history in histories:
+            history.total_students = history.count
+        SchoolHistory.objects.bulk_update(histories, ['total_students'], batch_size=1000)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from school_test.models import Test, Question
+from school_test.signals import touch_test
+
+
+class Command(BaseCommand):
+    help = ('Перенумеровывает вопросы тестов подряд с 1 (по текущему номеру и id) и выставляет счётчик номеров. '
+            'Запускается перед добавлением ограничения уникальности (test, number), если в данных есть дубли.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--test', type=int, action='append', help='ID теста; по умолчанию — все тесты.')
+
+    def handle(self, *args, **options):
+        tests = Test.objects.order_by('id')
+        if options['test']:
+            tests = tests.filter(id__in=options['test'])
+
+        changed = 0
+        for test_id in tests.values_list('id', flat=True).iterator():
+            with transaction.atomic():
+                Test.objects.select_for_update().filter(pk=test_id).values_list('id', flat=True).get()
+                questions = list(Question.objects.filter(test_id=test_id).order_by('number', 'id').only('id', 'number'))
+                renumbered = []
+                for number, question in enumerate(questions, start=1):
+                    if question.number != number:
+                        question.number = number
+                        renumbered.append(question)
+                if renumbered:
+                    Question.objects.filter(id__in=[question.id for question in renumbered]).update(number=None)
+                    Question.objects.bulk_update(renumbered, ['number'])
+                    changed += len(renumbered)
+                Test.objects.filter(pk=test_id).update(question_counter=len(questions))
+                if renumbered:
+                    touch_test(test_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Перенумеровано вопросов: {changed}'))
@@ -0,0 +1,9 @@
+from school_test.deliveries import run_worker
+from school_test.workers import WorkerPoolCommand
+
+
+class Command(WorkerPoolCommand):
+    help = 'Запускает пул процессов, которые строят списки получателей рекомендаций и рассылают SMS.'
+    worker = staticmethod(run_worker)
+    settings_prefix = 'RECOMMENDATION'
+    once_help = 'Разослать рекомендации из очереди и завершиться.'
@@ -0,0 +1,8 @@
+from school_test.submissions import run_worker
+from school_test.workers import WorkerPoolCommand
+
+
+class Command(WorkerPoolCommand):
+    help = 'Запускает пул процессов, которые пачками проверяют отправки тестов из очереди.'
+    worker = staticmethod(run_worker)
+    settings_prefix = 'SUBMISSION'
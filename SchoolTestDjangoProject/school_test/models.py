@@ -1,11 +1,13 @@
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Avg
+from django.db import connection, models, transaction
+from django.db.models import Avg, Max, OuterRef, Q, Subquery
+from django.utils import timezone
 from register.models import School
 
 
 class Subject(models.Model):
     name = models.CharField(max_length=300)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
 
     def __str__(self):
         return f'{self.name}'
@@ -22,6 +24,22 @@ class Test(models.Model):
     school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='tests')
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_tests')
     created_at = models.DateTimeField(auto_now_add=True)
+    content_version = models.PositiveIntegerField(default=1, editable=False, verbose_name="Версия содержимого")
+    content_updated_at = models.DateTimeField(default=timezone.now, editable=False,
+                                              verbose_name="Дата изменения содержимого")
+    media_version = models.PositiveIntegerField(default=1, editable=False, verbose_name="Версия копий изображений")
+    question_counter = models.PositiveIntegerField(default=0, editable=False,
+                                                   verbose_name="Последний выданный номер вопроса")
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.content_version = models.F('content_version') + 1
+            self.content_updated_at = timezone.now()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'content_version', 'content_updated_at'}
+        super().save(*args, **kwargs)
+        if isinstance(self.content_version, models.Expression):
+            self.refresh_from_db(fields=['content_version'])
 
     def __str__(self):
         return f'{self.name} - {self.subject} {self.school} {self.created_by.profile.role}'
@@ -29,6 +47,10 @@ class Test(models.Model):
     class Meta:
         verbose_name = 'Тесты'
         verbose_name_plural = 'Тесты'
+        indexes = [
+            models.Index(fields=['school', 'subject', '-created_at']),
+            models.Index(fields=['subject', '-created_at']),
+        ]
 
 
 class Question(models.Model):
@@ -39,10 +61,13 @@ class Question(models.Model):
     feedback = models.TextField()
 
     def save(self, *args, **kwargs):
-        if self.number is None:
-            max_number = Question.objects.filter(test=self.test).aggregate(models.Max('number')).get('number__max')
-            self.number = (max_number or 0) + 1
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            if self.number is None:
+                self.number = allocate_question_numbers(self.test_id)[0]
+            else:
+                Test.objects.filter(pk=self.test_id, question_counter__lt=self.number) \
+                    .update(question_counter=self.number)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return f'Вопрос {self.number}: {self.text[:30]}'
@@ -50,6 +75,65 @@ class Question(models.Model):
     class Meta:
         verbose_name = 'Вопросы'
         verbose_name_plural = 'Вопросы'
+        ordering = ['number', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['test', 'number'], name='unique_question_number'),
+        ]
+
+
+def allocate_question_numbers(test_id, count=1):
+    """
+    Резервирует count подряд идущих номеров вопросов теста одним UPDATE ... RETURNING.
+    Строка теста остаётся заблокированной до конца транзакции, поэтому параллельные авторы получают
+    непересекающиеся блоки. Счётчик не отстаёт от занятых номеров: номера, заданные явно, поднимают его
+    в Question.save(), а счётчики тестов, созданных до его появления, выставляет backfill_question_counters.
+    """
+    table = connection.ops.quote_name(Test._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET question_counter = question_counter + %s WHERE id = %s RETURNING question_counter',
+            [count, test_id]
+        )
+        last, = cursor.fetchone()
+    return range(last - count + 1, last + 1)
+
+
+def backfill_question_counters(using='default'):
+    """Поднимает счётчики номеров до наибольшего занятого номера; повторный запуск ничего не меняет."""
+    max_number = Subquery(
+        Question.objects.filter(test_id=OuterRef('pk')).order_by().values('test_id')
+        .annotate(max_number=Max('number')).values('max_number')
+    )
+    return Test.objects.using(using).filter(question_counter__lt=max_number).update(question_counter=max_number)
+
+
+class QuestionImageVariant(models.Model):
+    """Уменьшенная копия изображения вопроса (см. school_test/images.py)."""
+    WEBP = 'webp'
+    JPEG = 'jpeg'
+    FORMAT_CHOICES = [
+        (WEBP, 'WebP'),
+        (JPEG, 'JPEG'),
+    ]
+
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='image_variants',
+                                 verbose_name="Вопрос")
+    source = models.CharField(max_length=255, verbose_name="Исходное изображение")
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES, verbose_name="Формат")
+    width = models.PositiveIntegerField(verbose_name="Ширина")
+    height = models.PositiveIntegerField(verbose_name="Высота")
+    file = models.FileField(upload_to='question/img/variants/', max_length=255, verbose_name="Файл")
+
+    def __str__(self):
+        return f"{self.question_id} {self.format} {self.width}x{self.height}"
+
+    class Meta:
+        verbose_name = 'Копия изображения вопроса'
+        verbose_name_plural = 'Копии изображений вопросов'
+        ordering = ['format', 'width']
+        constraints = [
+            models.UniqueConstraint(fields=['question', 'format', 'width'], name='unique_question_image_variant'),
+        ]
 
 
 class AnswerOption(models.Model):
@@ -84,14 +168,20 @@ class Event(models.Model):
     class Meta:
         verbose_name = 'Событие'
         verbose_name_plural = 'События'
+        indexes = [
+            models.Index(fields=['school', 'class_number']),
+        ]
 
 
 class Answer(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE)
     test = models.ForeignKey(Test, on_delete=models.CASCADE)
+    result = models.ForeignKey('Result', on_delete=models.CASCADE, related_name='answers', blank=True, null=True,
+                               verbose_name="Результат")
     question = models.ForeignKey(Question, on_delete=models.CASCADE)
     selected_option = models.ForeignKey(AnswerOption, on_delete=models.CASCADE)
     is_correct = models.BooleanField()
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Дата ответа")
 
     def __str__(self):
         return f"Answer by {self.student.profile.name} for {self.question.text[:30]}"
@@ -99,11 +189,19 @@ class Answer(models.Model):
     class Meta:
         verbose_name = 'Прохождение'
         verbose_name_plural = 'Прохождение'
+        indexes = [
+            models.Index(fields=['student', 'test'], name='answer_student_test_idx'),
+            models.Index(fields=['test', 'id'], name='answer_test_id_idx'),
+        ]
 
 
 class Result(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Ученик")
     test = models.ForeignKey(Test, on_delete=models.CASCADE, verbose_name="Тест")
+    school = models.ForeignKey(School, on_delete=models.SET_NULL, blank=True, null=True, related_name='results',
+                               verbose_name="Школа ученика на момент прохождения")
+    class_number = models.CharField(max_length=255, blank=True, default='',
+                                    verbose_name="Класс ученика на момент прохождения")
     percentage = models.DecimalField(max_digits=5, decimal_places=2, verbose_name="Процент")
     mistakes = models.ManyToManyField(Question, blank=True, related_name="mistakes", verbose_name="Ошибки")
     date_taken = models.DateTimeField(auto_now_add=True, verbose_name="Дата прохождения")
@@ -112,6 +210,7 @@ class Result(models.Model):
                                                         verbose_name="Правильные ответы")
     not_correct_answers_count = models.PositiveIntegerField(default=0, blank=True, null=True,
                                                             verbose_name="Неправильные ответы")
+    archived = models.BooleanField(default=False, verbose_name="Ответы в архиве")
 
     def __str__(self):
         return f"{self.student.username} - {self.test.name} - {self.percentage}%"
@@ -119,6 +218,12 @@ class Result(models.Model):
     class Meta:
         verbose_name = 'Результат'
         verbose_name_plural = 'Результат'
+        indexes = [
+            models.Index(fields=['student', 'test'], name='result_student_test_idx'),
+            models.Index(fields=['test', 'date_taken'], name='result_test_date_idx'),
+            models.Index(fields=['test', 'percentage'], name='result_test_percentage_idx'),
+            models.Index(fields=['school', 'date_taken'], name='result_school_date_idx'),
+        ]
 
 
 class Recommendation(models.Model):
@@ -137,12 +242,95 @@ class Recommendation(models.Model):
     link = models.URLField(blank=True, null=True, verbose_name="Ссылка", help_text="Ссылка для учеников")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
 
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Рассылается'),
+        (DONE, 'Разослано'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус рассылки")
+    total_students = models.PositiveIntegerField(default=0, verbose_name="Получателей")
+    sent_count = models.PositiveIntegerField(default=0, verbose_name="Отправлено")
+    failed_count = models.PositiveIntegerField(default=0, verbose_name="Не доставлено")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    locked_at = models.DateTimeField(blank=True, null=True, verbose_name="Взята в работу")
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата завершения рассылки")
+
     def __str__(self):
         return f"Recommendation for {self.subject.name} - Class {self.class_number}"
 
     class Meta:
         verbose_name = 'Рекомендации'
         verbose_name_plural = 'Рекомендации'
+        indexes = [
+            models.Index(fields=['created_at'], condition=Q(status__in=['pending', 'processing']),
+                         name='recommendation_queue_idx'),
+        ]
+
+
+class RecommendationDelivery(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает отправки'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    recommendation = models.ForeignKey(Recommendation, on_delete=models.CASCADE, related_name='deliveries',
+                                       verbose_name="Рекомендация")
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendation_deliveries',
+                                verbose_name="Ученик")
+    phone_number = models.CharField(max_length=15, verbose_name="Номер телефона")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    sent_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата отправки")
+
+    def __str__(self):
+        return f"{self.recommendation_id} -> {self.phone_number} ({self.status})"
+
+    class Meta:
+        verbose_name = 'Доставка рекомендации'
+        verbose_name_plural = 'Доставки рекомендаций'
+        constraints = [
+            models.UniqueConstraint(fields=['recommendation', 'student'], name='unique_recommendation_delivery'),
+        ]
+        indexes = [
+            models.Index(fields=['recommendation', 'status']),
+        ]
+
+
+class AnswerSheet(models.Model):
+    """
+    Лист ответов одной попытки в упакованном виде (см. school_test/answer_storage.py): id вопросов и выбранных
+    вариантов — массивы int64 по порядку номеров вопросов, ошибки — битовая маска по тем же позициям.
+    Заменяет строки Answer и Result.mistakes при ANSWER_STORAGE = 'packed'. created_at совпадает с датой
+    попытки: по нему таблица секционируется на PostgreSQL (`python manage.py partition_answers`).
+    """
+    result = models.OneToOneField(Result, on_delete=models.CASCADE, primary_key=True, related_name='answer_sheet',
+                                  verbose_name="Результат")
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='answer_sheets', verbose_name="Ученик")
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='answer_sheets', verbose_name="Тест")
+    questions = models.BinaryField(verbose_name="Вопросы")
+    options = models.BinaryField(verbose_name="Выбранные варианты")
+    mistakes = models.BinaryField(verbose_name="Ошибки")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Дата ответа")
+
+    def __str__(self):
+        return f"Answer sheet {self.result_id}"
+
+    class Meta:
+        verbose_name = 'Лист ответов'
+        verbose_name_plural = 'Листы ответов'
+        indexes = [
+            models.Index(fields=['test', 'result'], name='answersheet_test_result_idx'),
+        ]
 
 
 class TestHistory(models.Model):
@@ -150,6 +338,9 @@ class TestHistory(models.Model):
     full_name = models.CharField(max_length=255, blank=True, verbose_name="ФИО")
     results = models.ManyToManyField(Result, related_name="test_history", verbose_name="Результаты", blank=True)
     average_percentage = models.FloatField(default=0.0)
+    results_count = models.PositiveIntegerField(default=0, verbose_name="Количество результатов")
+    percentage_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                         verbose_name="Сумма процентов")
 
     def __str__(self):
         return f"{self.full_name}"
@@ -164,6 +355,10 @@ class SchoolHistory(models.Model):
     total_students = models.PositiveIntegerField(default=0, verbose_name="Количество учеников")
     average_percentage = models.FloatField(default=0.0)
     results = models.ManyToManyField(Result, related_name="school_histories")
+    students = models.ManyToManyField(User, related_name="school_histories", blank=True, verbose_name="Ученики")
+    results_count = models.PositiveIntegerField(default=0, verbose_name="Количество результатов")
+    percentage_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                         verbose_name="Сумма процентов")
 
     def __str__(self):
         return f"{self.school}"
@@ -171,3 +366,82 @@ class SchoolHistory(models.Model):
     class Meta:
         verbose_name = "История школы"
         verbose_name_plural = "История школ"
+
+
+class Submission(models.Model):
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'В очереди'),
+        (PROCESSING, 'Проверяется'),
+        (DONE, 'Проверен'),
+        (FAILED, 'Ошибка'),
+    ]
+
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='submissions', verbose_name="Ученик")
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='submissions', verbose_name="Тест")
+    answers = models.JSONField(verbose_name="Ответы")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING, verbose_name="Статус")
+    result = models.OneToOneField(Result, on_delete=models.SET_NULL, blank=True, null=True,
+                                  related_name='submission', verbose_name="Результат")
+    error = models.TextField(blank=True, verbose_name="Ошибка")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="Попытки")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата отправки")
+    locked_at = models.DateTimeField(blank=True, null=True, verbose_name="Взят в работу")
+    processed_at = models.DateTimeField(blank=True, null=True, verbose_name="Дата проверки")
+
+    def __str__(self):
+        return f"Submission {self.id} - {self.status}"
+
+    class Meta:
+        verbose_name = 'Отправка теста'
+        verbose_name_plural = 'Отправки тестов'
+        indexes = [
+            models.Index(fields=['created_at'], condition=Q(status__in=['pending', 'processing']),
+                         name='submission_queue_idx'),
+        ]
+
+
+class ResultRollup(models.Model):
+    HISTOGRAM_BUCKETS = 10
+
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name='result_rollups', verbose_name="Школа")
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, verbose_name="Предмет")
+    class_number = models.CharField(max_length=255, blank=True, default='', verbose_name="Класс")
+    test = models.ForeignKey(Test, on_delete=models.CASCADE, related_name='rollups', verbose_name="Тест")
+    count = models.PositiveIntegerField(default=0, verbose_name="Количество результатов")
+    passed_count = models.PositiveIntegerField(default=0, verbose_name="Сдавшие")
+    percentage_sum = models.DecimalField(max_digits=14, decimal_places=2, default=0,
+                                         verbose_name="Сумма процентов")
+    percentage_sum_squares = models.DecimalField(max_digits=20, decimal_places=4, default=0,
+                                                 verbose_name="Сумма квадратов процентов")
+    histogram = models.JSONField(default=list, verbose_name="Распределение по десяткам процентов")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
+
+    @property
+    def average(self):
+        return float(self.percentage_sum / self.count) if self.count else 0.0
+
+    @property
+    def stddev(self):
+        if not self.count:
+            return 0.0
+        variance = float(self.percentage_sum_squares / self.count) - self.average ** 2
+        return max(variance, 0.0) ** 0.5
+
+    @property
+    def pass_rate(self):
+        return self.passed_count / self.count * 100 if self.count else 0.0
+
+    def __str__(self):
+        return f"{self.school_id} / {self.subject_id} / {self.class_number} / {self.test_id}"
+
+    class Meta:
+        verbose_name = 'Сводка результатов'
+        verbose_name_plural = 'Сводки результатов'
+        constraints = [
+            models.UniqueConstraint(fields=['school', 'subject', 'class_number', 'test'], name='unique_result_rollup'),
+        ]
+
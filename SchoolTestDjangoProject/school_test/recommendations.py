@@ -0,0 +1,121 @@
+import threading
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models import Avg
+
+from .models import Recommendation, Result
+
+INDEX_VERSION_KEY = 'recommendation_index_version'
+
+
+class IntervalIndex:
+    """
+    Статический индекс замкнутых отрезков [low, high].
+    Концы отрезков делят ось на элементарные участки (точки и промежутки между ними); для каждого участка
+    заранее известен список покрывающих его отрезков, поэтому запрос — один бинарный поиск: O(log n + k).
+    """
+
+    def __init__(self, intervals):
+        self.points = sorted({bound for low, high, _ in intervals for bound in (low, high)})
+        self.slots = [[] for _ in range(2 * len(self.points) + 1)]
+        for low, high, item in intervals:
+            if low > high:
+                continue
+            first = 2 * bisect_left(self.points, low) + 1
+            last = 2 * bisect_left(self.points, high) + 1
+            for slot in range(first, last + 1):
+                self.slots[slot].append(item)
+
+    def stab(self, value):
+        index = bisect_left(self.points, value)
+        if index < len(self.points) and self.points[index] == value:
+            return self.slots[2 * index + 1]
+        return self.slots[2 * index]
+
+
+class RecommendationIndex:
+    """Индексы рекомендаций по группам (школа, предмет, класс)."""
+
+    def __init__(self, recommendations, version=None):
+        self.version = version
+        groups = defaultdict(list)
+        for recommendation in recommendations:
+            key = (recommendation.school_id, recommendation.subject_id, recommendation.class_number)
+            groups[key].append((recommendation.min_percentage, recommendation.max_percentage, recommendation))
+        self.groups = {key: IntervalIndex(intervals) for key, intervals in groups.items()}
+
+    def match(self, school_id, subject_id, class_number, percentage):
+        index = self.groups.get((school_id, subject_id, class_number))
+        return list(index.stab(percentage)) if index else []
+
+    def match_many(self, queries):
+        """queries — итерируемое из (school_id, subject_id, class_number, percentage)."""
+        return [self.match(*query) for query in queries]
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def get_recommendation_index():
+    global _index
+    version = cache.get(INDEX_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(INDEX_VERSION_KEY, version, None)
+        version = cache.get(INDEX_VERSION_KEY, version)
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = RecommendationIndex(Recommendation.objects.select_related('subject').order_by('id'), version)
+        return _index
+
+
+async def aget_recommendation_index():
+    """Без обращения к БД, если индекс процесса актуален; перестройка индекса — в потоке через sync_to_async."""
+    version = await cache.aget(INDEX_VERSION_KEY)
+    index = _index
+    if version is not None and index is not None and index.version == version:
+        return index
+    return await sync_to_async(get_recommendation_index)()
+
+
+def invalidate_recommendation_index():
+    cache.set(INDEX_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def student_averages(profiles):
+    return Result.objects.filter(student_id__in=profiles).values('student_id', 'test__subject_id') \
+        .annotate(average=Avg('percentage')).order_by('student_id', 'test__subject_id')
+
+
+def match_averages(index, profiles, averages):
+    matched = {student_id: [] for student_id in profiles}
+    for row in averages:
+        profile = profiles[row['student_id']]
+        matched[row['student_id']].extend(
+            index.match(profile.school_id, row['test__subject_id'], profile.class_number, row['average'])
+        )
+    return matched
+
+
+def recommendations_for_students(profiles):
+    """
+    Подбирает рекомендации сразу для многих учеников: один агрегирующий запрос средних по предметам
+    и поиск в индексе по (школа, предмет, класс ученика). Возвращает {student_id: [Recommendation, ...]}.
+    """
+    profiles = {profile.user_id: profile for profile in profiles}
+    averages = student_averages(profiles)
+    return match_averages(get_recommendation_index(), profiles, averages)
+
+
+async def arecommendations_for_students(profiles):
+    profiles = {profile.user_id: profile for profile in profiles}
+    averages = [row async for row in student_averages(profiles)]
+    return match_averages(await aget_recommendation_index(), profiles, averages)
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from register.models import Profile
+from .models import Result, ResultRollup
+
+
+def bucket(percentage):
+    return min(int(percentage // 10), ResultRollup.HISTOGRAM_BUCKETS - 1)
+
+
+def update_rollup(result, subject_id, percentage):
+    """
+    Добавляет результат в сводку (школа, предмет, класс, тест) по школе и классу, сохранённым в результате;
+    вызывается в транзакции проверки.
+    """
+    rollup, created = ResultRollup.objects.select_for_update().get_or_create(
+        school_id=result.school_id,
+        subject_id=subject_id,
+        class_number=result.class_number,
+        test_id=result.test_id,
+    )
+    histogram = rollup.histogram or [0] * ResultRollup.HISTOGRAM_BUCKETS
+    histogram[bucket(percentage)] += 1
+
+    rollup.count += 1
+    if percentage >= settings.PASS_PERCENTAGE:
+        rollup.passed_count += 1
+    rollup.percentage_sum += percentage
+    rollup.percentage_sum_squares += percentage * percentage
+    rollup.histogram = histogram
+    rollup.save()
+
+
+def backfill_result_snapshots():
+    """
+    Результатам, сохранённым до появления Result.school и Result.class_number, проставляет текущие школу
+    и класс ученика: других сведений о них нет. Новые результаты получают их при проверке.
+    """
+    profiles = Profile.objects.filter(user_id=OuterRef('student_id'))
+    return Result.objects.filter(school__isnull=True).update(
+        school_id=Subquery(profiles.values('school_id')[:1]),
+        class_number=Coalesce(Subquery(profiles.values('class_number')[:1]), Value('')),
+    )
+
+
+def rebuild_rollups():
+    """
+    Пересчитывает все сводки одним агрегирующим запросом по Result. Группировка — по школе и классу,
+    сохранённым в результате при проверке, как у update_rollup: переход ученика в другой класс или школу
+    не переносит его прошлые результаты.
+    """
+    backfill_result_snapshots()
+    width = 100 / ResultRollup.HISTOGRAM_BUCKETS
+    buckets = {
+        f'bucket_{index}': Count('id', filter=Q(percentage__gte=index * width) & (
+            Q(percentage__lt=(index + 1) * width) if index < ResultRollup.HISTOGRAM_BUCKETS - 1 else Q()
+        ))
+        for index in range(ResultRollup.HISTOGRAM_BUCKETS)
+    }
+    rows = Result.objects.filter(school__isnull=False).values(
+        'test_id', 'school_id', 'class_number', subject_id=F('test__subject_id'),
+    ).order_by().annotate(
+        count=Count('id'),
+        passed_count=Count('id', filter=Q(percentage__gte=settings.PASS_PERCENTAGE)),
+        percentage_sum=Sum('percentage'),
+        percentage_sum_squares=Sum(F('percentage') * F('percentage')),
+        **buckets,
+    )
+
+    ResultRollup.objects.all().delete()
+    ResultRollup.objects.bulk_create((
+        ResultRollup(
+            school_id=row['school_id'],
+            subject_id=row['subject_id'],
+            class_number=row['class_number'],
+            test_id=row['test_id'],
+            count=row['count'],
+            passed_count=row['passed_count'],
+            percentage_sum=row['percentage_sum'],
+            percentage_sum_squares=row['percentage_sum_squares'],
+            histogram=[row[name] for name in buckets],
+        )
+        for row in rows.iterator()
+    ), batch_size=1000)
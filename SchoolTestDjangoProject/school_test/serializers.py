@@ -1,12 +1,22 @@
 from rest_framework import serializers
-from .models import Answer, Test, Question, AnswerOption, Result, Event, Subject, Recommendation, TestHistory, \
-    SchoolHistory
+from .models import Test, Question, AnswerOption, Result, Event, Subject, Recommendation, TestHistory, \
+    SchoolHistory, ResultRollup, QuestionImageVariant
+from .answer_storage import mistake_ids
+from .authoring import import_test
+from .recommendations import recommendations_for_students
+from .grading import get_answer_key, check_answers, missing_questions, grade_submission
 
 
 class ResultSerializer(serializers.ModelSerializer):
+    mistakes = serializers.SerializerMethodField()
+
     class Meta:
         model = Result
-        fields = '__all__'
+        fields = ['id', 'student', 'test', 'percentage', 'mistakes', 'date_taken', 'total_questions_count',
+                  'correct_answers_count', 'not_correct_answers_count']
+
+    def get_mistakes(self, obj):
+        return mistake_ids(obj)
 
 
 class EventSerializer(serializers.ModelSerializer):
@@ -22,10 +32,24 @@ class RecommendationAllSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at']
 
 
+class RecommendationCreateSerializer(serializers.ModelSerializer):
+    min_percentage = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=100)
+    max_percentage = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, max_value=100)
+
+    class Meta:
+        model = Recommendation
+        fields = ['school', 'subject', 'class_number', 'min_percentage', 'max_percentage', 'message', 'link']
+
+    def validate(self, data):
+        if data['min_percentage'] > data['max_percentage']:
+            raise serializers.ValidationError("Минимальный процент не может быть больше максимального.")
+        return data
+
+
 class SubjectSerializer(serializers.ModelSerializer):
     class Meta:
         model = Subject
-        fields = '__all__'
+        fields = ['id', 'name']
 
 
 class AnswerOptionSerializer(serializers.ModelSerializer):
@@ -34,8 +58,17 @@ class AnswerOptionSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class QuestionImageVariantSerializer(serializers.ModelSerializer):
+    url = serializers.FileField(source='file', read_only=True)
+
+    class Meta:
+        model = QuestionImageVariant
+        fields = ['format', 'width', 'height', 'url']
+
+
 class QuestionSerializer(serializers.ModelSerializer):
     options = AnswerOptionSerializer(many=True, read_only=True)
+    image_variants = QuestionImageVariantSerializer(many=True, read_only=True)
 
     class Meta:
         model = Question
@@ -50,6 +83,15 @@ class TestListSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class TestSummarySerializer(serializers.ModelSerializer):
+    subject_name = serializers.CharField(source='subject.name', read_only=True)
+    questions_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = Test
+        fields = ['id', 'name', 'description', 'subject', 'subject_name', 'school', 'questions_count', 'created_at']
+
+
 class StudentHistorySerializer(serializers.ModelSerializer):
     results_details = ResultSerializer(source='results', many=True, read_only=True)
 
@@ -74,22 +116,33 @@ class AnalyticSerializer(serializers.ModelSerializer):
         fields = ["average_percentage", "full_name", "recommendations"]
 
     def get_recommendations(self, obj):
-        recommendations = Recommendation.objects.filter(
-            school=obj.student.profile.school,
-            min_percentage__lte=obj.average_percentage,
-            max_percentage__gte=obj.average_percentage
-        )
-        return RecommendationSerializer(recommendations, many=True).data
+        matched = self.context.get('recommendations')
+        if matched is None or obj.student_id not in matched:
+            matched = recommendations_for_students([obj.student.profile])
+        return RecommendationSerializer(matched[obj.student_id], many=True).data
 
 
 class SchoolHistorySerializer(serializers.ModelSerializer):
-    results_details = ResultSerializer(source='results', read_only=True)
+    results_details = ResultSerializer(source='results', many=True, read_only=True)
 
     class Meta:
         model = SchoolHistory
         fields = '__all__'
 
 
+class ResultRollupSerializer(serializers.ModelSerializer):
+    subject_name = serializers.CharField(source='subject.name', read_only=True)
+    test_name = serializers.CharField(source='test.name', read_only=True)
+    average = serializers.FloatField(read_only=True)
+    stddev = serializers.FloatField(read_only=True)
+    pass_rate = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = ResultRollup
+        fields = ['subject', 'subject_name', 'class_number', 'test', 'test_name', 'count', 'average', 'stddev',
+                  'pass_rate', 'histogram']
+
+
 class TestCreateSerializer(serializers.ModelSerializer):
     questions = QuestionSerializer(many=True, read_only=True)
 
@@ -99,6 +152,51 @@ class TestCreateSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_by']
 
 
+class OptionImportSerializer(serializers.Serializer):
+    text = serializers.CharField(max_length=500)
+    is_correct = serializers.BooleanField(default=False)
+
+
+class QuestionImportSerializer(serializers.Serializer):
+    text = serializers.CharField()
+    feedback = serializers.CharField(allow_blank=True, default='')
+    image = serializers.CharField(allow_blank=True, required=False)
+    options = OptionImportSerializer(many=True)
+
+    def validate_options(self, options):
+        if len(options) < 2:
+            raise serializers.ValidationError("У вопроса должно быть не меньше двух вариантов ответа.")
+        if not any(option['is_correct'] for option in options):
+            raise serializers.ValidationError("Не отмечен правильный вариант ответа.")
+        return options
+
+    def validate_image(self, image):
+        if image and image not in self.context.get('files', {}):
+            raise serializers.ValidationError(f"Файл изображения {image} не загружен.")
+        return image
+
+
+class TestImportSerializer(serializers.ModelSerializer):
+    description = serializers.CharField(allow_blank=True, default='')
+    questions = QuestionImportSerializer(many=True, allow_empty=False)
+
+    class Meta:
+        model = Test
+        fields = ['id', 'subject', 'name', 'school', 'description', 'questions']
+
+    def create(self, validated_data):
+        created_by = validated_data.pop('created_by')
+        return import_test(validated_data, created_by, self.context.get('files'))
+
+    def to_representation(self, instance):
+        return {
+            'id': instance.id,
+            'name': instance.name,
+            'questions_count': len(self.validated_data['questions']),
+            'options_count': sum(len(question['options']) for question in self.validated_data['questions']),
+        }
+
+
 class TestSubmissionSerializer(serializers.Serializer):
     answers = serializers.ListField(
         child=serializers.DictField(
@@ -116,91 +214,22 @@ class TestSubmissionSerializer(serializers.Serializer):
         except Test.DoesNotExist:
             raise serializers.ValidationError(f"Тест с ID {test_id} не найден.")
 
-        question_ids = set(q.id for q in test.questions.all())
-        provided_question_ids = {answer['question_id'] for answer in answers}
+        key = get_answer_key(test)
 
-        missing_questions = question_ids - provided_question_ids
-        if missing_questions:
-            missing_question_texts = [
-                Question.objects.get(id=question_id).text for question_id in missing_questions
-            ]
+        missing_question_texts = missing_questions(key, answers)
+        if missing_question_texts:
             raise serializers.ValidationError({
                 "answers": f"Вы не ответили на следующие вопросы: {', '.join(missing_question_texts)}"
             })
-        for answer in answers:
-            if answer['question_id'] not in question_ids:
-                raise serializers.ValidationError(f"Вопрос с ID {answer['question_id']} не принадлежит тесту.")
+        errors = check_answers(key, answers)
+        if errors:
+            raise serializers.ValidationError(errors)
 
+        data['test'] = test
+        data['answer_key'] = key
         return data
 
     def create(self, validated_data):
         user = self.context['request'].user
-        test_id = self.context['test_id']
-        test = Test.objects.get(id=test_id)
-        answers_data = validated_data['answers']
-        correct_answers_count = 0
-        not_correct_answers_count = 0
-        total_questions_count = test.questions.count()
-        mistakes = []
-
-        for answer_data in answers_data:
-            question = Question.objects.get(id=answer_data['question_id'])
-            selected_option = AnswerOption.objects.get(id=answer_data['selected_option_id'])
-
-            is_correct = selected_option.is_correct
-            if is_correct:
-                correct_answers_count += 1
-            else:
-                mistakes.append(question)
-
-            if not is_correct:
-                not_correct_answers_count += 1
-
-            Answer.objects.create(
-                student=user,
-                test=test,
-                question=question,
-                selected_option=selected_option,
-                is_correct=is_correct,
-
-            )
-
-        percentage = (correct_answers_count / total_questions_count) * 100
-
-        result = Result.objects.create(
-            student=user,
-            test=test,
-            percentage=percentage,
-            correct_answers_count=correct_answers_count,
-            not_correct_answers_count=not_correct_answers_count,
-            total_questions_count=total_questions_count
-        )
-
-        test_history, created = TestHistory.objects.get_or_create(student=user)
-
-        if not test_history.full_name:
-            test_history.full_name = user.profile.name
-
-        test_history.results.add(result)
-
-        user_results = test_history.results.all()
-        average_user_percentage = sum(r.percentage for r in user_results) / user_results.count()
-        test_history.average_percentage = average_user_percentage
-        test_history.save()
-
-        school = user.profile.school
-        school_history, created = SchoolHistory.objects.get_or_create(school=school)
-
-        student_ids = set(result.student.id for result in school_history.results.all())
-        if user.id not in student_ids:
-            school_history.total_students += 1
-
-        school_history.results.add(result)
-
-        school_results = school_history.results.all()
-        average_school_percentage = sum(r.percentage for r in school_results) / school_results.count()
-        school_history.average_percentage = average_school_percentage
-        school_history.save()
-
-        result.mistakes.set(mistakes)
-        return result
+        return grade_submission(user, validated_data['test'], validated_data['answer_key'], validated_data['answers'],
+                                self.context.get('profile'))
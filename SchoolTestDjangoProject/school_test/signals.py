@@ -0,0 +1,66 @@
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .events import invalidate_event_feed
+from .grading import invalidate_answer_key
+from .models import Test, Question, AnswerOption, Recommendation, Event, backfill_question_counters
+from .recommendations import invalidate_recommendation_index
+
+
+def touch_test(test_id):
+    """Увеличивает версию содержимого теста: закэшированные ключ ответов и ответы API становятся неактуальными."""
+    version = Test.objects.filter(pk=test_id).values_list('content_version', flat=True).first()
+    if version is None:
+        return
+    Test.objects.filter(pk=test_id).update(
+        content_version=F('content_version') + 1, content_updated_at=timezone.now()
+    )
+    invalidate_answer_key(test_id, version)
+
+
+def touch_test_media(test_id):
+    """
+    Копии изображений теста обновились: меняются только ETag и кэш ответа GET /tests/<id>/,
+    ключ ответов и другие данные, зависящие от content_version, остаются в кэше.
+    """
+    Test.objects.filter(pk=test_id).update(media_version=F('media_version') + 1, content_updated_at=timezone.now())
+
+
+def backfill_counters_after_migrate(sender, using, **kwargs):
+    """Вместо разовой миграции данных: счётчики номеров тестов, созданных до появления question_counter."""
+    backfill_question_counters(using)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def question_changed(sender, instance, **kwargs):
+    touch_test(instance.test_id)
+
+
+@receiver([post_save, post_delete], sender=AnswerOption)
+def answer_option_changed(sender, instance, **kwargs):
+    test_id = Question.objects.filter(pk=instance.question_id).values_list('test_id', flat=True).first()
+    if test_id is not None:
+        touch_test(test_id)
+
+
+@receiver([post_save, post_delete], sender=Recommendation)
+def recommendation_changed(sender, instance, **kwargs):
+    invalidate_recommendation_index()
+
+
+@receiver(pre_save, sender=Event)
+def remember_event_feed(sender, instance, **kwargs):
+    """Школа, в которой событие было до сохранения: при переносе в другую школу сбрасываются ленты обеих."""
+    if instance._state.adding or instance.pk is None:
+        return
+    instance._previous_school_id = Event.objects.filter(pk=instance.pk).values_list('school_id', flat=True).first()
+
+
+@receiver([post_save, post_delete], sender=Event)
+def event_changed(sender, instance, **kwargs):
+    invalidate_event_feed(instance.school_id)
+    previous = getattr(instance, '_previous_school_id', None)
+    if previous is not None and previous != instance.school_id:
+        invalidate_event_feed(previous)
@@ -0,0 +1,46 @@
+"""
+Отправка SMS. Класс отправителя задаётся строкой settings.SMS_SENDER, его параметры — settings.SMS_SENDER_OPTIONS,
+поэтому шлюз провайдера подключается без изменения кода рассылки, а локально работает заглушка.
+"""
+import logging
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class SmsError(Exception):
+    pass
+
+
+class BaseSmsSender:
+    def __init__(self, **options):
+        self.options = options
+
+    def send(self, phone_number, text):
+        raise NotImplementedError
+
+    def send_many(self, messages):
+        """
+        messages — список (phone_number, text). Выдаёт по одной ошибке на сообщение в том же порядке: None для
+        отправленных. Шлюзы с пакетным API переопределяют этот метод и могут вернуть готовый список.
+        """
+        for phone_number, text in messages:
+            try:
+                self.send(phone_number, text)
+            except SmsError as e:
+                yield str(e) or 'Не удалось отправить SMS.'
+            else:
+                yield None
+
+
+class ConsoleSmsSender(BaseSmsSender):
+    """Заглушка: пишет сообщения в лог вместо отправки."""
+
+    def send(self, phone_number, text):
+        logger.info('SMS %s: %s', phone_number, text)
+
+
+def get_sms_sender():
+    return import_string(settings.SMS_SENDER)(**settings.SMS_SENDER_OPTIONS)
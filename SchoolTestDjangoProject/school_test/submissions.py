@@ -0,0 +1,105 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .events import complete_event
+from .grading import get_answer_key, check_answers, missing_questions, grade_submission
+from .models import Submission, Test
+from .workers import poll
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_submission(user, test, answers):
+    return Submission.objects.create(student_id=user.id, test=test, answers=answers)
+
+
+def claim_batch(batch_size):
+    """
+    Забирает пачку отправок из очереди. Зависшие дольше SUBMISSION_LOCK_TIMEOUT возвращаются в работу, пока
+    у них остаются попытки: отправка, на которой обработчик раз за разом падает, отмечается ошибкой.
+    Каждый захват увеличивает attempts — по нему finish() узнаёт, что отправку не забрал другой обработчик.
+    """
+    now = timezone.now()
+    stale = Q(status=Submission.PROCESSING, locked_at__lt=now - timedelta(seconds=settings.SUBMISSION_LOCK_TIMEOUT))
+    with transaction.atomic():
+        Submission.objects.filter(stale, attempts__gte=settings.SUBMISSION_MAX_ATTEMPTS).update(
+            status=Submission.FAILED, error='Обработчик не завершил проверку за отведённые попытки.',
+            locked_at=None, processed_at=now
+        )
+        ids = list(
+            Submission.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=Submission.PENDING) | stale)
+            .order_by('created_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        Submission.objects.filter(id__in=ids).update(
+            status=Submission.PROCESSING, locked_at=now, attempts=F('attempts') + 1
+        )
+    return list(Submission.objects.filter(id__in=ids).order_by('created_at'))
+
+
+class ClaimLost(Exception):
+    """Отправку, пока её проверяли, забрал другой обработчик."""
+
+
+def process_batch(submissions):
+    tests = Test.objects.in_bulk({submission.test_id for submission in submissions})
+    students = User.objects.select_related('profile').in_bulk({submission.student_id for submission in submissions})
+    keys, key_errors = {}, {}
+    for test_id, test in tests.items():
+        try:
+            keys[test_id] = get_answer_key(test)
+        except Exception as e:
+            logger.exception('Не удалось загрузить ключ ответов теста %s', test_id)
+            key_errors[test_id] = str(e)
+
+    for submission in submissions:
+        if submission.test_id in key_errors:
+            retry_later(submission, key_errors[submission.test_id])
+            continue
+        test = tests.get(submission.test_id)
+        student = students.get(submission.student_id)
+        try:
+            key = keys[test.id]
+            errors = check_answers(key, submission.answers)
+            if missing_questions(key, submission.answers):
+                errors.append('Тест изменился после отправки: даны ответы не на все вопросы.')
+            if errors:
+                finish(submission, Submission.FAILED, error=' '.join(errors))
+                continue
+            with transaction.atomic():
+                result = grade_submission(student, test, key, submission.answers)
+                if not finish(submission, Submission.DONE, result=result):
+                    raise ClaimLost
+            complete_event(result, student.profile)
+        except ClaimLost:
+            logger.warning('Отправку %s забрал другой обработчик, результат проверки отброшен', submission.id)
+        except Exception as e:
+            logger.exception('Не удалось проверить отправку %s', submission.id)
+            retry_later(submission, str(e))
+
+
+def retry_later(submission, error):
+    """Возвращает отправку в очередь, пока у неё остаются попытки (их счётчик растёт при захвате), иначе — ошибка."""
+    retry = submission.attempts < settings.SUBMISSION_MAX_ATTEMPTS
+    finish(submission, Submission.PENDING if retry else Submission.FAILED, error=error)
+
+
+def finish(submission, status, result=None, error=''):
+    """Записывает итог, только если отправка всё ещё за этим захватом; возвращает, записан ли он."""
+    processed_at = timezone.now() if status in (Submission.DONE, Submission.FAILED) else None
+    return Submission.objects.filter(
+        pk=submission.pk, status=Submission.PROCESSING, attempts=submission.attempts
+    ).update(status=status, result=result, error=error, locked_at=None, processed_at=processed_at) == 1
+
+
+def run_worker(batch_size=None, poll_interval=None, once=False):
+    batch_size = batch_size or settings.SUBMISSION_BATCH_SIZE
+    poll_interval = poll_interval or settings.SUBMISSION_POLL_INTERVAL
+    poll(lambda: claim_batch(batch_size), process_batch, poll_interval, once)
@@ -1,3 +1,955 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db.models import Count, F, Sum
+from django.test import AsyncClient, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from SchoolTestDjangoProject.query_budget import QueryBudgetTestMixin, missing_budgets
+
+from register.authentication import revoke_tokens
+from register.models import Profile, School
+from register.tokens import issue_access_token
+from . import images, urls
+from .answer_storage import StoredSheet, mistake_ids
+from .archive import ArchivedEntry, school_year, write_archive
+from .deliveries import process_recommendation, run_worker as run_recommendation_worker
+from .export import aiter_chunks
+from .grading import get_answer_key, local_answer_keys
+from .item_analysis import analyze_test
+from .models import Answer, AnswerOption, AnswerSheet, Event, Question, Recommendation, RecommendationDelivery, \
+    Result, ResultRollup, SchoolHistory, Subject, Submission, Test, TestHistory, allocate_question_numbers, \
+    backfill_question_counters
+from .recommendations import IntervalIndex, recommendations_for_students
+from .rollups import rebuild_rollups
+from .sms import BaseSmsSender, SmsError
+from .submissions import claim_batch, process_batch, run_worker as run_submission_worker
+
+
+class SchoolTestCase(TestCase):
+    """Школа, предмет, администратор школы и трое учеников 9 класса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.school = School.objects.create(name='Школа 1', city='Бишкек')
+        cls.subject = Subject.objects.create(name='Математика')
+        cls.admin = cls.create_user('admin', role='school_admin')
+        cls.students = [cls.create_user(f'student{index}') for index in range(3)]
+
+    def setUp(self):
+        cache.clear()
+        local_answer_keys.clear()
+
+    @classmethod
+    def create_user(cls, username, role='student', class_number='9', school=None):
+        user = User.objects.create(username=username)
+        Profile.objects.create(user=user, name=username, phone_number=f'+996700{User.objects.count():06d}',
+                               school=school or cls.school, class_number=class_number, role=role)
+        return user
+
+    @classmethod
+    def create_test(cls, questions=3, options=4, school=None):
+        test = Test.objects.create(name='Тест', subject=cls.subject, description='', school=school or cls.school,
+                                   created_by=cls.admin)
+        for index in range(questions):
+            question = Question.objects.create(test=test, text=f'Вопрос {index + 1}', feedback='')
+            AnswerOption.objects.bulk_create([
+                AnswerOption(question=question, text=f'Вариант {option}', is_correct=option == 0)
+                for option in range(options)
+            ])
+        return Test.objects.get(pk=test.pk)
+
+    @staticmethod
+    def answers(test, wrong=0):
+        """Лист ответов: первые wrong вопросов — неверный вариант, остальные — верный."""
+        answers = []
+        for index, question in enumerate(test.questions.order_by('number')):
+            options = list(question.options.order_by('id'))
+            answers.append({'question_id': question.id,
+                            'selected_option_id': (options[1] if index < wrong else options[0]).id})
+        return answers
+
+    @staticmethod
+    def client_for(user=None):
+        client = APIClient()
+        if user is not None:
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {issue_access_token(user)}')
+        return client
+
+    def use_temporary_archive(self):
+        archive_root = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_root.cleanup)
+        settings_override = override_settings(ANSWER_ARCHIVE_ROOT=archive_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def submit(self, user, test, wrong=0, answers=None):
+        return self.client_for(user).post(reverse('tests_submit', kwargs={'pk': test.pk}),
+                                          {'answers': answers or self.answers(test, wrong)}, format='json')
+
+
+class GradingTests(SchoolTestCase):
+    def test_submission_is_graded_in_bulk(self):
+        test = self.create_test(questions=4)
+        response = self.submit(self.students[0], test, wrong=1)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['percentage'], 75)
+        self.assertEqual([mistake['question_text'] for mistake in response.data['mistakes']], ['Вопрос 1'])
+        result = Result.objects.get()
+        self.assertEqual((result.correct_answers_count, result.not_correct_answers_count,
+                          result.total_questions_count), (3, 1, 4))
+
+    def test_foreign_option_is_rejected(self):
+        test, other = self.create_test(), self.create_test()
+        answers = self.answers(test)
+        answers[0]['selected_option_id'] = other.questions.first().options.first().id
+
+        response = self.submit(self.students[0], test, answers=answers)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Result.objects.exists())
+
+    def test_missing_answers_are_rejected(self):
+        test = self.create_test()
+        response = self.submit(self.students[0], test, answers=self.answers(test)[:-1])
+        self.assertEqual(response.status_code, 400)
+
+
+class HistoryAggregateTests(SchoolTestCase):
+    def test_running_aggregates_match_stored_percentages(self):
+        test = self.create_test(questions=3)
+        self.submit(self.students[0], test, wrong=1)
+        self.submit(self.students[0], test, wrong=0)
+        self.submit(self.students[1], test, wrong=3)
+
+        history = TestHistory.objects.get(student=self.students[0])
+        self.assertEqual(history.results_count, 2)
+        self.assertEqual(history.percentage_sum, Decimal('166.67'))
+        self.assertAlmostEqual(history.average_percentage, 83.335)
+
+        school_history = SchoolHistory.objects.get(school=self.school)
+        self.assertEqual((school_history.total_students, school_history.results_count), (2, 3))
+        self.assertEqual(school_history.percentage_sum, sum(Result.objects.values_list('percentage', flat=True)))
+
+
+class SubmissionQueueTests(SchoolTestCase):
+    def enqueue(self, test, **fields):
+        return Submission.objects.create(student=self.students[0], test=test, answers=self.answers(test), **fields)
+
+    @override_settings(SUBMISSIONS_ASYNC=True)
+    def test_queued_submission_is_graded_by_worker(self):
+        test = self.create_test()
+        response = self.submit(self.students[0], test, wrong=1)
+        self.assertEqual(response.status_code, 202)
+        self.assertFalse(Result.objects.exists())
+
+        run_submission_worker(once=True)
+
+        submission = Submission.objects.get(pk=response.data['submission_id'])
+        self.assertEqual((submission.status, submission.attempts), (Submission.DONE, 1))
+        self.assertEqual(submission.result.correct_answers_count, 2)
+
+    @override_settings(SUBMISSION_MAX_ATTEMPTS=2)
+    def test_stale_claim_is_retried_until_attempts_run_out(self):
+        test = self.create_test()
+        stale = timezone.now() - timedelta(seconds=settings.SUBMISSION_LOCK_TIMEOUT + 1)
+        retried = self.enqueue(test, status=Submission.PROCESSING, locked_at=stale, attempts=1)
+        exhausted = self.enqueue(test, status=Submission.PROCESSING, locked_at=stale, attempts=2)
+
+        self.assertEqual([submission.pk for submission in claim_batch(10)], [retried.pk])
+
+        retried.refresh_from_db()
+        exhausted.refresh_from_db()
+        self.assertEqual((retried.status, retried.attempts), (Submission.PROCESSING, 2))
+        self.assertEqual(exhausted.status, Submission.FAILED)
+
+    @override_settings(SUBMISSION_MAX_ATTEMPTS=2)
+    def test_broken_answer_key_fails_only_its_test(self):
+        broken, working = self.create_test(), self.create_test()
+        self.enqueue(broken)
+        self.enqueue(working)
+
+        def answer_key(test):
+            if test.pk == broken.pk:
+                raise RuntimeError('Ключ ответов недоступен')
+            return get_answer_key(test)
+
+        with mock.patch('school_test.submissions.get_answer_key', side_effect=answer_key), \
+                self.assertLogs('school_test.submissions', 'ERROR'):
+            process_batch(claim_batch(10))
+            statuses = dict(Submission.objects.values_list('test_id', 'status'))
+            self.assertEqual(statuses, {broken.pk: Submission.PENDING, working.pk: Submission.DONE})
+
+            process_batch(claim_batch(10))
+        submission = Submission.objects.get(test=broken)
+        self.assertEqual((submission.status, submission.attempts, submission.error),
+                         (Submission.FAILED, 2, 'Ключ ответов недоступен'))
+
+    def test_result_is_dropped_when_claim_was_taken_over(self):
+        test = self.create_test()
+        self.enqueue(test)
+        claimed = claim_batch(10)
+        Submission.objects.update(attempts=F('attempts') + 1)
+
+        with self.assertLogs('school_test.submissions', 'WARNING'):
+            process_batch(claimed)
+
+        self.assertFalse(Result.objects.exists())
+        self.assertEqual(Submission.objects.get().status, Submission.PROCESSING)
+
+
+class AnswerKeyCacheTests(SchoolTestCase):
+    def test_key_is_cached_until_test_content_changes(self):
+        test = self.create_test()
+        key = get_answer_key(test)
+        with self.assertNumQueries(0):
+            self.assertIs(get_answer_key(test), key)
+
+        option = AnswerOption.objects.filter(question__test=test, is_correct=False).first()
+        option.is_correct = True
+        option.save()
+        test.refresh_from_db()
+
+        self.assertGreater(test.content_version, key.version)
+        self.assertIn(option.id, get_answer_key(test).correct_options)
+
+
+class TestCatalogueCacheTests(SchoolTestCase):
+    def test_detail_is_revalidated_with_etag(self):
+        test = self.create_test()
+        url = reverse('tests_id', kwargs={'pk': test.pk})
+        etag = self.client_for().get(url)['ETag']
+
+        self.assertEqual(self.client_for().get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        Question.objects.create(test=test, text='Новый вопрос', feedback='')
+        response = self.client_for().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['questions']), 4)
+
+    def test_renaming_subject_changes_catalogue_etag(self):
+        self.create_test()
+        first = self.client_for().get(reverse('tests'))
+
+        self.subject.name = 'Алгебра'
+        self.subject.save()
+        second = self.client_for().get(reverse('tests'), HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.data['results'][0]['subject_name'], 'Алгебра')
+
+    def test_catalogue_is_paginated_summary(self):
+        other = Subject.objects.create(name='Физика')
+        for _ in range(3):
+            self.create_test(questions=2)
+        Test.objects.filter(pk=self.create_test(questions=1).pk).update(subject=other)
+
+        response = self.client_for().get(reverse('tests'), {'page_size': 2, 'subject': self.subject.pk})
+
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertNotIn('questions', response.data['results'][0])
+        self.assertEqual(response.data['results'][0]['questions_count'], 2)
+
+
+class QueryBudgetTests(QueryBudgetTestMixin, SchoolTestCase):
+    """Каждый URL приложения укладывается в бюджет SQL-запросов из settings.QUERY_BUDGETS."""
+
+    def setUp(self):
+        super().setUp()
+        self.test = self.create_test(questions=5)
+        self.student = self.students[0]
+        self.submit(self.students[1], self.test, wrong=2)
+        Event.objects.create(test=self.test, school=self.school, class_number='9')
+        self.recommendation = Recommendation.objects.create(
+            school=self.school, subject=self.subject, class_number='9', min_percentage=0, max_percentage=100,
+            message='Повторите тему'
+        )
+        self.client = self.client_for(self.student)
+        self.admin_client = self.client_for(self.admin)
+
+    def test_every_url_has_a_budget(self):
+        self.assertEqual(missing_budgets(urls.urlpatterns), [])
+
+    def test_catalogue(self):
+        self.assertWithinQueryBudget('tests')
+        self.assertWithinQueryBudget('tests', data={'subject': self.subject.pk, 'school': self.school.pk})
+        self.assertWithinQueryBudget('tests_id', kwargs={'pk': self.test.pk})
+        self.assertWithinQueryBudget('subject')
+
+    def test_authoring(self):
+        created = self.assertWithinQueryBudget('tests_create', method='post', client=self.admin_client,
+                                               format='json', data={
+                                                   'subject': self.subject.pk, 'name': 'Новый',
+                                                   'school': self.school.pk, 'description': 'Описание',
+                                               })
+        self.assertEqual(created.status_code, 201)
+        document = {'subject': self.subject.pk, 'name': 'Импорт', 'school': self.school.pk, 'questions': [
+            {'text': f'Вопрос {index}', 'options': [{'text': 'Да', 'is_correct': True}, {'text': 'Нет'}]}
+            for index in range(20)
+        ]}
+        response = self.assertWithinQueryBudget('tests_import', method='post', client=self.admin_client,
+                                                data=document, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_submission(self):
+        url_kwargs = {'pk': self.test.pk}
+        first = self.assertWithinQueryBudget('tests_submit', method='post', kwargs=url_kwargs, format='json',
+                                             data={'answers': self.answers(self.test, wrong=1)})
+        self.assertEqual(first.status_code, 200)
+        self.assertWithinQueryBudget('tests_submit', method='post', kwargs=url_kwargs, format='json',
+                                     data={'answers': self.answers(self.test)})
+
+        with override_settings(SUBMISSIONS_ASYNC=True):
+            queued = self.client.post(reverse('tests_submit', kwargs=url_kwargs),
+                                      {'answers': self.answers(self.test)}, format='json')
+        self.assertWithinQueryBudget('tests_submission', kwargs={'pk': queued.data['submission_id']})
+
+    def test_analytics(self):
+        school = {'id': self.school.pk}
+        self.assertWithinQueryBudget('school_analytics', kwargs=school)
+        self.assertWithinQueryBudget('school_breakdown', kwargs=school)
+        self.assertWithinQueryBudget('test_item_analysis', kwargs={'pk': self.test.pk})
+        self.assertWithinQueryBudget('student_analytics', kwargs={'student_id': self.students[1].pk})
+        history = TestHistory.objects.get(student=self.students[1])
+        self.assertWithinQueryBudget('student_test_history', kwargs={'id': history.pk})
+        self.assertWithinQueryBudget('results_export', client=self.admin_client, data={'test': self.test.pk})
+        self.assertWithinQueryBudget('results_export', client=self.admin_client,
+                                     data={'test': self.test.pk, 'answers': 'true'})
+
+    def test_events_and_recommendations(self):
+        self.assertWithinQueryBudget('event_list')
+        self.assertWithinQueryBudget('student_event_list')
+        self.assertWithinQueryBudget('event_create', method='post', client=self.admin_client, format='json', data={
+            'test': self.test.pk, 'school': self.school.pk, 'class_number': '10'
+        })
+        self.assertWithinQueryBudget('recommendation_list')
+        self.assertWithinQueryBudget('recommendation_status', kwargs={'pk': self.recommendation.pk})
+        response = self.assertWithinQueryBudget('recommendation_create', method='post', client=self.admin_client,
+                                                format='json', data={
+                                                    'school': self.school.pk, 'subject': self.subject.pk,
+                                                    'class_number': '9', 'min_percentage': 0, 'max_percentage': 50,
+                                                    'message': 'Повторите тему',
+                                                })
+        self.assertEqual(response.status_code, 202)
+
+
+class DatasetGeneratorTests(TestCase):
+    def test_generated_dataset_is_consistent(self):
+        call_command('generate_dataset', schools=2, students_per_school=6, subjects=2, tests_per_school=2,
+                     questions=4, options=3, attempt_rate=1, stdout=io.StringIO())
+
+        self.assertEqual(Result.objects.count(), 2 * 6 * 2)
+        self.assertEqual(AnswerSheet.objects.count(), Result.objects.count())
+        self.assertEqual(ResultRollup.objects.aggregate(total=Sum('count'))['total'], Result.objects.count())
+        for history in TestHistory.objects.annotate(total=Sum('results__percentage'), attempts=Count('results')):
+            self.assertEqual((history.results_count, history.percentage_sum), (history.attempts, history.total))
+
+        test = Test.objects.first()
+        self.assertEqual(Question.objects.create(test=test, text='Ещё', feedback='').number, 5)
+
+
+class ResultRollupTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        self.test = self.create_test(questions=4)
+        tenth_grader = self.create_user('tenth', class_number='10')
+        for wrong, student in enumerate([*self.students, tenth_grader]):
+            self.submit(student, self.test, wrong=wrong)
+
+    @staticmethod
+    def rollups():
+        return list(ResultRollup.objects.order_by('class_number').values(
+            'school_id', 'subject_id', 'class_number', 'test_id', 'count', 'passed_count', 'percentage_sum',
+            'percentage_sum_squares', 'histogram'
+        ))
+
+    def test_incremental_rollups_match_rebuild(self):
+        incremental = self.rollups()
+        self.assertEqual([(row['class_number'], row['count'], row['passed_count']) for row in incremental],
+                         [('10', 1, 0), ('9', 3, 3)])
+        self.assertEqual(incremental[1]['histogram'], [0, 0, 0, 0, 0, 1, 0, 1, 0, 1])
+
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_rebuild_keeps_results_where_they_were_recorded(self):
+        incremental = self.rollups()
+        profile = self.students[0].profile
+        profile.class_number = '10'
+        profile.school = School.objects.create(name='Школа 2', city='Ош')
+        profile.save()
+
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+        self.submit(self.students[0], self.test)
+        self.assertTrue(ResultRollup.objects.filter(school=profile.school, class_number='10').exists())
+
+    def test_rebuild_fills_snapshots_of_legacy_results(self):
+        incremental = self.rollups()
+        Result.objects.update(school=None, class_number='')
+
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), incremental)
+        self.assertFalse(Result.objects.filter(school=None).exists())
+
+
+class SchoolAnalyticsTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        test = self.create_test(questions=4)
+        tenth_grader = self.create_user('tenth', class_number='10')
+        for wrong, student in enumerate([*self.students, tenth_grader]):
+            self.submit(student, test, wrong=wrong)
+
+    def test_school_analytics_is_aggregated_from_rollups(self):
+        data = self.client_for(self.admin).get(reverse('school_analytics', kwargs={'id': self.school.pk})).data
+
+        self.assertEqual((data['registered_students'], data['total_students'], data['results_count']), (4, 4, 4))
+        self.assertEqual(data['average_percentage'], 62.5)
+        self.assertEqual([(row['subject_name'], row['average_percentage'], row['pass_rate'])
+                          for row in data['subjects']], [('Математика', 62.5, 75.0)])
+        self.assertEqual([(row['class_number'], row['average_percentage'], row['pass_rate'])
+                          for row in data['classes']], [('10', 25.0, 0.0), ('9', 75.0, 100.0)])
+        self.assertEqual([row['results_count'] for row in data['trend']], [4])
+
+    def test_trend_counts_recent_results_recorded_in_the_school(self):
+        Result.objects.filter(student=self.students[1]).update(date_taken=timezone.now() - timedelta(weeks=60))
+        profile = self.students[0].profile
+        profile.school = School.objects.create(name='Школа 2', city='Ош')
+        profile.save()
+
+        data = self.client_for(self.admin).get(reverse('school_analytics', kwargs={'id': self.school.pk})).data
+        self.assertEqual(sum(row['results_count'] for row in data['trend']), 3)
+
+
+class ItemAnalysisTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_archive()
+        self.test = self.create_test()
+
+    def archive_attempt(self, student, correct, date_taken):
+        """Попытка прошлого учебного года, перенесённая в архив: верные ответы или все неверные."""
+        result = Result.objects.create(student=student, test=self.test, percentage=100 if correct else 0,
+                                       archived=True, total_questions_count=3,
+                                       correct_answers_count=3 if correct else 0,
+                                       not_correct_answers_count=0 if correct else 3)
+        Result.objects.filter(pk=result.pk).update(date_taken=date_taken)
+        questions = list(self.test.questions.order_by('number').prefetch_related('options'))
+        options = [sorted(question.options.all(), key=lambda option: option.id)[0 if correct else 1]
+                   for question in questions]
+        write_archive(self.school.pk, school_year(date_taken), [ArchivedEntry(
+            result.id, student.id, self.test.id, [question.id for question in questions],
+            [option.id for option in options], [correct] * 3, [] if correct else [question.id for question in questions]
+        )])
+
+    def test_latest_attempt_wins_across_storages(self):
+        self.archive_attempt(self.students[0], correct=False, date_taken=timezone.now() - timedelta(days=800))
+        self.submit(self.students[0], self.test)
+        self.submit(self.students[1], self.test)
+        self.archive_attempt(self.students[2], correct=True, date_taken=timezone.now() - timedelta(days=800))
+
+        analysis = analyze_test(self.test)
+
+        self.assertEqual(analysis['students'], 3)
+        self.assertEqual([question['difficulty'] for question in analysis['questions']], [1.0, 1.0, 1.0])
+
+    def test_newer_archive_attempt_overrides_older_rows(self):
+        old = timezone.now() - timedelta(days=1200)
+        questions = list(self.test.questions.order_by('number'))
+        Answer.objects.bulk_create([
+            Answer(student=self.students[0], test=self.test, question=question, created_at=old, is_correct=True,
+                   selected_option=question.options.order_by('id').first())
+            for question in questions
+        ])
+        self.archive_attempt(self.students[0], correct=False, date_taken=timezone.now() - timedelta(days=800))
+
+        analysis = analyze_test(self.test)
+
+        self.assertEqual(analysis['students'], 1)
+        self.assertEqual([question['difficulty'] for question in analysis['questions']], [0.0, 0.0, 0.0])
+
+
+class RecordingSmsSender(BaseSmsSender):
+    """Отклоняет номера из rejected через SmsError, а на номере crash_on падает, как упал бы сам шлюз."""
+
+    def __init__(self, rejected=(), crash_on=None):
+        super().__init__()
+        self.rejected = set(rejected)
+        self.crash_on = crash_on
+        self.sent = []
+
+    def send(self, phone_number, text):
+        if phone_number == self.crash_on:
+            raise RuntimeError('Шлюз недоступен')
+        if phone_number in self.rejected:
+            raise SmsError('Номер не обслуживается')
+        self.sent.append(phone_number)
+
+
+class RecommendationDeliveryTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        test = self.create_test()
+        for student in self.students:
+            self.submit(student, test, wrong=2)
+        self.phones = [student.profile.phone_number for student in self.students]
+        self.data = {'school': self.school.pk, 'subject': self.subject.pk, 'class_number': '9',
+                     'min_percentage': 0, 'max_percentage': 50, 'message': 'Повторите дроби'}
+
+    def create(self, client, **data):
+        return client.post(reverse('recommendation_create'), {**self.data, **data}, format='json')
+
+    def test_only_admins_can_queue_recommendations(self):
+        self.assertEqual(self.create(self.client_for()).status_code, 401)
+        self.assertEqual(self.create(self.client_for(self.students[0])).status_code, 403)
+        other_school = School.objects.create(name='Школа 2', city='Ош')
+        self.assertEqual(self.create(self.client_for(self.admin), school=other_school.pk).status_code, 403)
+        self.assertFalse(Recommendation.objects.exists())
+
+    def test_status_is_visible_to_admins_of_the_school(self):
+        own = Recommendation.objects.create(**{**self.data, 'school': self.school, 'subject': self.subject})
+        other_school = School.objects.create(name='Школа 2', city='Ош')
+        other = Recommendation.objects.create(**{**self.data, 'school': other_school, 'subject': self.subject})
+
+        def status_code(user, recommendation):
+            url = reverse('recommendation_status', kwargs={'pk': recommendation.pk})
+            return self.client_for(user).get(url).status_code
+
+        self.assertEqual(status_code(self.students[0], own), 403)
+        self.assertEqual(status_code(self.admin, own), 200)
+        self.assertEqual(status_code(self.admin, other), 404)
+        self.assertEqual(status_code(self.create_user('root', role='super_admin', school=other_school), own), 200)
+
+    def test_invalid_range_is_rejected(self):
+        admin = self.client_for(self.admin)
+        self.assertEqual(self.create(admin, min_percentage=60).status_code, 400)
+        self.assertEqual(self.create(admin, max_percentage='много').status_code, 400)
+        self.assertEqual(self.create(admin, max_percentage=None).status_code, 400)
+        self.assertFalse(Recommendation.objects.exists())
+
+    def test_worker_sends_each_recipient_once(self):
+        response = self.create(self.client_for(self.admin))
+        self.assertEqual(response.status_code, 202)
+        sender = RecordingSmsSender(rejected=[self.phones[1]])
+
+        with mock.patch('school_test.deliveries.get_sms_sender', return_value=sender):
+            run_recommendation_worker(once=True)
+
+        recommendation = Recommendation.objects.get(pk=response.data['recommendation_id'])
+        self.assertEqual(recommendation.status, Recommendation.DONE)
+        self.assertEqual((recommendation.total_students, recommendation.sent_count, recommendation.failed_count),
+                         (3, 2, 1))
+        self.assertEqual(sorted(sender.sent), [self.phones[0], self.phones[2]])
+        failed = RecommendationDelivery.objects.get(status=RecommendationDelivery.FAILED)
+        self.assertEqual((failed.phone_number, failed.error), (self.phones[1], 'Номер не обслуживается'))
+
+    def test_sender_crash_keeps_sent_results(self):
+        recommendation = Recommendation.objects.create(**{
+            **self.data, 'school': self.school, 'subject': self.subject
+        })
+        sender = RecordingSmsSender(crash_on=self.phones[2])
+
+        with self.assertLogs('school_test.deliveries', 'ERROR'):
+            process_recommendation(recommendation, batch_size=10, sender=sender)
+
+        recommendation.refresh_from_db()
+        self.assertEqual((recommendation.status, recommendation.sent_count), (Recommendation.FAILED, 2))
+        statuses = dict(RecommendationDelivery.objects.values_list('phone_number', 'status'))
+        self.assertEqual([statuses[phone] for phone in self.phones],
+                         [RecommendationDelivery.SENT, RecommendationDelivery.SENT, RecommendationDelivery.PENDING])
+
+
+class RecommendationIndexTests(SchoolTestCase):
+    def recommend(self, low, high, **data):
+        return Recommendation.objects.create(**{
+            'school': self.school, 'subject': self.subject, 'class_number': '9',
+            'min_percentage': low, 'max_percentage': high, 'message': f'{low}-{high}', **data
+        })
+
+    def test_interval_bounds_are_inclusive(self):
+        index = IntervalIndex([(0, 50, 'low'), (50, 80, 'middle'), (70, 100, 'high'), (90, 10, 'empty')])
+
+        self.assertEqual(index.stab(-1), [])
+        self.assertEqual(index.stab(50), ['low', 'middle'])
+        self.assertEqual(index.stab(75), ['middle', 'high'])
+        self.assertEqual(index.stab(100), ['high'])
+
+    def test_students_are_matched_by_subject_average_and_class(self):
+        test = self.create_test(questions=4)
+        for wrong, student in enumerate(self.students):
+            self.submit(student, test, wrong=wrong)
+        low, high = self.recommend(0, 60), self.recommend(60, 100)
+        self.recommend(0, 100, class_number='10')
+
+        matched = recommendations_for_students(student.profile for student in self.students)
+        self.assertEqual([matched[student.pk] for student in self.students], [[high], [high], [low]])
+
+        added = self.recommend(75, 75)
+        matched = recommendations_for_students([self.students[1].profile])
+        self.assertEqual(matched[self.students[1].pk], [high, added])
+
+
+class EventFeedCacheTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        self.test = self.create_test()
+        self.event = Event.objects.create(test=self.test, school=self.school, class_number='9')
+
+    def feed(self, user):
+        return self.client_for(user).get(reverse('student_event_list')).json()
+
+    def test_moving_event_refreshes_both_feeds(self):
+        tenth_grader = self.create_user('tenth', class_number='10')
+        self.assertEqual(len(self.feed(self.students[0])), 1)
+        self.assertEqual(self.feed(tenth_grader), [])
+
+        self.event.class_number = '10'
+        self.event.save()
+
+        self.assertEqual(self.feed(self.students[0]), [])
+        self.assertEqual(len(self.feed(tenth_grader)), 1)
+
+    def test_feed_changed_in_another_process_is_not_served(self):
+        self.assertEqual(len(self.feed(self.students[0])), 1)
+        test = self.create_test()
+
+        # Запись в другом процессе не трогает кэш этого процесса: видна только новая версия ленты в БД.
+        with mock.patch.object(cache, 'delete'), mock.patch.object(cache, 'set'), \
+                mock.patch.object(cache, 'delete_many'):
+            Event.objects.create(test=test, school=self.school, class_number='9')
+            self.event.delete()
+
+        self.assertEqual([event['test'] for event in self.feed(self.students[0])], [test.pk])
+
+    def test_submission_marks_event_completed(self):
+        self.assertFalse(self.feed(self.students[0])[0]['is_completed'])
+        self.submit(self.students[0], self.test)
+        self.assertTrue(self.feed(self.students[0])[0]['is_completed'])
+
+
+class QuestionNumberingTests(SchoolTestCase):
+    def test_allocations_do_not_overlap(self):
+        test = self.create_test(questions=2)
+        self.assertEqual(list(allocate_question_numbers(test.pk, 3)), [3, 4, 5])
+        self.assertEqual(Question.objects.create(test=test, text='Ещё', feedback='').number, 6)
+
+    def test_explicit_numbers_keep_counter_ahead(self):
+        test = self.create_test(questions=0)
+        Question.objects.create(test=test, number=10, text='Десятый', feedback='')
+        self.assertEqual(Question.objects.create(test=test, text='Следующий', feedback='').number, 11)
+
+    def test_backfill_raises_legacy_counters(self):
+        test = self.create_test(questions=0)
+        Question.objects.bulk_create([Question(test=test, number=number, text='', feedback='') for number in (1, 7)])
+
+        self.assertEqual(backfill_question_counters(), 1)
+        self.assertEqual(backfill_question_counters(), 0)
+        self.assertEqual(list(allocate_question_numbers(test.pk)), [8])
+
+
+class TestImportTests(SchoolTestCase):
+    def import_test(self, data, format='multipart'):
+        return self.client_for(self.admin).post(reverse('tests_import'), data, format=format)
+
+    def test_csv_document_creates_numbered_questions(self):
+        document = '\n'.join([
+            'Вопрос;Пояснение;Вариант 1;Вариант 2;Вариант 3;Правильный',
+            '2 + 2;Сложение;3;4;5;Б',
+            'Простые числа;;2;4;7;1, 3',
+            '',
+        ])
+        response = self.import_test({
+            'file': SimpleUploadedFile('test.csv', document.encode()),
+            'name': 'Арифметика', 'subject': self.subject.pk, 'school': self.school.pk,
+        })
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['questions_count'], response.data['options_count']), (2, 6))
+        test = Test.objects.get(pk=response.data['id'])
+        self.assertEqual(test.created_by, self.admin)
+        self.assertEqual([(question.number, question.text, question.feedback, correct)
+                          for question in test.questions.order_by('number')
+                          for correct in [list(question.options.filter(is_correct=True)
+                                               .order_by('id').values_list('text', flat=True))]],
+                         [(1, '2 + 2', 'Сложение', ['4']), (2, 'Простые числа', '', ['2', '7'])])
+
+    def test_invalid_documents_create_nothing(self):
+        document = {'name': 'Тест', 'subject': self.subject.pk, 'school': self.school.pk, 'questions': [
+            {'text': 'Вопрос 1', 'options': [{'text': 'Да', 'is_correct': True}, {'text': 'Нет'}]},
+            {'text': 'Вопрос 2', 'options': [{'text': 'Да'}, {'text': 'Нет'}]},
+        ]}
+        response = self.import_test(document, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['questions'][1]['options'], ['Не отмечен правильный вариант ответа.'])
+
+        response = self.import_test({'file': SimpleUploadedFile('test.csv', 'text,option_1,correct\nВопрос,Да,Г\n'
+                                                                 .encode())})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Строка 2', response.data['error'])
+        self.assertFalse(Test.objects.exists())
+
+
+class QuestionImageVariantTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, QUESTION_IMAGE_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    @staticmethod
+    def image(width, height, name='scan.png'):
+        file = io.BytesIO()
+        Image.new('RGBA', (width, height), (200, 10, 10, 128)).save(file, 'PNG')
+        return SimpleUploadedFile(name, file.getvalue(), 'image/png')
+
+    def set_image(self, question, image):
+        question.image = image
+        with self.captureOnCommitCallbacks(execute=True):
+            question.save()
+
+    def test_variants_follow_the_question_image(self):
+        test = self.create_test(questions=1)
+        question = test.questions.get()
+
+        self.set_image(question, self.image(2000, 1500))
+        self.assertEqual(sorted(question.image_variants.values_list('width', 'height', 'format')), [
+            (320, 240, 'jpeg'), (320, 240, 'webp'), (640, 480, 'jpeg'), (640, 480, 'webp'),
+            (1280, 960, 'jpeg'), (1280, 960, 'webp'),
+        ])
+        self.assertGreater(Test.objects.get(pk=test.pk).content_version, test.content_version)
+        detail = self.client_for().get(reverse('tests_id', kwargs={'pk': test.pk})).json()
+        self.assertEqual(len(detail['questions'][0]['image_variants']), 6)
+
+        old_files = list(question.image_variants.values_list('file', flat=True))
+        self.set_image(question, self.image(500, 400, 'small.png'))
+        self.assertEqual(sorted(set(question.image_variants.values_list('width', 'source'))),
+                         [(320, question.image.name), (500, question.image.name)])
+        self.assertFalse(any(default_storage.exists(name) for name in old_files))
+
+        self.set_image(question, None)
+        self.assertFalse(question.image_variants.exists())
+
+    def test_variants_refresh_detail_but_keep_answer_key(self):
+        test = self.create_test(questions=1)
+        question = test.questions.get()
+        with mock.patch('school_test.images.schedule_variants'):
+            self.set_image(question, self.image(800, 600))
+        url = reverse('tests_id', kwargs={'pk': test.pk})
+        etag = self.client_for().get(url)['ETag']
+        key = get_answer_key(Test.objects.get(pk=test.pk))
+
+        images.generate_variants(question.id)
+
+        self.assertIs(get_answer_key(Test.objects.get(pk=test.pk)), key)
+        response = self.client_for().get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['questions'][0]['image_variants']), 6)
+
+    @skipUnless(hasattr(os, 'fork'), 'нужен fork')
+    def test_forked_process_does_not_inherit_the_pool(self):
+        with mock.patch('school_test.images._process_pool', object()):
+            pid = os.fork()
+            if pid == 0:
+                os._exit(0 if images._process_pool is None else 1)
+            _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+
+
+class AnswerPackingTests(SchoolTestCase):
+    def history(self, student):
+        history = TestHistory.objects.get(student=student)
+        response = self.client_for(student).get(reverse('student_test_history', kwargs={'id': history.pk}))
+        return next(item for item in response.data if item['id'] == history.pk)['results_details']
+
+    def test_packed_sheet_replaces_answer_rows(self):
+        test = self.create_test()
+        self.submit(self.students[0], test, wrong=1)
+
+        self.assertFalse(Answer.objects.exists())
+        sheet = AnswerSheet.objects.get()
+        self.assertEqual(len(StoredSheet.from_packed(sheet.questions, sheet.options, sheet.mistakes).mistake_ids), 1)
+
+    def test_sheet_is_dated_with_its_attempt(self):
+        test = self.create_test()
+        self.submit(self.students[0], test)
+        with override_settings(ANSWER_STORAGE='rows'):
+            self.submit(self.students[1], test)
+        Result.objects.filter(student=self.students[1]).update(date_taken=timezone.now() - timedelta(days=400))
+
+        call_command('pack_answers', stdout=io.StringIO())
+
+        for sheet in AnswerSheet.objects.select_related('result'):
+            self.assertEqual(sheet.created_at, sheet.result.date_taken)
+
+    def test_pack_answers_keeps_api_output(self):
+        test = self.create_test()
+        with override_settings(ANSWER_STORAGE='rows'):
+            self.submit(self.students[0], test, wrong=2)
+        self.assertEqual(Answer.objects.count(), 3)
+        before = self.history(self.students[0])
+
+        call_command('pack_answers', '--delete', stdout=io.StringIO())
+
+        self.assertFalse(Answer.objects.exists())
+        self.assertEqual(AnswerSheet.objects.count(), 1)
+        self.assertEqual(self.history(self.students[0]), before)
+        self.assertEqual(len(before[0]['mistakes']), 2)
+        self.assertNotIn('archived', before[0])
+
+
+class ResultExportTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        self.test = self.create_test()
+        for wrong, student in enumerate(self.students):
+            self.submit(student, self.test, wrong=wrong)
+        self.token = issue_access_token(self.admin)
+
+    def rows(self, content):
+        return list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+
+    def test_csv_streams_results(self):
+        response = self.client_for(self.admin).get(reverse('results_export'), {'test': self.test.pk})
+
+        self.assertTrue(response.streaming)
+        rows = self.rows(b''.join(response.streaming_content))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual([row[8] for row in rows[1:]], ['100.00', '66.67', '33.33'])
+
+    def test_streamed_queries_count_against_the_budget(self):
+        with override_settings(QUERY_BUDGETS={**settings.QUERY_BUDGETS, 'results_export': 1}):
+            with self.assertNoLogs('query_budget'):
+                response = self.client_for(self.admin).get(reverse('results_export'), {'test': self.test.pk})
+            with self.assertLogs('query_budget', 'WARNING') as logs:
+                b''.join(response.streaming_content)
+
+        self.assertIn('(results_export, бюджет 1)', logs.output[0])
+
+    async def test_asgi_streams_csv_asynchronously(self):
+        response = await AsyncClient().get(reverse('results_export'), {'test': self.test.pk, 'answers': 'true'},
+                                           headers={'Authorization': f'Bearer {self.token}'})
+
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(self.rows(content)), 1 + 9)
+
+    async def test_async_chunks_are_pulled_one_by_one(self):
+        pulled = []
+
+        def chunks():
+            for index in range(3):
+                pulled.append(index)
+                yield str(index)
+
+        stream = aiter_chunks(chunks())
+        self.assertEqual(await anext(stream), '0')
+        self.assertEqual(pulled, [0])
+        self.assertEqual([chunk async for chunk in stream], ['1', '2'])
+
+
+class AnswerArchiveTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        self.use_temporary_archive()
+        self.test = self.create_test()
+        self.last_year = timezone.now() - timedelta(days=400)
+
+    def archive(self):
+        output = io.StringIO()
+        call_command('archive_answers', stdout=output)
+        return output.getvalue()
+
+    def test_archived_answers_read_back(self):
+        self.submit(self.students[0], self.test, wrong=2)
+        result = Result.objects.get()
+        mistakes = mistake_ids(result)
+        Result.objects.update(date_taken=self.last_year)
+
+        self.archive()
+
+        result = Result.objects.select_related('test').get()
+        self.assertTrue(result.archived)
+        self.assertFalse(AnswerSheet.objects.exists())
+        self.assertEqual(mistake_ids(result), mistakes)
+        self.assertEqual(len(mistakes), 2)
+        self.assertEqual(analyze_test(self.test)['questions'][2]['difficulty'], 1.0)
+
+    def test_attempts_with_unlinked_answers_wait_for_pack_answers(self):
+        questions = list(self.test.questions.order_by('number'))
+        result = Result.objects.create(student=self.students[0], test=self.test, percentage=100,
+                                       total_questions_count=3, correct_answers_count=3, not_correct_answers_count=0)
+        Result.objects.update(date_taken=self.last_year)
+        Answer.objects.bulk_create([
+            Answer(student=self.students[0], test=self.test, question=question, is_correct=True,
+                   selected_option=question.options.order_by('id').first(), created_at=self.last_year)
+            for question in questions
+        ])
+
+        self.assertIn('Пропущено попыток с непривязанными ответами: 1', self.archive())
+        result.refresh_from_db()
+        self.assertFalse(result.archived)
+
+        call_command('pack_answers', '--delete', stdout=io.StringIO())
+        self.archive()
+        result.refresh_from_db()
+        self.assertTrue(result.archived)
+        self.assertFalse(Answer.objects.exists())
+        self.assertEqual(analyze_test(self.test)['students'], 1)
+
+
+class AsyncViewTests(SchoolTestCase):
+    def setUp(self):
+        super().setUp()
+        self.test = self.create_test(questions=4)
+        self.submit(self.students[0], self.test, wrong=1)
+        Recommendation.objects.create(school=self.school, subject=self.subject, class_number='9', min_percentage=70,
+                                      max_percentage=80, message='Повторите дроби')
+        self.token = issue_access_token(self.students[0])
+
+    def get(self, name, token=None, headers=None, **kwargs):
+        headers = {**(headers or {}), **({'Authorization': f'Bearer {token}'} if token else {})}
+        return AsyncClient().get(reverse(name, kwargs=kwargs), headers=headers)
+
+    async def test_student_analytics(self):
+        response = await self.get('student_analytics', self.token, student_id=self.students[0].pk)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(float(data['average_percentage']), 75)
+        self.assertEqual([recommendation['message'] for recommendation in data['recommendations']],
+                         ['Повторите дроби'])
+
+        self.assertEqual((await self.get('student_analytics', self.token, student_id=0)).status_code, 404)
+        response = await self.get('student_analytics', student_id=self.students[0].pk)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+        await sync_to_async(revoke_tokens)(self.students[0].pk)
+        response = await self.get('student_analytics', self.token, student_id=self.students[0].pk)
+        self.assertEqual(response.status_code, 401)
+
+    async def test_open_endpoints(self):
+        self.assertEqual((await self.get('subject')).json(), [{'id': self.subject.pk, 'name': 'Математика'}])
+        response = await self.get('tests_id', pk=self.test.pk)
+        self.assertEqual(len(response.json()['questions']), 4)
+        response = await self.get('tests_id', headers={'If-None-Match': response['ETag']}, pk=self.test.pk)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((await self.get('tests_id', pk=0)).status_code, 404)
@@ -2,20 +2,28 @@ from django.urls import path
 
 from .views import TestListView, TestCreateView, TestDetailView, SubmitTestView, SchoolAnalyticsView, \
     StudentAnalyticsView, SubjectListView, EventListView, EventCreateView, RecommendationCreateView, \
-    RecommendationListView, StudentTestHistoryView, StudentEventListView
+    RecommendationListView, StudentTestHistoryView, StudentEventListView, SubmissionStatusView, \
+    SchoolBreakdownView, TestItemAnalysisView, RecommendationStatusView, TestImportView, \
+    ResultExportView
 
 urlpatterns = [
     path('tests/', TestListView.as_view(), name='tests'),
     path('tests/create/', TestCreateView.as_view(), name='tests_create'),
+    path('tests/import/', TestImportView.as_view(), name='tests_import'),
     path('tests/<int:pk>/', TestDetailView.as_view(), name='tests_id'),
     path('tests/<int:pk>/submit/', SubmitTestView.as_view(), name='tests_submit'),
+    path('tests/submissions/<int:pk>/', SubmissionStatusView.as_view(), name='tests_submission'),
     path('analytics/school/<int:id>/', SchoolAnalyticsView.as_view(), name='school_analytics'),
+    path('analytics/school/<int:id>/breakdown/', SchoolBreakdownView.as_view(), name='school_breakdown'),
+    path('analytics/test/<int:pk>/items/', TestItemAnalysisView.as_view(), name='test_item_analysis'),
+    path('export/results/', ResultExportView.as_view(), name='results_export'),
     path('analytics/student/<int:student_id>/', StudentAnalyticsView.as_view(), name='student_analytics'),
-    path('student/test/history/<int:id>/', StudentTestHistoryView.as_view(), name='tests_id'),
+    path('student/test/history/<int:id>/', StudentTestHistoryView.as_view(), name='student_test_history'),
     path('subject/list/', SubjectListView.as_view(), name='subject'),
     path('event/list/', EventListView.as_view(), name='event_list'),
     path('event/create/', EventCreateView.as_view(), name='event_create'),
-    path('student/event-list/', StudentEventListView.as_view(), name='event_create'),
+    path('student/event-list/', StudentEventListView.as_view(), name='student_event_list'),
     path('recommendation/list/', RecommendationListView.as_view(), name='recommendation_list'),
     path('recommendation/create/', RecommendationCreateView.as_view(), name='recommendation_create'),
+    path('recommendation/<int:pk>/status/', RecommendationStatusView.as_view(), name='recommendation_status'),
 ]
\ No newline at end of file
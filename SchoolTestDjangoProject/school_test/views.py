@@ -1,21 +1,68 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Count, Max, Prefetch, Sum
+from django.http import Http404
 from rest_framework.exceptions import NotFound
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.generics import get_object_or_404
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.parsers import JSONParser, MultiPartParser
 
 from .serializers import TestListSerializer, TestSubmissionSerializer, TestCreateSerializer, \
     SubjectSerializer, EventSerializer, RecommendationSerializer, SchoolHistorySerializer, AnalyticSerializer, \
-    StudentHistorySerializer
+    StudentHistorySerializer, TestSummarySerializer, ResultRollupSerializer, TestImportSerializer, \
+    RecommendationCreateSerializer
+from .filters import TestFilter
 from rest_framework.permissions import IsAuthenticated
+from .analytics import cached_school_analytics
+from .authoring import AuthoringError, load_test_document
+from .async_api import AsyncAPIView, aconditional_response, json_response
+from .cache import acached_payload, cached_payload, conditional_response, make_etag
+from .answer_storage import mistake_questions
+from .events import aget_event_feed, complete_event
+from .export import export_rows, export_response
+from .item_analysis import cached_item_analysis
+from .recommendations import arecommendations_for_students
+from .submissions import enqueue_submission
 from .models import User, Test, Result, Answer
 from rest_framework import generics, status
 from rest_framework.response import Response
-from .models import Subject, Result, Recommendation, SchoolHistory, TestHistory, Event
+from .models import Subject, Result, Recommendation, SchoolHistory, TestHistory, Event, Submission, ResultRollup
+from register.authentication import aget_profile_claims, get_profile_claims
+from register.permissions import IsSchool_AdminPermission, IsSuper_AdminPermission, IsSuperUser
 from register.models import School
 
 
+class TestCatalogPagination(PageNumberPagination):
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+
+
 class TestListView(generics.ListAPIView):
-    queryset = Test.objects.all()
-    serializer_class = TestListSerializer
+    queryset = Test.objects.select_related('subject').annotate(questions_count=Count('questions')) \
+        .order_by('-created_at', '-id')
+    serializer_class = TestSummarySerializer
     permission_classes = []
+    pagination_class = TestCatalogPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = TestFilter
+
+    def list(self, request, *args, **kwargs):
+        state = self.filter_queryset(Test.objects.all()).aggregate(
+            count=Count('id'), last_id=Max('id'), versions=Sum('content_version'), updated=Max('content_updated_at'),
+            subjects_updated=Max('subject__updated_at')
+        )
+        etag = make_etag('tests', request.GET.urlencode(), *state.values())
+        cache_key = f'tests_payload:{etag}:{request.build_absolute_uri()}'
+
+        def build():
+            return cached_payload(
+                cache_key, lambda: super(TestListView, self).list(request, *args, **kwargs).data,
+                settings.TEST_PAYLOAD_CACHE_TIMEOUT
+            )
+
+        return conditional_response(request, build, etag)
 
 
 class TestCreateView(generics.CreateAPIView):
@@ -24,13 +71,68 @@ class TestCreateView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
 
     def perform_create(self, serializer):
-        serializer.save(created_by=self.request.user)
+        serializer.save(created_by_id=self.request.user.pk)
 
 
-class TestDetailView(generics.RetrieveAPIView):
-    queryset = Test.objects.all()
-    serializer_class = TestListSerializer
-    permission_classes = []
+class TestImportView(generics.CreateAPIView):
+    serializer_class = TestImportSerializer
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, MultiPartParser]
+
+    def create(self, request, *args, **kwargs):
+        document = request.data
+        upload = request.FILES.get('file')
+        if upload is not None:
+            try:
+                document = load_test_document(upload, upload.name)
+            except AuthoringError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            for field in ('name', 'subject', 'school', 'description'):
+                if field in request.data:
+                    document[field] = request.data[field]
+
+        files = {file.name: file for field, file in request.FILES.items() if field != 'file'}
+        serializer = TestImportSerializer(data=document, context={'request': request, 'files': files})
+        serializer.is_valid(raise_exception=True)
+        serializer.save(created_by=request.user)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class TestDetailView(AsyncAPIView):
+    async def get(self, request, pk):
+        test = await Test.objects.only('id', 'content_version', 'media_version', 'content_updated_at') \
+            .filter(pk=pk).afirst()
+        if test is None:
+            raise Http404
+        version = f'{test.content_version}.{test.media_version}'
+        etag = make_etag('test', test.id, version)
+        cache_key = f'test_payload:{test.id}:{version}:{request.build_absolute_uri("/")}'
+
+        async def build():
+            return await acached_payload(
+                cache_key, lambda: self.serialize(request, pk), settings.TEST_PAYLOAD_CACHE_TIMEOUT
+            )
+
+        return await aconditional_response(request, build, etag, test.content_updated_at)
+
+    async def serialize(self, request, pk):
+        test = await Test.objects.prefetch_related('questions__options', 'questions__image_variants').aget(pk=pk)
+        return TestListSerializer(test, context={'request': request}).data
+
+
+def result_payload(result):
+    return {
+        "message": "Тест успешно завершён.",
+        "test_id": result.test_id,
+        "percentage": result.percentage,
+        "mistakes": [
+            {
+                "question_id": question_id,
+                "question_text": question_text
+            }
+            for question_id, question_text in mistake_questions(result)
+        ]
+    }
 
 
 class SubmitTestView(generics.GenericAPIView):
@@ -39,62 +141,129 @@ class SubmitTestView(generics.GenericAPIView):
 
     def post(self, request, *args, **kwargs):
         test_id = kwargs.get('pk')
-        serializer = TestSubmissionSerializer(data=request.data, context={'request': request, 'test_id': test_id})
+        profile = get_profile_claims(request)
+        serializer = TestSubmissionSerializer(
+            data=request.data, context={'request': request, 'test_id': test_id, 'profile': profile}
+        )
 
         if serializer.is_valid():
-            result = serializer.save()
+            if settings.SUBMISSIONS_ASYNC:
+                submission = enqueue_submission(
+                    request.user, serializer.validated_data['test'], serializer.validated_data['answers']
+                )
+                return Response({
+                    "message": "Ответы приняты и будут проверены.",
+                    "submission_id": submission.id,
+                    "status": submission.status,
+                }, status=status.HTTP_202_ACCEPTED)
 
+            result = serializer.save()
+            complete_event(result, profile)
 
-            event = Event.objects.filter(test=result.test, school=request.user.profile.school, class_number=request.user.profile.class_number).first()
-            if event:
-                event.is_completed = True
-                event.save()
-
-            return Response({
-                "message": "Тест успешно завершён.",
-                "test_id": result.test.id,
-                "percentage": result.percentage,
-                "mistakes": [
-                    {
-                        "question_id": mistake.id,
-                        "question_text": mistake.text
-                    }
-                    for mistake in result.mistakes.all()
-                ]
-            }, status=status.HTTP_200_OK)
+            return Response(result_payload(result), status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class SubmissionStatusView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
 
-class SchoolAnalyticsView(generics.ListAPIView):
-    queryset = SchoolHistory.objects.all()
-    serializer_class = SchoolHistorySerializer
+    def get(self, request, pk):
+        submission = get_object_or_404(
+            Submission.objects.select_related('result__answer_sheet'), pk=pk, student_id=request.user.id
+        )
+        data = {
+            "submission_id": submission.id,
+            "status": submission.status,
+        }
+        if submission.status == Submission.DONE and submission.result:
+            data.update(result_payload(submission.result))
+        elif submission.status == Submission.FAILED:
+            data["error"] = submission.error
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class SchoolAnalyticsView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
 
+    def get(self, request, id):
+        school = get_object_or_404(School, pk=id)
+        return Response(cached_school_analytics(school), status=status.HTTP_200_OK)
 
-class StudentAnalyticsView(generics.RetrieveAPIView):
-    queryset = TestHistory.objects.all()
-    serializer_class = AnalyticSerializer
+
+class SchoolBreakdownView(generics.ListAPIView):
+    serializer_class = ResultRollupSerializer
     permission_classes = [IsAuthenticated]
-    lookup_field = 'student_id'
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['subject', 'class_number', 'test']
 
     def get_queryset(self):
-        student_id = self.kwargs['student_id']
-        if not User.objects.filter(id=student_id).exists():
+        return ResultRollup.objects.filter(school_id=self.kwargs['id']).select_related('subject', 'test') \
+            .order_by('subject_id', 'class_number', 'test_id')
+
+
+class TestItemAnalysisView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        test = get_object_or_404(Test.objects.only('id', 'content_version'), pk=pk)
+        return Response(cached_item_analysis(test), status=status.HTTP_200_OK)
+
+
+class ResultExportView(generics.GenericAPIView):
+    permission_classes = [IsSuperUser | IsSuper_AdminPermission | IsSchool_AdminPermission]
+
+    def get(self, request):
+        filters = {
+            'school_id': request.query_params.get('school'),
+            'test_id': request.query_params.get('test'),
+            'class_number': request.query_params.get('class_number'),
+        }
+        for field in ('school_id', 'test_id'):
+            if filters[field] is not None and not filters[field].isdigit():
+                return Response({'error': f'Некорректный параметр {field[:-3]}.'}, status=status.HTTP_400_BAD_REQUEST)
+        if not request.user.is_superuser and get_profile_claims(request).role == 'school_admin':
+            filters['school_id'] = get_profile_claims(request).school_id
+        if filters['school_id'] is None and filters['test_id'] is None:
+            return Response({'error': 'Укажите школу (school) или тест (test).'}, status=status.HTTP_400_BAD_REQUEST)
+
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in ('csv', 'xlsx'):
+            return Response({'error': 'Поддерживаются форматы csv и xlsx.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        answers = request.query_params.get('answers') in ('1', 'true')
+        header, rows = export_rows(answers=answers, **filters)
+        filename = '-'.join(
+            ['answers' if answers else 'results'] +
+            [f'{key.removesuffix("_id")}{value}' for key, value in filters.items() if value]
+        )
+        return export_response(header, rows, filename, file_format,
+                               asynchronous=isinstance(request._request, ASGIRequest))
+
+
+class StudentAnalyticsView(AsyncAPIView):
+    authentication_required = True
+
+    async def get(self, request, student_id):
+        if not await User.objects.filter(id=student_id).aexists():
             raise NotFound(detail="  not found", code=404)
-        return TestHistory.objects.filter(student_id=student_id)
+        history = await TestHistory.objects.filter(student_id=student_id).select_related('student__profile').afirst()
+        if history is None:
+            raise Http404
+        matched = await arecommendations_for_students([history.student.profile])
+        return json_response(AnalyticSerializer(history, context={'recommendations': matched}).data)
 
 
 class StudentTestHistoryView(generics.ListAPIView):
-    queryset = TestHistory.objects.all()
+    queryset = TestHistory.objects.prefetch_related(
+        Prefetch('results', Result.objects.select_related('answer_sheet', 'test').prefetch_related('mistakes'))
+    )
     serializer_class = StudentHistorySerializer
     permission_classes = [IsAuthenticated]
 
 
-class SubjectListView(generics.ListAPIView):
-    queryset = Subject.objects.all()
-    serializer_class = SubjectSerializer
-    permission_classes = []
+class SubjectListView(AsyncAPIView):
+    async def get(self, request):
+        return json_response(SubjectSerializer([subject async for subject in Subject.objects.all()], many=True).data)
 
 
 class EventListView(generics.ListAPIView):
@@ -103,17 +272,12 @@ class EventListView(generics.ListAPIView):
     permission_classes = []
 
 
-class StudentEventListView(generics.ListAPIView):
-    serializer_class = EventSerializer
-    permission_classes = [IsAuthenticated]
-
-    def get_queryset(self):
-        user_profile = self.request.user.profile
-        return Event.objects.filter(
-            school=user_profile.school,
-            class_number=user_profile.class_number
-        )
+class StudentEventListView(AsyncAPIView):
+    authentication_required = True
 
+    async def get(self, request):
+        user_profile = await aget_profile_claims(request)
+        return json_response(await aget_event_feed(user_profile.school_id, user_profile.class_number))
 
 
 class EventCreateView(generics.CreateAPIView):
@@ -122,62 +286,59 @@ class EventCreateView(generics.CreateAPIView):
     permission_classes = []
 
 
-class RecommendationCreateView(generics.CreateAPIView):
-    serializer_class = RecommendationSerializer
+def restricted_school_id(request):
+    """Школа, которой ограничен доступ администратора школы к рекомендациям; для остальных ролей — None."""
+    claims = get_profile_claims(request)
+    if claims.role != 'school_admin' or request.user.is_superuser:
+        return None
+    return claims.school_id
 
-    def post(self, request):
-        class_number = request.data.get('class_number')
-        min_percentage = request.data.get('min_percentage')
-        max_percentage = request.data.get('max_percentage')
-        message = request.data.get('message')
-        link = request.data.get('link')
-        school = request.data.get('school')
-        subject = request.data.get('subject')
-
-        try:
-
-            results = Result.objects.filter(
-                test__school=school,
-                test__subject=subject,
-                student__profile__class_number=class_number,
-                percentage__gte=min_percentage,
-                percentage__lte=max_percentage,
-            )
 
-            if not results.exists():
-                return Response({'error': 'Не найдено учеников, соответствующих критериям.'},
-                                status=status.HTTP_404_NOT_FOUND)
-            school_id = request.data.get('school')
-            school = School.objects.get(id=school_id)
-            subject_id = request.data.get('school')
-            subject = Subject.objects.get(id=subject_id)
-            recommendation = Recommendation.objects.create(
-                school=school,
-                class_number=class_number,
-                min_percentage=min_percentage,
-                max_percentage=max_percentage,
-                message=message,
-                link=link,
-                subject=subject
-            )
+class RecommendationCreateView(generics.CreateAPIView):
+    serializer_class = RecommendationCreateSerializer
+    permission_classes = [IsAuthenticated, IsSuperUser | IsSuper_AdminPermission | IsSchool_AdminPermission]
 
-            return Response(
-                {'status': 'Сообщение успешно отправлено.',
-                 'total_students': results.count()
+    def post(self, request):
+        serializer = RecommendationCreateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        school_id = restricted_school_id(request)
+        if school_id is not None and serializer.validated_data['school'].id != school_id:
+            return Response({'error': 'Рекомендации можно рассылать только ученикам своей школы.'},
+                            status=status.HTTP_403_FORBIDDEN)
+
+        recommendation = serializer.save()
+        return Response(
+            {'status': 'Рекомендация сохранена и будет разослана ученикам.',
+             'recommendation_id': recommendation.id,
+             'delivery_status': recommendation.status},
+            status=status.HTTP_202_ACCEPTED,
+        )
 
-                 },
-                status=status.HTTP_200_OK,
-            )
 
-        except School.DoesNotExist:
-            return Response({'error': 'Указанная школа не найдена.'}, status=status.HTTP_404_NOT_FOUND)
-        except Subject.DoesNotExist:
-            return Response({'error': 'Указанный предмет не найден.'}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+class RecommendationStatusView(generics.GenericAPIView):
+    permission_classes = [IsAuthenticated, IsSuperUser | IsSuper_AdminPermission | IsSchool_AdminPermission]
+
+    def get(self, request, pk):
+        recommendations = Recommendation.objects.all()
+        school_id = restricted_school_id(request)
+        if school_id is not None:
+            recommendations = recommendations.filter(school_id=school_id)
+        recommendation = get_object_or_404(recommendations, pk=pk)
+        data = {
+            'recommendation_id': recommendation.id,
+            'delivery_status': recommendation.status,
+            'total_students': recommendation.total_students,
+            'sent_count': recommendation.sent_count,
+            'failed_count': recommendation.failed_count,
+            'finished_at': recommendation.finished_at,
+        }
+        if recommendation.status == Recommendation.FAILED:
+            data['error'] = recommendation.error
+        return Response(data, status=status.HTTP_200_OK)
 
 
 class RecommendationListView(generics.ListAPIView):
-    queryset = Recommendation.objects.all()
+    queryset = Recommendation.objects.select_related('subject')
     serializer_class = RecommendationSerializer
     permission_classes = []
@@ -0,0 +1,70 @@
+"""
+Общий каркас обработчиков очередей в БД: цикл «забрать — обработать — подождать» и команда, которая запускает
+пул таких обработчиков в отдельных процессах.
+"""
+import multiprocessing
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def poll(claim, process, poll_interval, once=False):
+    """
+    claim() забирает работу из очереди и возвращает пустое значение, если её нет; process(work) её выполняет.
+    Пустая очередь — пауза poll_interval секунд, а с once=True — выход.
+    """
+    while True:
+        work = claim()
+        if work:
+            process(work)
+        elif once:
+            return
+        else:
+            time.sleep(poll_interval)
+
+
+class WorkerPoolCommand(BaseCommand):
+    """
+    Команда запуска пула обработчиков. Наследник задаёт worker — функцию с параметрами batch_size, poll_interval
+    и once — и settings_prefix: значения по умолчанию берутся из settings.<prefix>_WORKERS, _BATCH_SIZE
+    и _POLL_INTERVAL.
+    """
+    worker = None
+    settings_prefix = None
+    once_help = 'Разобрать очередь и завершиться.'
+
+    def setting(self, name):
+        return getattr(settings, f'{self.settings_prefix}_{name}')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=self.setting('WORKERS'))
+        parser.add_argument('--batch-size', type=int, default=self.setting('BATCH_SIZE'))
+        parser.add_argument('--poll-interval', type=float, default=self.setting('POLL_INTERVAL'))
+        parser.add_argument('--once', action='store_true', help=self.once_help)
+
+    def handle(self, *args, **options):
+        worker_options = {
+            'batch_size': options['batch_size'],
+            'poll_interval': options['poll_interval'],
+            'once': options['once'],
+        }
+        if options['workers'] <= 1:
+            self.worker(**worker_options)
+            return
+
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=self.worker, kwargs=worker_options, daemon=True)
+            for _ in range(options['workers'])
+        ]
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Запущено обработчиков: {len(workers)}')
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()